@@ -1,5 +1,11 @@
 import os
-import fitz  # PyMuPDF
+from pdf_extract import extract_pages  # PyMuPDF, parallel for large PDFs
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
+from incremental import TEXT_HASH_COLUMN, MODEL_COLUMN, short_hash, prompt_hash_column, load_previous, reusable
+from model_routing import route
+import evidence_gate
 import pandas as pd
 import openai
 import concurrent.futures
@@ -9,35 +15,59 @@ from functools import partial
 OPENAI_API_KEY = "your api key here"
 openai.api_key = OPENAI_API_KEY
 
+# Default model for the category questions. With MODEL_ROUTING the rules in model_routing.py may pick
+# another model per document; the model that served the row is recorded in the "Model" column.
+MODEL = "gpt-4o"
+
+# Incremental mode: reuse answers from the existing output file for every (document, question) cell
+# whose document text, question file and model are unchanged; only changed cells are sent to the model.
+INCREMENTAL = True
+MODEL_ROUTING = True
+# Evidence gate: a category whose terms (evidence_gate.LEXICON) never appear in the document is scored 0
+# without a model call, and listed in the row's "Gated" column; only categories with evidence are sent.
+EVIDENCE_GATE = True
+
 # Define categories
 CATEGORIES = ["Testing", "Privacy", "Governance", "Auth", "Global", "Labor", "Ethics", "Energy"]
 
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file."""
     text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text("text") + "\n"
+        # Large PDFs are split into page ranges and parsed across a process pool
+        text = "".join(page + "\n" for page in extract_pages(pdf_path))
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
 
-def analyze_text_with_openai(text, question):
-    """Send text to the o3-mini model with a specific question."""
+@tracing.traced("model_call", text_args=("text", "question"))
+def analyze_text_with_openai(text, question, model=MODEL, options=None):
+    """Send text to the OpenAI model (gpt-4o unless routed elsewhere) with a specific question."""
     prompt = f"{question}\n\n{text}"
     
     try:
         response = openai.ChatCompletion.create(
-            model="gpt-4o",  # o3 Mini model
+            model=model,
             messages=[
                 {"role": "system", "content": "You are an AI assistant."},
                 {"role": "user", "content": prompt}
             ],
+            **(options or {})
         )
         return response["choices"][0]["message"]["content"].strip()
     except Exception as e:
-        print(f"Error analyzing text with o3-mini: {e}")
+        print(f"Error analyzing text with {model}: {e}")
         return None
 
 def load_question(question_file):
@@ -45,8 +75,9 @@ def load_question(question_file):
     with open(question_file, "r", encoding="utf-8") as file:
         return file.read().strip()
 
-def process_pdf(pdf, documents_path, questions):
-    """Process a single PDF file with multiple questions."""
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf, documents_path, questions, previous=None, stats=None):
+    """Process a single PDF file with multiple questions, reusing unchanged answers from a previous row."""
     pdf_path = os.path.join(documents_path, pdf)
     text = extract_text_from_pdf(pdf_path)
     
@@ -54,13 +85,34 @@ def process_pdf(pdf, documents_path, questions):
         return {"PDF File": pdf, **{category: None for category in CATEGORIES}}
     
     results = {"PDF File": pdf}
+    text_digest = short_hash(text)
+    # Every category question about one document goes to the same routed model
+    model, options = route("advocacy", "openai", text, "score", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    hashes = {TEXT_HASH_COLUMN: text_digest, MODEL_COLUMN: model}
+    gated = evidence_gate.gated(text, questions) if EVIDENCE_GATE else set()
+    # A category gated last time was never answered by the model, so its previous answer is not reused
+    previously_gated = evidence_gate.gated_categories(previous)
     
     # Process each question separately, ensuring AI memory is cleared per file
     for category, question in questions.items():
-        result = analyze_text_with_openai(text, question)
+        prompt_digest = short_hash(question)
+        hashes[prompt_hash_column(category)] = prompt_digest
+        if category in gated:
+            result = evidence_gate.GATED_ANSWER
+            if stats is not None:
+                stats.append("gated")
+        elif category not in previously_gated and reusable(previous, category, prompt_digest, text_digest, model, category):
+            result = previous[category]
+            if stats is not None:
+                stats.append("reused")
+        else:
+            result = analyze_text_with_openai(text, question, model, options)
+            if stats is not None:
+                stats.append("called")
         results[category] = result
     
-    return results
+    results[evidence_gate.GATED_COLUMN] = evidence_gate.GATE_SEPARATOR.join(sorted(gated))
+    return {**results, **hashes}
 
 def main():
     documents_path = os.path.expanduser("your file location")  # Set your path
@@ -72,22 +124,43 @@ def main():
         for category in CATEGORIES
     }
     
-    pdf_files = [f for f in os.listdir(documents_path) if f.endswith(".pdf")]
+    pdf_files = select_documents(documents_path, "advocacy", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     
     # Load questions from respective files
     questions = {category: load_question(path) for category, path in question_paths.items()}
     
     results = []
+    # Previous answers by document; empty when incremental mode is off or there is no earlier output
+    previous = load_previous(output_path, "PDF File") if INCREMENTAL else {}
+    if planner.PLAN:
+        # One call per category question; documents are processed one at a time
+        calls = [planner.Call(question, "score", category, category) for category, question in questions.items()]
+        planner.print_plan("advocacy", "openai", MODEL, documents_path, pdf_files, calls, 1, MODEL_ROUTING, previous)
+        return
+    stats = []  # "called" or "reused" per (document, question) cell
     
     # Process PDFs sequentially (ensuring memory is cleared per file)
     for pdf in pdf_files:
-        result = process_pdf(pdf, documents_path, questions)
+        result = process_pdf(pdf, documents_path, questions, previous.get(pdf), stats)
         results.append(result)
     
     # Convert results to DataFrame and save
     df = pd.DataFrame(results)
-    df.to_csv(output_path, index=False)
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(documents_path, "advocacy", df.to_dict("records"), "PDF File")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_path, df, "PDF File")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_path, index=False)
     print(f"Results saved to {output_path}")
+    if INCREMENTAL:
+        print(f"Model calls: {stats.count('called')}; answers reused from the previous output: {stats.count('reused')}")
+    if EVIDENCE_GATE:
+        evidence_gate.write_audit(df, CATEGORIES, output_path)
 
 if __name__ == "__main__":
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
     main()
+    tracing.finish()
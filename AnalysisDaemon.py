@@ -0,0 +1,299 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from pdf_extract import extract_pages  # PyMuPDF, parallel for large PDFs
+from providers import OpenAIProvider, GeminiProvider
+from topic_prefilter import TopicPrefilter
+from percent_schema import (
+    PERCENT_CATEGORIES, OPENAI_PERCENT_SCHEMA, GEMINI_PERCENT_SCHEMA, STATUS_FAILED,
+    parse_structured_response, normalize_percent_matrix,
+)
+
+# Local HTTP API. Bound to localhost by default; put it behind a proxy before exposing it further.
+HOST = "127.0.0.1"
+PORT = 8765
+# JSON {"path": ...} requests may only read PDFs under this directory (relative paths are taken from
+# it); None refuses path requests, so documents must be uploaded or sent as text.
+DOCUMENTS_ROOT = None
+
+# "gpt" or "gemini": the provider (and the matching scripts' prompts) used for every stage
+PROVIDER = "gpt"
+STAGES = ["arguments", "organization", "sentiment", "advocacy", "percent"]
+
+# Prompt files, read once at start-up (same files the batch scripts use)
+SENTIMENT_PROMPT_FILE = "your text file location here"
+ADVOCACY_QUESTION_DIR = "your text file location"  # holds <Category>_Question.txt
+
+# Threads for concurrent stages of one or more documents, and for the advocacy questions
+STAGE_WORKERS = 16
+CALL_WORKERS = 32
+# Stage results kept in memory, keyed by provider, stage and a hash of the document text
+CACHE_SIZE = 2048
+# Use the local topic pre-classifier for confident single-topic documents in the percent stage
+PREFILTER = True
+
+class ResultCache:
+    """Thread-safe LRU cache of stage results."""
+
+    def __init__(self, max_size=CACHE_SIZE):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return self._items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+class AnalysisService:
+    """
+    Holds everything the batch scripts rebuild on every run: provider clients (and their HTTP
+    connections), prompt modules and prompt files, the topic pre-classifier and a result cache.
+    analyze() runs all requested stages for one document concurrently.
+    """
+
+    def __init__(self, provider=PROVIDER, sentiment_prompt_file=SENTIMENT_PROMPT_FILE,
+                 advocacy_question_dir=ADVOCACY_QUESTION_DIR, stage_workers=STAGE_WORKERS,
+                 call_workers=CALL_WORKERS, cache_size=CACHE_SIZE, prefilter=PREFILTER):
+        # Stage scripts are imported once so their prompt builders stay loaded
+        if provider == "gemini":
+            import MainArgumentsv2_Gem2 as arguments_module
+            import Organization_Gem2 as organization_module
+            import percentoutputGEm as percent_module
+            self.provider = GeminiProvider(model="gemini-2.0-flash")
+            self.percent_options = {"generation_config": {"response_mime_type": "application/json",
+                                                          "response_schema": GEMINI_PERCENT_SCHEMA}}
+        else:
+            import MainArgumentsv2_GPTo3 as arguments_module
+            import Organization_GPTo3 as organization_module
+            import percentoutputGPT as percent_module
+            self.provider = OpenAIProvider(model="o3-mini")
+            self.percent_options = {"response_format": {"type": "json_schema", "json_schema": OPENAI_PERCENT_SCHEMA}}
+        import SentimentScore_GPTo3
+        import Advocacy_GPT
+        self.arguments_module = arguments_module
+        self.organization_module = organization_module
+        self.percent_module = percent_module
+
+        self.sentiment_question = SentimentScore_GPTo3.read_prompt_from_file(sentiment_prompt_file)
+        self.advocacy_questions = {}
+        for category in Advocacy_GPT.CATEGORIES:
+            path = os.path.join(advocacy_question_dir, f"{category}_Question.txt")
+            if os.path.exists(path):
+                self.advocacy_questions[category] = Advocacy_GPT.load_question(path)
+            else:
+                print(f"Advocacy question not found: {path}")
+
+        self.prefilter = TopicPrefilter() if prefilter else None
+        self.cache = ResultCache(cache_size)
+        self._stage_pool = concurrent.futures.ThreadPoolExecutor(max_workers=stage_workers)
+        # Separate pool for calls fanned out inside a stage, so a busy stage pool can never deadlock
+        self._call_pool = concurrent.futures.ThreadPoolExecutor(max_workers=call_workers)
+        self.stages = {
+            "arguments": self.run_arguments,
+            "organization": self.run_organization,
+            "sentiment": self.run_sentiment,
+            "advocacy": self.run_advocacy,
+            "percent": self.run_percent,
+        }
+
+    def run_arguments(self, text):
+        return {"Main Arguments": self.provider.complete(self.arguments_module.build_prompt(text))}
+
+    def run_organization(self, text):
+        def analyze(text, question, question_type=None):
+            # Like the Organization_* scripts, a failed call yields None so a claimed org is always released.
+            # The daemon's one warm provider answers every question type.
+            try:
+                return self.provider.complete(f"{question}\n\n{text}")
+            except Exception as e:
+                print(f"organization error: {e}")
+                return None
+        return self.organization_module.analyze_organization(text, analyze, self.organization_module.KNOWLEDGE_BASE)
+
+    def run_sentiment(self, text):
+        if not self.sentiment_question:
+            raise ValueError("No sentiment prompt loaded; set SENTIMENT_PROMPT_FILE.")
+        return {"Sentiment": self.provider.complete(f"{self.sentiment_question}\n\n{text}")}
+
+    def run_advocacy(self, text):
+        if not self.advocacy_questions:
+            raise ValueError("No advocacy questions loaded; set ADVOCACY_QUESTION_DIR.")
+        futures = {category: self._call_pool.submit(self.provider.complete, f"{question}\n\n{text}")
+                   for category, question in self.advocacy_questions.items()}
+        return {category: future.result() for category, future in futures.items()}
+
+    def run_percent(self, text):
+        if self.prefilter:
+            local, confident = self.prefilter.classify(text)
+            if confident:
+                return {**dict(zip(PERCENT_CATEGORIES, local)), "Status": "ok", "Source": "local"}
+        response = self.provider.complete(self.percent_module.build_prompt(text, structured=True), **self.percent_options)
+        values = parse_structured_response(response)
+        percentages, status = normalize_percent_matrix([values if values is not None else [float('nan')] * len(PERCENT_CATEGORIES)])
+        if status[0] == STATUS_FAILED:
+            return {**{category: None for category in PERCENT_CATEGORIES}, "Status": STATUS_FAILED, "Source": "model"}
+        return {**dict(zip(PERCENT_CATEGORIES, percentages[0].tolist())), "Status": str(status[0]), "Source": "model"}
+
+    def _run_stage(self, stage, text, text_hash):
+        key = (self.provider.label, stage, text_hash)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached, True
+        result = self.stages[stage](text)
+        self.cache.put(key, result)
+        return result, False
+
+    def analyze(self, text, stages=None):
+        """
+        Runs the requested stages (default: all) on one document's text at the same time.
+
+        Returns:
+            dict: {"results": stage -> result or {"error": ...}, "cached": stages served from cache}
+        """
+        stages = stages or list(self.stages)
+        unknown = [stage for stage in stages if stage not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(unknown)}")
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        futures = {stage: self._stage_pool.submit(self._run_stage, stage, text, text_hash) for stage in stages}
+        results, cached = {}, []
+        for stage, future in futures.items():
+            try:
+                results[stage], from_cache = future.result()
+                if from_cache:
+                    cached.append(stage)
+            except Exception as e:
+                # One failing stage does not fail the others
+                print(f"{stage} error: {e}")
+                results[stage] = {"error": str(e)}
+        return {"results": results, "cached": cached}
+
+def extract_pdf_bytes(data):
+    """Extracts text from an uploaded PDF the same way as the fitz-based stage scripts."""
+    with tempfile.TemporaryDirectory() as directory:
+        pdf_path = os.path.join(directory, "upload.pdf")
+        with open(pdf_path, "wb") as file:
+            file.write(data)
+        return "".join(page + "\n" for page in extract_pages(pdf_path))
+
+def resolve_document_path(path, root=None):
+    """
+    The real path of a requested document, which must lie under root (default DOCUMENTS_ROOT) after
+    following symlinks. Raises ValueError otherwise, so the request is answered with 400.
+    """
+    root = DOCUMENTS_ROOT if root is None else root
+    if not root:
+        raise ValueError("Path requests are disabled; set DOCUMENTS_ROOT or upload the PDF.")
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"Path is outside the documents root: {path}")
+    if not os.path.isfile(resolved):
+        raise ValueError(f"Document not found: {path}")
+    return resolved
+
+def make_handler(service):
+    """Builds the request handler class bound to one warm AnalysisService."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse one connection
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path != "/health":
+                self._send_json(404, {"error": "Not found"})
+                return
+            self._send_json(200, {"status": "ok", "provider": service.provider.label, "stages": list(service.stages),
+                                  "cache_hits": service.cache.hits, "cache_misses": service.cache.misses})
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            if url.path != "/analyze":
+                self._send_json(404, {"error": "Not found"})
+                return
+            start = time.time()
+            query = parse_qs(url.query)
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            content_type = self.headers.get("Content-Type", "")
+            try:
+                if content_type.startswith("application/pdf"):
+                    # Raw PDF upload: POST /analyze?name=comment.pdf&stages=arguments,percent
+                    name = query.get("name", ["upload.pdf"])[0]
+                    stages = query.get("stages", [""])[0]
+                    text = extract_pdf_bytes(body)
+                elif content_type.startswith("application/json"):
+                    # JSON: {"text": "..."} or {"path": "docket/file.pdf"} (under DOCUMENTS_ROOT), plus optional "name" and "stages"
+                    request = json.loads(body or b"{}")
+                    stages = request.get("stages") or query.get("stages", [""])[0]
+                    if request.get("path"):
+                        name = request.get("name") or os.path.basename(request["path"])
+                        text = "".join(page + "\n" for page in extract_pages(resolve_document_path(request["path"])))
+                    else:
+                        name = request.get("name", "text")
+                        text = request.get("text", "")
+                else:
+                    raise ValueError("Content-Type must be application/pdf or application/json")
+                if isinstance(stages, str):
+                    stages = [stage for stage in stages.split(",") if stage]
+                if not text.strip():
+                    self._send_json(422, {"error": f"No text extracted from {name}"})
+                    return
+                outcome = service.analyze(text, stages)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"document": name, "provider": service.provider.label, "characters": len(text),
+                                  **outcome, "seconds": round(time.time() - start, 3)})
+
+        def log_message(self, format, *args):
+            print(f"{self.address_string()} {format % args}")
+
+    return Handler
+
+def main():
+    service = AnalysisService()
+    server = ThreadingHTTPServer((HOST, PORT), make_handler(service))
+    print(f"Analysis daemon ({service.provider.label}) listening on http://{HOST}:{PORT}")
+    print("POST /analyze with a PDF (Content-Type: application/pdf) or JSON {\"text\": ...}; GET /health")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if service.organization_module.KNOWLEDGE_BASE:
+            service.organization_module.KNOWLEDGE_BASE.save()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import concurrent.futures
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+import tracing
+from catalog import select_documents
+from packing import estimate_tokens
+import MainArgumentsv2_GPTo3
+import percentoutputGPT
+import SentimentScore_GPTo3
+from providers import OpenAIProvider, GeminiProvider
+from percent_schema import (
+    PERCENT_CATEGORIES, OPENAI_PERCENT_SCHEMA, GEMINI_PERCENT_SCHEMA, STATUS_FAILED,
+    parse_structured_response, normalize_percent_matrix,
+)
+
+# Stage to run on both providers: "arguments", "sentiment" or "percent"
+STAGE = "arguments"
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS and a token range. Every selected document is run on
+# both providers; paired results are not recorded as the stage's status in the catalog.
+MIN_TOKENS = None
+MAX_TOKENS = None
+
+# Separate concurrency budgets so one provider's rate limits never throttle the other
+EXTRACT_WORKERS = 4
+GPT_WORKERS = 5
+GEMINI_WORKERS = 5
+
+def build_stage(stage, prompt_file=None):
+    """
+    Returns the pieces needed to run one stage on both providers:
+    (extract function, prompt builder, OpenAI call options, Gemini call options, parser, agreement function).
+    Both providers receive the same prompt so their answers are directly comparable.
+    """
+    if stage == "arguments":
+        return (MainArgumentsv2_GPTo3.extract_text_from_pdf, MainArgumentsv2_GPTo3.build_prompt,
+                {}, {}, lambda answer: answer, argument_agreement)
+    if stage == "percent":
+        return (percentoutputGPT.extract_text_from_pdf,
+                lambda text: percentoutputGPT.build_prompt(text, structured=True),
+                {"response_format": {"type": "json_schema", "json_schema": OPENAI_PERCENT_SCHEMA}},
+                {"generation_config": {"response_mime_type": "application/json", "response_schema": GEMINI_PERCENT_SCHEMA}},
+                parse_structured_response, percent_agreement)
+    if stage == "sentiment":
+        question = SentimentScore_GPTo3.read_prompt_from_file(prompt_file)
+        if not question:
+            raise ValueError("The sentiment stage needs a prompt file.")
+        # Same extractor and prompt layout as SentimentScore_*.py, including the GPT script's system message
+        return (SentimentScore_GPTo3.extract_text_from_pdf, lambda text: f"{question}\n\n{text}",
+                {"system": SentimentScore_GPTo3.SYSTEM_MESSAGE}, {}, lambda answer: answer, sentiment_agreement)
+    raise ValueError(f"Unknown stage: {stage}")
+
+def argument_agreement(gpt_answer, gemini_answer):
+    """Word-set Jaccard overlap (0-1) between the two bullet lists."""
+    words_a = set(re.findall(r"[a-z]{4,}", (gpt_answer or "").lower()))
+    words_b = set(re.findall(r"[a-z]{4,}", (gemini_answer or "").lower()))
+    if not words_a or not words_b:
+        return None
+    return round(len(words_a & words_b) / len(words_a | words_b), 3)
+
+def sentiment_agreement(gpt_answer, gemini_answer):
+    """1 if both providers gave the same label, 0 if not."""
+    if not gpt_answer or not gemini_answer:
+        return None
+    return int(gpt_answer.strip().strip(".").lower() == gemini_answer.strip().strip(".").lower())
+
+def percent_agreement(gpt_values, gemini_values):
+    """Shared share of the two topic distributions (100 = identical, 0 = disjoint)."""
+    if gpt_values is None or gemini_values is None:
+        return None
+    percentages, status = normalize_percent_matrix([gpt_values, gemini_values])
+    if STATUS_FAILED in status:
+        return None
+    return int(100 - np.abs(percentages[0] - percentages[1]).sum() // 2)
+
+def call_provider(provider, prompt, options, parse, document=None):
+    """Run one provider call; failures become None so the paired row still gets written."""
+    try:
+        with tracing.span("model_call", document=document, provider=provider.label,
+                          input_tokens=estimate_tokens(prompt)) as span_args:
+            response = provider.complete(prompt, **options)
+            span_args["output_tokens"] = estimate_tokens(response)
+        return parse(response)
+    except Exception as e:
+        print(f"{provider.label} error: {e}")
+        return None
+
+def run_dual(pdf_directory, pdf_files, stage, gpt, gemini, prompt_file=None):
+    """
+    Extracts every PDF once and fans the same prompt out to both providers concurrently.
+
+    Returns:
+        tuple: (list of per-document rows, dict of wall-clock seconds per provider)
+    """
+    extract, build_prompt, gpt_options, gemini_options, parse, agreement = build_stage(stage, prompt_file)
+    answers = {pdf: {} for pdf in pdf_files}
+    finished_at = {}
+    start = time.time()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as extract_pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=GPT_WORKERS) as gpt_pool, \
+         concurrent.futures.ThreadPoolExecutor(max_workers=GEMINI_WORKERS) as gemini_pool:
+        text_futures = {extract_pool.submit(extract, os.path.join(pdf_directory, pdf)): pdf for pdf in pdf_files}
+        call_futures = {}
+        # Submit both provider calls as soon as each document's text is ready
+        for future in concurrent.futures.as_completed(text_futures):
+            pdf = text_futures[future]
+            text = future.result()
+            if not text:
+                print(f"No text extracted from {pdf}, skipping.")
+                continue
+            prompt = build_prompt(text)
+            call_futures[gpt_pool.submit(call_provider, gpt, prompt, gpt_options, parse, pdf)] = (pdf, "GPT")
+            call_futures[gemini_pool.submit(call_provider, gemini, prompt, gemini_options, parse, pdf)] = (pdf, "GEM")
+
+        for future in tqdm(concurrent.futures.as_completed(call_futures), total=len(call_futures), desc="Provider calls"):
+            pdf, side = call_futures[future]
+            answers[pdf][side] = future.result()
+            finished_at[side] = time.time() - start
+
+    rows = []
+    for pdf, pair in answers.items():
+        if not pair:
+            continue
+        row = {"Filename": pdf}
+        for side in ("GPT", "GEM"):
+            answer = pair.get(side)
+            if stage == "percent":
+                values = answer if answer is not None else [np.nan] * len(PERCENT_CATEGORIES)
+                row.update({f"{category}_{side}": value for category, value in zip(PERCENT_CATEGORIES, values)})
+            else:
+                row[f"Response_{side}"] = answer
+        row["Agreement"] = agreement(pair.get("GPT"), pair.get("GEM"))
+        rows.append(row)
+    return rows, finished_at
+
+def main():
+    pdf_directory = "your file location"
+    desktop_path = "your file location"
+    prompt_file = "your text file location here"  # only used by the sentiment stage
+
+    if not os.path.exists(pdf_directory):
+        print(f"Directory not found: {pdf_directory}")
+        return
+    pdf_files = select_documents(pdf_directory, STAGE, DOCKETS, MIN_TOKENS, MAX_TOKENS)
+    if not pdf_files:
+        print(f"No PDF files found in {pdf_directory}")
+        return
+
+    gpt = OpenAIProvider(model="o3-mini")
+    gemini = GeminiProvider(model="gemini-2.0-flash")
+    rows, finished_at = run_dual(pdf_directory, pdf_files, STAGE, gpt, gemini, prompt_file)
+
+    df = pd.DataFrame(rows)
+    if STAGE == "percent":
+        # Normalize each provider's columns with the same largest-remainder pass as percentoutput*
+        for side in ("GPT", "GEM"):
+            columns = [f"{category}_{side}" for category in PERCENT_CATEGORIES]
+            percentages, status = normalize_percent_matrix(df[columns].to_numpy(dtype=float))
+            df[columns] = pd.DataFrame(percentages, index=df.index, columns=columns).astype('Int64')
+            df.loc[status == STATUS_FAILED, columns] = pd.NA
+            df[f"Status_{side}"] = status
+
+    output_csv = os.path.join(desktop_path, f"{STAGE}_paired_GPT_GEM.csv")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_csv, index=False)
+    for side, seconds in sorted(finished_at.items()):
+        print(f"{side} finished after {seconds:.1f} seconds")
+    if len(df):
+        print(f"Mean agreement: {pd.to_numeric(df['Agreement'], errors='coerce').mean():.3f}")
+    print(f"Paired results saved to: {output_csv}")
+
+if __name__ == "__main__":
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    main()
+    tracing.finish()
@@ -1,11 +1,49 @@
 import os
 import pandas as pd
-import PyPDF2
+from pdf_extract import extract_pages  # PyPDF2, parallel for large PDFs
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
 import openai
 from tqdm import tqdm
 import concurrent.futures
 from functools import partial
+from providers import OpenAIProvider, GeminiProvider, Hedger, FailoverRouter
+from model_routing import route, routed_calls, provider_routing
+from scheduler import SizeScheduler, document_sizes
 
+# Default model; with MODEL_ROUTING the rules in model_routing.py may pick another model and set
+# reasoning effort / output caps from the document's size. The serving model is recorded per row.
+MODEL = "o3-mini"
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
+
+# Hedging: if the primary model has not answered by its observed p95 latency, send the same
+# prompt to the backup provider and keep whichever answer arrives first.
+HEDGE = False
+HEDGE_QUANTILE = 0.95
+HEDGE_BACKUP = GeminiProvider()  # reads its API key from the environment
+
+# Failover: a circuit breaker per provider/model opens after FAILOVER_THRESHOLD consecutive errors
+# and routes calls to the fallback provider until a half-open probe succeeds again.
+FAILOVER = False
+FAILOVER_THRESHOLD = 5
+FAILOVER_RESET_SECONDS = 60
+FAILOVER_FALLBACK = GeminiProvider()
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """
     Extracts all text content from a PDF file.
@@ -18,36 +56,24 @@ def extract_text_from_pdf(pdf_path):
     """
     text = ""
     try:
-        # Open the PDF file in binary mode
-        with open(pdf_path, 'rb') as file:
-            # Create a PDF reader object
-            pdf_reader = PyPDF2.PdfReader(file)
-            # Iterate through each page in the PDF
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                # Extract text from the current page and append to the result
-                text += page.extract_text()
+        # Extract text from every page; large PDFs are split into page ranges parsed across a process pool
+        text = "".join(extract_pages(pdf_path, engine="pypdf2"))
     except Exception as e:
         # Handle any errors that occur during PDF processing
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
 
-def analyze_with_openai(text, api_key):
+def build_prompt(text):
     """
-    Sends the extracted PDF text to OpenAI's GPT o3 - mini for analysis.
+    Builds the main-arguments prompt for a document.
     
     Args:
         text (str): The extracted text content from the PDF
-        api_key (str): The OpenAI API key for authentication
         
     Returns:
-        str: The analysis results containing main arguments identified in the text
+        str: The full prompt sent to the model
     """
-    # Configure the OpenAI API with the provided key
-    openai.api_key = api_key
-    
-    # Craft the prompt for OpenAI to analyze the text
-    prompt = f"""
+    return f"""
    Context: In October 2023, President Biden signed Executive Order (EO) 14110 titled, "Executive Order on Safe, Secure, and Trustworthy Development and Use of Artificial Intelligence". This Executive Order called on many agencies in the U.S. Government to request comments from the  U.S. public for feedback on the Executive Order. The text that follows is one of the feedback comments from the an organization or individual to the National Telecommunications and Information Agency (NTIA) government agency.
 
    Prompt: Please identify the topics and arguments that the author prioritizes in the document. These topics and arguments are evident in the number of times the author makes a mention, the depth of evidence and commentary to back it up, and the level of emphasis in the author's verbiage.
@@ -57,14 +83,35 @@ def analyze_with_openai(text, api_key):
     Text for analysis:
     {text}
     """
+
+@tracing.traced("model_call", text_args=("text",))
+def analyze_with_openai(text, api_key, model=MODEL, options=None):
+    """
+    Sends the extracted PDF text to OpenAI's GPT o3 - mini (or the routed model) for analysis.
+    
+    Args:
+        text (str): The extracted text content from the PDF
+        api_key (str): The OpenAI API key for authentication
+        model (str): The model to call
+        options (dict, optional): Extra request options such as reasoning_effort
+        
+    Returns:
+        str: The analysis results containing main arguments identified in the text
+    """
+    # Configure the OpenAI API with the provided key
+    openai.api_key = api_key
+    
+    # Craft the prompt for OpenAI to analyze the text
+    prompt = build_prompt(text)
     
     try:
         # Send the prompt to OpenAI and get the response
         response = openai.chat.completions.create(
-            model="o3-mini",  # Use the appropriate model identifier for GPT o3 - Mini
+            model=model,  # GPT o3 - Mini unless a routing rule picked another model
             messages=[
                 {"role": "user", "content": prompt}
             ],
+            **(options or {})
         )
         # Extract the content from the response
         return response.choices[0].message.content
@@ -73,7 +120,8 @@ def analyze_with_openai(text, api_key):
         print(f"API Error: {e}")
         return "Error analyzing document"
 
-def process_pdf(pdf_file, pdf_directory, api_key):
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf_file, pdf_directory, api_key, router=None):
     """
     Process a single PDF file: extract text, analyze with OpenAI, and return results.
     
@@ -81,6 +129,8 @@ def process_pdf(pdf_file, pdf_directory, api_key):
         pdf_file (str): The name of the PDF file to process
         pdf_directory (str): The directory containing the PDF file
         api_key (str): The OpenAI API key
+        router (Hedger or FailoverRouter, optional): If given, the prompt is sent through it
+            and the serving provider and model are recorded in the 'Provider' and 'Model' columns
         
     Returns:
         dict: A dictionary containing the filename and main arguments found in the PDF
@@ -96,13 +146,28 @@ def process_pdf(pdf_file, pdf_directory, api_key):
         print(f"No text extracted from {pdf_file}, skipping.")
         return None
     
+    if router:
+        # Analyze with whichever provider the router picks, routed to the model for this document's size
+        # in that provider's own options, and record which provider and model served the row
+        try:
+            arguments, provider = router.complete(build_prompt(text), routing=provider_routing("arguments", text, routing=MODEL_ROUTING))
+        except Exception as e:
+            print(f"API Error: {e}")
+            arguments, provider = "Error analyzing document", None
+        return {'Filename': pdf_file, 'Main Arguments': arguments, 'Provider': provider,
+                'Model': provider.split(":", 1)[1] if provider else None}
+    
+    # Pick the model for this document's size
+    model, options = route("arguments", "openai", text, default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    
     # Analyze the extracted text with OpenAI
-    arguments = analyze_with_openai(text, api_key)
+    arguments = analyze_with_openai(text, api_key, model, options)
     
     # Create a dictionary with the results
     result = {
         'Filename': pdf_file,
-        'Main Arguments': arguments
+        'Main Arguments': arguments,
+        'Model': model
     }
     return result
 
@@ -118,8 +183,8 @@ def main():
     
     # Try to get the API key from environment variables
     api_key = os.environ.get("OPENAI_API_KEY")
-    # If not found in environment, prompt the user
-    if not api_key:
+    # If not found in environment, prompt the user (a --plan run makes no calls)
+    if not api_key and not planner.PLAN:
         api_key = input("Enter your OpenAI API key: ")
     
     # Check if the PDF directory exists
@@ -128,7 +193,7 @@ def main():
         return
     
     # Find all PDF files in the directory
-    pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
+    pdf_files = select_documents(pdf_directory, "arguments", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     
     # Exit if no PDF files were found
     if not pdf_files:
@@ -138,20 +203,33 @@ def main():
     # Set the maximum number of parallel worker threads
     max_workers = 5
     
+    if planner.PLAN:
+        planner.print_plan("arguments", "openai", MODEL, pdf_directory, pdf_files, [planner.Call(build_prompt(""))],
+                           max_workers, MODEL_ROUTING)
+        return
+    
+    # Optionally hedge slow calls against the backup provider, or fail over when the primary is down
+    router = None
+    if HEDGE:
+        router = Hedger(OpenAIProvider(model=MODEL, api_key=api_key), HEDGE_BACKUP, quantile=HEDGE_QUANTILE)
+    elif FAILOVER:
+        router = FailoverRouter([OpenAIProvider(model=MODEL, api_key=api_key), FAILOVER_FALLBACK],
+                                failure_threshold=FAILOVER_THRESHOLD, reset_timeout=FAILOVER_RESET_SECONDS)
+    
     # Create a partial function with fixed arguments to simplify parallel processing
-    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key)
+    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key, router=router)
     
     # List to store the processing results
     results = []
     
     # Use ThreadPoolExecutor for parallel processing of PDF files
     with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Submit all PDF files for processing
-        future_to_pdf = {executor.submit(process_pdf_with_args, pdf_file): pdf_file for pdf_file in pdf_files}
+        # Submit the PDF files, largest first within the rate limits
+        scheduler = SizeScheduler.for_routing(routed_calls("arguments", "openai", [None], MODEL, MODEL_ROUTING), max_workers) if SCHEDULE else SizeScheduler(max_workers)
+        sizes = document_sizes(pdf_directory, pdf_files) if SCHEDULE else {}
         
         # Track progress of the processing tasks
-        for future in tqdm(concurrent.futures.as_completed(future_to_pdf), total=len(pdf_files), desc="Processing PDFs"):
-            pdf_file = future_to_pdf[future]
+        for pdf_file, future in tqdm(scheduler.run(executor, process_pdf_with_args, pdf_files, sizes), total=len(pdf_files), desc="Processing PDFs"):
             try:
                 # Get the result of the processing
                 result = future.result()
@@ -161,6 +239,11 @@ def main():
                 # Handle any errors that occur during processing
                 print(f"Error processing {pdf_file}: {e}")
     
+    if router:
+        print(router.summary())
+    if SCHEDULE:
+        print(scheduler.summary())
+    
     # Create a DataFrame from the results
     df = pd.DataFrame(results)
     
@@ -168,27 +251,33 @@ def main():
     output_csv = os.path.join(desktop_path, "arguments_NTIA_GPTo3.csv")
     output_excel = os.path.join(desktop_path, "argumentsGPT_NTIA_GPTo3.xlsx")
     
-    # Save results to CSV
-    df.to_csv(output_csv, index=False)
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(pdf_directory, "arguments", df.to_dict("records"), "Filename")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_csv, df, "Filename")
+    with tracing.span("write_output", rows=len(df)):
+        # Save results to CSV
+        df.to_csv(output_csv, index=False)
     
-    # Save results to Excel with formatting
-    with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
-        # Write the data to the Excel file
-        df.to_excel(writer, index=False, sheet_name='Arguments')
+        # Save results to Excel with formatting
+        with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
+            # Write the data to the Excel file
+            df.to_excel(writer, index=False, sheet_name='Arguments')
         
-        # Auto-adjust column widths for better readability
-        worksheet = writer.sheets['Arguments']
-        for column in worksheet.columns:
-            max_length = 0
-            column_letter = column[0].column_letter
-            for cell in column:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))  # No maximum length limit
-                except:
-                    pass
-            adjusted_width = (max_length + 2)  # Add some padding
-            worksheet.column_dimensions[column_letter].width = adjusted_width
+            # Auto-adjust column widths for better readability
+            worksheet = writer.sheets['Arguments']
+            for column in worksheet.columns:
+                max_length = 0
+                column_letter = column[0].column_letter
+                for cell in column:
+                    try:
+                        if len(str(cell.value)) > max_length:
+                            max_length = len(str(cell.value))  # No maximum length limit
+                    except:
+                        pass
+                adjusted_width = (max_length + 2)  # Add some padding
+                worksheet.column_dimensions[column_letter].width = adjusted_width
     
     # Print confirmation and output file locations
     print(f"Analysis complete. Results saved to:")
@@ -197,4 +286,7 @@ def main():
 
 # Standard Python idiom to check if the script is being run directly (not imported)
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
+    main()
+    tracing.finish()
\ No newline at end of file
@@ -1,64 +1,146 @@
 import os
-import fitz  # PyMuPDF
+from pdf_extract import extract_pages  # PyMuPDF, parallel for large PDFs
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
 import pandas as pd
 import google.generativeai as genai
 import concurrent.futures
 import time
+import threading
+from providers import OpenAIProvider, GeminiProvider, FailoverRouter, Hedger
+from org_knowledge import OrgKnowledgeBase, SOURCE_MODEL
+from model_routing import route, routed_calls, provider_routing
+from scheduler import SizeScheduler, document_sizes
 
 # Set up Google Gemini API Key (Ensure to store securely)
 GENAI_API_KEY = "yourkeyhere"
 genai.configure(api_key=GENAI_API_KEY)
 
+# Circuit breaker + failover: after 5 consecutive errors the primary model's circuit opens and calls
+# are routed to the fallback provider until a half-open probe succeeds again.
+FAILOVER = False
+FAILOVER_THRESHOLD = 5
+FAILOVER_RESET_SECONDS = 60
+
+# Hedging: if the primary model has not answered a question by its observed p95 latency, send the same
+# prompt to the backup provider and keep whichever answer arrives first (takes precedence over FAILOVER).
+HEDGE = False
+HEDGE_QUANTILE = 0.95
+# The Hedger or FailoverRouter, built from GENAI_API_KEY and MODEL by main() (or by the first call, in queue
+# and repair workers); each question is then routed per provider like the direct calls.
+ROUTER = None
+_router_lock = threading.Lock()
+
+# Organization knowledge base: once an organization (or a close variant of its name, e.g. "Google LLC"
+# vs "Google") has been classified, later comments from it skip the three follow-up questions.
+# Rows in ORG_OVERRIDES_PATH (Org Title, Main Function, Org Category, Industry, Aliases) always win.
+# Each provider keeps its own file, so GPT and Gemini classifications are never mixed in the comparison.
+ORG_KB = True
+ORG_KB_PATH = "org_knowledge_gemini.json"
+ORG_OVERRIDES_PATH = "org_overrides.csv"
+KNOWLEDGE_BASE = OrgKnowledgeBase(ORG_KB_PATH, ORG_OVERRIDES_PATH) if ORG_KB else None
+
+# Default model; with MODEL_ROUTING the rules in model_routing.py send the short title/description and
+# enumerated category/industry questions to a fast model with a tight output cap. The Provider column
+# lists every provider:model that answered one of the document's questions.
+MODEL = "gemini-2.0-flash"
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file."""
     text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text("text") + "\n"
+        # Large PDFs are split into page ranges and parsed across a process pool
+        text = "".join(page + "\n" for page in extract_pages(pdf_path))
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
 
-def analyze_text_with_gemini(text, question):
+def provider_router():
+    """The Hedger (HEDGE) or FailoverRouter (FAILOVER) for this run, built on first use."""
+    global ROUTER
+    with _router_lock:
+        if ROUTER is None:
+            providers = [GeminiProvider(model=MODEL, api_key=GENAI_API_KEY), OpenAIProvider()]
+            if HEDGE:
+                ROUTER = Hedger(*providers, quantile=HEDGE_QUANTILE)
+            else:
+                ROUTER = FailoverRouter(providers, failure_threshold=FAILOVER_THRESHOLD, reset_timeout=FAILOVER_RESET_SECONDS)
+        return ROUTER
+
+@tracing.traced("model_call", text_args=("text", "question"))
+def analyze_text_with_gemini(text, question, served_by=None, question_type=None):
     """Send text to the Gemini model with a specific question."""
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    if HEDGE or FAILOVER:
+        # Hedge slow calls or route through the circuit breakers, with this question's routed model and
+        # options for each provider, and note which provider:model answered
+        try:
+            routing = provider_routing("organization", text, question_type, routing=MODEL_ROUTING)
+            answer, provider = provider_router().complete(f"{question}\n\n{text}", routing=routing)
+        except Exception as e:
+            print(f"Error analyzing text: {e}")
+            return None
+        if served_by is not None:
+            served_by.add(provider)
+        return answer
+
+    model_name, options = route("organization", "gemini", text, question_type, default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    model = genai.GenerativeModel(model_name)
     prompt = f"{question}\n\n{text}"
     
     try:
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, **options)
+        if served_by is not None:
+            served_by.add(f"gemini:{model_name}")
         return response.text.strip()
     except Exception as e:
         print(f"Error analyzing text with Gemini: {e}")
         return None
 
-def process_pdf(pdf_file, documents_path):
-    """Process a single PDF file and return its analysis results."""
-    pdf_path = os.path.join(documents_path, pdf_file)
-    text = extract_text_from_pdf(pdf_path)
-    
-    if not text:
-        return {"PDF File": pdf_file, "Org Title": "N/A", "Main Function": "N/A", "Org Category": "N/A", "Industry": "N/A"}
-    
+def analyze_organization(text, analyze, knowledge_base=None):
+    """
+    Ask the four organization questions about one document; analyze(text, question, question_type) returns an answer.
+    With a knowledge base, an organization classified before only costs the title question.
+    """
     # Prompt for Org Title
     org_title_question = """Please identify the title of the organization that wrote the feedback message to the government agency. If the feedback message is not written on behalf of an organization, please respond with “N/A”.
 
 Output Format: If the name is not listed in the text that follows, please respond with “N/A”. If the name is available, please respond with the name. Do not respond with any text besides the name.
 """
     
-    analysis_results = {"PDF File": pdf_file}
-    
     # Step 1: Extract Org Title
-    org_title = analyze_text_with_gemini(text, org_title_question)
-    analysis_results["Org Title"] = org_title
+    org_title = analyze(text, org_title_question, "title")
+    source = SOURCE_MODEL
+    known = None
+    if knowledge_base and org_title and org_title != "N/A":
+        # Reuse a stored classification; waits if another thread is classifying the same organization
+        known = knowledge_base.claim(org_title)
     
-    if org_title and org_title != "N/A":
+    if known:
+        main_function, org_category, industry = known["Main Function"], known["Org Category"], known["Industry"]
+        source = known["Source"]
+    elif org_title and org_title != "N/A":
         # Step 2: Determine Main Function (MOVED BEFORE ORG CATEGORY)
         main_function_question = f"""This is the name of the organization: {org_title}
         In one sentence, please describe the main function of this organization.
         Output Format: If the organization is titled "N/A" then please respond with "N/A". Do not include any text besides a sentence about the main function."""
         
-        main_function = analyze_text_with_gemini(text, main_function_question)
+        main_function = analyze(text, main_function_question, "description")
         
         # Step 3: Determine Org Category (NOW USES MAIN FUNCTION IN PROMPT)
         org_category_question = f"""This is the name of the organization: {org_title}
@@ -76,7 +158,7 @@ Which of the five possible categories - University, Research Lab, Consortium, Co
 Output Format: If the organization is titled “N/A”, then please respond with “N/A”. Do not include any text besides the category title.
 """
         
-        org_category = analyze_text_with_gemini(text, org_category_question)
+        org_category = analyze(text, org_category_question, "classification")
 
         # Step 4: Determine Industry (USES MAIN FUNCTION IN PROMPT)
         industry_question = f"""This is the name of the organization: {org_title}
@@ -123,37 +205,60 @@ For this prompt, an organization can only be in one industry. What industry is t
 Output Format: If the organization is titled “N/A” then please respond with “N/A”. Do not include any text besides the category titled.
 """
         
-        industry = analyze_text_with_gemini(text, industry_question)
+        industry = analyze(text, industry_question, "classification")
+        if knowledge_base:
+            knowledge_base.add(org_title, {"Main Function": main_function, "Org Category": org_category, "Industry": industry})
     else:
         # If "Org Title" is "N/A", set all values to "N/A" without making API calls
         main_function = "N/A"
         org_category = "N/A"
         industry = "N/A"
+
+    return {"Org Title": org_title, "Main Function": main_function, "Org Category": org_category, "Industry": industry,
+            "Classification Source": source}
+
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf_file, documents_path):
+    """Process a single PDF file and return its analysis results."""
+    pdf_path = os.path.join(documents_path, pdf_file)
+    text = extract_text_from_pdf(pdf_path)
+    
+    if not text:
+        return {"PDF File": pdf_file, "Org Title": "N/A", "Main Function": "N/A", "Org Category": "N/A", "Industry": "N/A", "Provider": None, "Classification Source": None}
+    
+    served_by = set()  # providers that answered this document's questions
+    analysis_results = {"PDF File": pdf_file}
+    analysis_results.update(analyze_organization(text, lambda text, question, question_type: analyze_text_with_gemini(text, question, served_by, question_type), KNOWLEDGE_BASE))
     
-    # Store results
-    analysis_results["Main Function"] = main_function
-    analysis_results["Org Category"] = org_category
-    analysis_results["Industry"] = industry
+    analysis_results["Provider"] = ", ".join(sorted(served_by)) or None
     
     print(f"Processed {pdf_file}")
     return analysis_results
 
 def main():
     documents_path = os.path.expanduser("your file location here")
-    pdf_files = [f for f in os.listdir(documents_path) if f.endswith(".pdf")]
+    pdf_files = select_documents(documents_path, "organization", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
+    if planner.PLAN:
+        # Follow-up questions are not counted for documents whose organization the knowledge base already has
+        planner.print_plan("organization", "gemini", MODEL, documents_path, pdf_files, planner.organization_calls(analyze_organization),
+                           5, MODEL_ROUTING, knowledge_base=KNOWLEDGE_BASE)
+        return
     
     results = []
     start_time = time.time()
+    router = provider_router() if HEDGE or FAILOVER else None
     
     # Use ThreadPoolExecutor for parallel processing
     # Adjust max_workers based on your system and API rate limits
+    # Each of the four questions is paced against the limits of the model it is routed to
+    question_types = [call.question_type for call in planner.organization_calls(analyze_organization)]
     with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        # Submit all PDF processing tasks
-        future_to_pdf = {executor.submit(process_pdf, pdf, documents_path): pdf for pdf in pdf_files}
+        # Submit the PDF processing tasks largest first; each document costs up to four calls
+        scheduler = SizeScheduler.for_routing(routed_calls("organization", "gemini", question_types, MODEL, MODEL_ROUTING), 5) if SCHEDULE else SizeScheduler(5)
+        sizes = document_sizes(documents_path, pdf_files) if SCHEDULE else {}
         
         # Collect results as they complete
-        for future in concurrent.futures.as_completed(future_to_pdf):
-            pdf = future_to_pdf[future]
+        for pdf, future in scheduler.run(executor, lambda pdf: process_pdf(pdf, documents_path), pdf_files, sizes):
             try:
                 result = future.result()
                 results.append(result)
@@ -163,13 +268,27 @@ def main():
     # Convert results to DataFrame and save
     df = pd.DataFrame(results)
     # Reorder columns to match the original order
-    df = df[["PDF File", "Org Title", "Org Category", "Industry", "Main Function"]]
+    df = df[["PDF File", "Org Title", "Org Category", "Industry", "Main Function", "Provider", "Classification Source"]]
     output_path = os.path.join("your file location here")
-    df.to_csv(output_path, index=False)
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(documents_path, "organization", df.to_dict("records"), "PDF File")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_path, df, "PDF File")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_path, index=False)
     
     elapsed_time = time.time() - start_time
+    if router:
+        print(router.summary())
+    if KNOWLEDGE_BASE:
+        KNOWLEDGE_BASE.save()
+        print(KNOWLEDGE_BASE.summary())
     print(f"Results saved to {output_path}")
     print(f"Total processing time: {elapsed_time:.2f} seconds")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
+    main()
+    tracing.finish()
\ No newline at end of file
@@ -0,0 +1,207 @@
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+import pandas as pd
+from catalog import select_documents
+from work_queue import WorkQueue, worker_id, LEASE_SECONDS, MAX_ATTEMPTS, STATUS_PENDING, STATUS_LEASED
+
+# Seconds an idle worker waits before asking again while other workers still hold leases
+POLL_SECONDS = 1
+
+STAGES = ["arguments", "organization", "sentiment", "advocacy", "percent"]
+
+def build_runner(stage, provider="gpt", prompt_file=None, questions_dir=None):
+    """
+    Returns a function (pdf file name, directory) -> result row that runs one document through the
+    stage script's own process_pdf, so queued runs produce exactly the same rows as batch runs.
+    Each worker can use a different API project by setting OPENAI_API_KEY / GEMINI_API_KEY.
+    """
+    gemini = provider == "gemini"
+    if stage == "arguments":
+        if gemini:
+            import MainArgumentsv2_Gem2 as module
+            api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        else:
+            import MainArgumentsv2_GPTo3 as module
+            api_key = os.environ.get("OPENAI_API_KEY")
+        return lambda item, directory: module.process_pdf(item, directory, api_key)
+    if stage == "organization":
+        if gemini:
+            import Organization_Gem2 as module
+        else:
+            import Organization_GPTo3 as module
+        return module.process_pdf
+    if stage == "sentiment":
+        import SentimentScore_GPTo3
+        question = SentimentScore_GPTo3.read_prompt_from_file(prompt_file)
+        if not question:
+            raise ValueError("The sentiment stage needs --prompt-file.")
+        if gemini:
+            import SentimentScore_Gem2
+            return lambda item, directory: SentimentScore_Gem2.process_pdf(item, directory, question)
+        return lambda item, directory: SentimentScore_GPTo3.process_pdf(os.path.join(directory, item), question, pdf_name=item)
+    if stage == "advocacy":
+        if gemini:
+            import advocacy_Gem as module
+        else:
+            import Advocacy_GPT as module
+        if not questions_dir:
+            raise ValueError("The advocacy stage needs --questions-dir.")
+        questions = {category: module.load_question(os.path.join(questions_dir, f"{category}_Question.txt"))
+                     for category in module.CATEGORIES}
+        return lambda item, directory: module.process_pdf(item, directory, questions)
+    if stage == "percent":
+        from topic_prefilter import TopicPrefilter
+        if gemini:
+            import percentoutputGEm as module
+            api_key = os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        else:
+            import percentoutputGPT as module
+            api_key = os.environ.get("OPENAI_API_KEY")
+        prefilter = TopicPrefilter() if module.PREFILTER else None
+        return lambda item, directory: module.process_pdf(item, directory, api_key, prefilter)
+    raise ValueError(f"Unknown stage: {stage}")
+
+def finish_runner(stage, provider="gpt"):
+    """Saves what the stage script learned during a queued or repair run (the organization knowledge base)."""
+    if stage != "organization":
+        return
+    if provider == "gemini":
+        import Organization_Gem2 as module
+    else:
+        import Organization_GPTo3 as module
+    if module.KNOWLEDGE_BASE:
+        module.KNOWLEDGE_BASE.save()
+        print(module.KNOWLEDGE_BASE.summary())
+
+def work_on(queue, job, runner, stage):
+    """
+    Runs one leased job, heartbeating in the background, then commits it, or releases it for a retry
+    when the runner raised or returned a placeholder row (RepairRun.failure_reason).
+    """
+    from RepairRun import failure_reason  # RepairRun imports this module
+    stop = threading.Event()
+
+    def heartbeat():
+        while not stop.wait(queue.lease_seconds / 3):
+            if not queue.heartbeat(job["id"], job["lease_token"]):
+                print(f"Lease lost for {job['item']}; another worker may also process it")
+                return
+
+    beat = threading.Thread(target=heartbeat, daemon=True)
+    beat.start()
+    try:
+        result = runner(job["item"], job["directory"])
+    except Exception as e:
+        print(f"Error processing {job['item']} (attempt {job['attempts']}): {e}")
+        queue.fail(job["id"], job["lease_token"], e)
+        return False
+    finally:
+        stop.set()
+        beat.join()
+    # The stage scripts catch API errors and return a placeholder row; keep those out of the results
+    reason = failure_reason(stage, result) if result else None
+    if reason:
+        print(f"Failed result for {job['item']} (attempt {job['attempts']}): {reason}")
+        queue.fail(job["id"], job["lease_token"], reason)
+        return False
+    if not queue.commit(job["id"], job["lease_token"], result):
+        print(f"Result for {job['item']} discarded: its lease expired and another worker took the job over")
+        return False
+    return True
+
+def worker_thread(queue, stage, runner, done):
+    """Leases and runs jobs until the stage has no pending or leased work left."""
+    owner = worker_id()
+    while True:
+        jobs = queue.lease(stage, owner)
+        if not jobs:
+            counts = queue.counts(stage)
+            if not counts.get(STATUS_PENDING) and not counts.get(STATUS_LEASED):
+                return
+            # Other workers hold the remaining leases; one may expire if its worker died
+            time.sleep(POLL_SECONDS)
+            continue
+        if work_on(queue, jobs[0], runner, stage):
+            done.append(jobs[0]["item"])
+
+def run_worker(queue_path, stage, threads, provider, prompt_file, questions_dir, lease_seconds, max_attempts):
+    """One worker process: builds the stage runner once and pulls jobs on several threads."""
+    queue = WorkQueue(queue_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    runner = build_runner(stage, provider, prompt_file, questions_dir)
+    done = []
+    start = time.time()
+    workers = [threading.Thread(target=worker_thread, args=(queue, stage, runner, done)) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    finish_runner(stage, provider)
+    elapsed = time.time() - start
+    print(f"Worker {os.getpid()}: {len(done)} documents in {elapsed:.1f} s ({len(done) / max(elapsed, 1e-9) * 60:.1f}/min)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Shard a stage across worker processes and hosts with a shared SQLite job queue.")
+    parser.add_argument("--queue", required=True, help="Path to the queue database (shared storage for several hosts)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = commands.add_parser("enqueue", help="Queue every PDF in a directory for a stage")
+    enqueue.add_argument("--stage", required=True, choices=STAGES)
+    enqueue.add_argument("--directory", required=True)
+    enqueue.add_argument("--docket", action="append", help="Only this docket partition (repeatable; default: all)")
+    enqueue.add_argument("--min-tokens", type=int, help="Only documents at least this long (needs a corpus catalog)")
+    enqueue.add_argument("--max-tokens", type=int, help="Only documents at most this long (needs a corpus catalog)")
+    enqueue.add_argument("--pending-only", action="store_true", help="Skip documents the catalog lists as scored by this stage")
+
+    work = commands.add_parser("work", help="Pull and process jobs until the stage is finished")
+    work.add_argument("--stage", required=True, choices=STAGES)
+    work.add_argument("--processes", type=int, default=1)
+    work.add_argument("--threads", type=int, default=5, help="Concurrent documents per process")
+    work.add_argument("--provider", choices=["gpt", "gemini"], default="gpt")
+    work.add_argument("--prompt-file", help="Sentiment prompt file")
+    work.add_argument("--questions-dir", help="Directory with the advocacy <Category>_Question.txt files")
+    work.add_argument("--lease-seconds", type=float, default=LEASE_SECONDS)
+    work.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+
+    commands.add_parser("status", help="Show job counts per stage and status")
+
+    export = commands.add_parser("export", help="Write a stage's committed results to CSV")
+    export.add_argument("--stage", required=True, choices=STAGES)
+    export.add_argument("--output", required=True)
+
+    args = parser.parse_args()
+    queue = WorkQueue(args.queue)
+
+    if args.command == "enqueue":
+        pdf_files = select_documents(args.directory, args.stage, args.docket, args.min_tokens, args.max_tokens, args.pending_only)
+        added = queue.enqueue(args.stage, args.directory, pdf_files)
+        print(f"Queued {added} new {args.stage} jobs ({len(pdf_files) - added} already queued)")
+    elif args.command == "work":
+        worker_args = (args.queue, args.stage, args.threads, args.provider, args.prompt_file, args.questions_dir,
+                       args.lease_seconds, args.max_attempts)
+        processes = [multiprocessing.Process(target=run_worker, args=worker_args) for _ in range(args.processes)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        print(f"Queue status for {args.stage}: {queue.counts(args.stage)}")
+    elif args.command == "status":
+        for stage in STAGES:
+            counts = queue.counts(stage)
+            if counts:
+                print(f"{stage}: {counts}")
+    elif args.command == "export":
+        rows = [row for row in queue.results(args.stage) if row]
+        df = pd.DataFrame(rows)
+        if args.stage == "percent" and len(df):
+            # Same whole-matrix normalization the batch percentoutput* scripts apply before writing
+            from percent_schema import normalize_percent_frame, PERCENT_CATEGORIES
+            df = normalize_percent_frame(df)
+            df = df.drop(columns=[f"Local_{category}" for category in PERCENT_CATEGORIES], errors="ignore")
+        df.to_csv(args.output, index=False)
+        print(f"{len(df)} results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
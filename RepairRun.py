@@ -0,0 +1,169 @@
+import shutil
+import argparse
+import concurrent.futures
+import pandas as pd
+from tqdm import tqdm
+from QueueWorker import STAGES, build_runner, finish_runner
+from partitions import list_pdfs
+from percent_schema import PERCENT_CATEGORIES, STATUS_FAILED, normalize_percent_frame
+
+# Column that identifies the document in each stage's output
+KEY_COLUMNS = {
+    "arguments": "Filename",
+    "percent": "Filename",
+    "organization": "PDF File",
+    "sentiment": "PDF File",
+    "advocacy": "PDF File",
+}
+# Answer columns that must be present for a row to count as done
+ANSWER_COLUMNS = {
+    "arguments": ["Main Arguments"],
+    "organization": ["Org Title", "Main Function", "Org Category", "Industry"],
+    "sentiment": ["Response"],
+    "advocacy": ["Testing", "Privacy", "Governance", "Auth", "Global", "Labor", "Ethics", "Energy"],
+    "percent": PERCENT_CATEGORIES,
+}
+# Placeholder text the stage scripts write when an API call fails
+ERROR_TEXTS = {"Error analyzing document"}
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and pd.isna(value)) or (isinstance(value, str) and not value.strip())
+
+def failure_reason(stage, row):
+    """
+    Decides whether one output row is a failure.
+
+    Returns:
+        str or None: A short reason ("missing answer", "error text", "no provider answered",
+        "status failed", "fallback distribution", "sum != 100"), or None for a good row.
+    """
+    columns = [column for column in ANSWER_COLUMNS[stage] if column in row]
+    if stage == "percent":
+        if "Status" in row and row["Status"] == STATUS_FAILED:
+            return "status failed"
+        values = [row[column] for column in columns]
+        if any(is_missing(value) for value in values):
+            return "missing answer"
+        # Legacy mode answers "Other: 100" when the API call raised. Rows with a Status or Source column
+        # record failures explicitly, and there Other=100 is a real answer for an off-topic comment.
+        legacy = "Status" not in row and "Source" not in row
+        if legacy and row.get("Other") == 100 and all(row[column] == 0 for column in columns if column != "Other"):
+            return "fallback distribution"
+        if round(sum(float(value) for value in values)) != 100:
+            return "sum != 100"
+        return None
+    if stage == "organization":
+        # A real "N/A" answer (individual commenter) has a provider; extraction/API failures do not
+        if all(row.get(column) == "N/A" for column in columns) and "Provider" in row and is_missing(row.get("Provider")):
+            return "no provider answered"
+    for column in columns:
+        value = row[column]
+        if is_missing(value):
+            return "missing answer"
+        if isinstance(value, str) and value.strip() in ERROR_TEXTS:
+            return "error text"
+    return None
+
+def find_failures(stage, df, pdf_files=()):
+    """
+    Returns:
+        dict: Document name -> failure reason, including documents in pdf_files with no output row.
+    """
+    key = KEY_COLUMNS[stage]
+    failures = {}
+    for row in df.to_dict("records"):
+        reason = failure_reason(stage, row)
+        if reason:
+            failures[row[key]] = reason
+    present = set(df[key]) if key in df.columns else set()
+    for pdf in pdf_files:
+        if pdf not in present:
+            failures[pdf] = "no output row"
+    return failures
+
+def merge_repairs(df, key, rows):
+    """Replaces rows by document name in place (keeping row order) and appends rows for new documents."""
+    # Object columns, so text answers can replace empty (float NaN) cells
+    df = df.astype(object)
+    positions = {name: index for index, name in zip(df.index, df[key])}
+    for row in rows:
+        if row[key] in positions:
+            for column, value in row.items():
+                if column not in df.columns:
+                    df[column] = None
+                df.at[positions[row[key]], column] = value
+        else:
+            df = pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+    return df
+
+def read_output(path):
+    # Keep the literal "N/A" answers (pandas would read them as missing); only blank cells are missing
+    if path.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path, keep_default_na=False, na_values=[""])
+    return pd.read_csv(path, keep_default_na=False, na_values=[""])
+
+def write_output(df, path):
+    if path.lower().endswith((".xlsx", ".xls")):
+        df.to_excel(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-run only the failed rows of an existing stage output and merge them back in place.")
+    parser.add_argument("--stage", required=True, choices=STAGES)
+    parser.add_argument("--output", required=True, help="Existing stage output (.csv or .xlsx); updated in place")
+    parser.add_argument("--directory", required=True, help="Directory holding the stage's PDFs")
+    parser.add_argument("--docket", action="append", help="Only this docket partition (repeatable; default: all)")
+    parser.add_argument("--provider", choices=["gpt", "gemini"], default="gpt")
+    parser.add_argument("--prompt-file", help="Sentiment prompt file")
+    parser.add_argument("--questions-dir", help="Directory with the advocacy <Category>_Question.txt files")
+    parser.add_argument("--workers", type=int, default=5)
+    parser.add_argument("--dry-run", action="store_true", help="Only list the rows that would be re-run")
+    args = parser.parse_args()
+
+    key = KEY_COLUMNS[args.stage]
+    df = read_output(args.output)
+    pdf_files = list_pdfs(args.directory, args.docket)
+    failures = find_failures(args.stage, df, pdf_files)
+    reasons = pd.Series(list(failures.values()), dtype=object).value_counts().to_dict()
+    print(f"{len(failures)} of {len(pdf_files)} documents need a re-run: {reasons}")
+    if args.dry_run or not failures:
+        for name, reason in sorted(failures.items()):
+            print(f"  {name}: {reason}")
+        return
+
+    runner = build_runner(args.stage, args.provider, args.prompt_file, args.questions_dir)
+    repaired = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as executor:
+        future_to_pdf = {executor.submit(runner, pdf, args.directory): pdf for pdf in failures if pdf in pdf_files}
+        for future in tqdm(concurrent.futures.as_completed(future_to_pdf), total=len(future_to_pdf), desc="Repairing"):
+            pdf = future_to_pdf[future]
+            try:
+                row = future.result()
+                if row:
+                    repaired.append(row)
+            except Exception as e:
+                print(f"Error processing {pdf}: {e}")
+    finish_runner(args.stage, args.provider)
+
+    if args.stage == "percent" and repaired:
+        new_rows = pd.DataFrame(repaired)
+        if "Status" in df.columns:
+            # Same largest-remainder normalization as the structured percentoutput* run
+            new_rows = normalize_percent_frame(new_rows)
+        new_rows = new_rows.drop(columns=[f"Local_{category}" for category in PERCENT_CATEGORIES], errors="ignore")
+        repaired = new_rows.to_dict("records")
+
+    # Keep the previous file next to the repaired one
+    shutil.copy2(args.output, args.output + ".bak")
+    merged = merge_repairs(df, key, repaired)
+    if args.stage == "percent":
+        # Blank (failed) cells made pandas read the columns as floats; write whole numbers again
+        merged[PERCENT_CATEGORIES] = merged[PERCENT_CATEGORIES].apply(pd.to_numeric).astype("Int64")
+    write_output(merged, args.output)
+    still_failing = find_failures(args.stage, merged, pdf_files)
+    print(f"Re-ran {len(repaired)} documents; {len(failures) - len(still_failing)} fixed, {len(still_failing)} still failing")
+    print(f"Updated {args.output} (previous version saved as {args.output}.bak)")
+
+if __name__ == "__main__":
+    main()
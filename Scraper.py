@@ -5,16 +5,20 @@ from selenium.webdriver.support import expected_conditions as EC
 import time
 import os
 import logging
+import threading
+import concurrent.futures
 from datetime import datetime
-import glob
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
+from partitions import docket_id
+from downloader import AttachmentDownloader
+from catalog import CorpusCatalog, catalog_path
 
 # Set up logging
 log_filename = f"scraper_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
+    format='%(asctime)s - %(levelname)s - %(threadName)s - %(message)s',
     handlers=[
         logging.FileHandler(log_filename),
         logging.StreamHandler()
@@ -22,36 +26,74 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create downloads directory if it doesn't exist
-download_dir = "your file location here"
-os.makedirs(download_dir, exist_ok=True)
-
-# Configure Chrome options for downloads
-chrome_options = webdriver.ChromeOptions()
-prefs = {
-    "download.default_directory": download_dir,
-    "download.prompt_for_download": False,
-    "download.directory_upgrade": True,
-    "safebrowsing.enabled": True
+# regulations.gov documents whose comments are harvested, with the listing page to start from.
+# Each docket is written to its own partition, DOWNLOAD_ROOT/<docket>/ (e.g. .../NTIA-2023-0009/);
+# the stage scripts' DOCKETS setting selects partitions.
+DOCUMENTS = {
+    "NTIA-2023-0009-0001": 14,
 }
-chrome_options.add_experimental_option("prefs", prefs)
+DOWNLOAD_ROOT = "your file location here"
 
-# Initialize WebDriver with options
-driver = webdriver.Chrome(options=chrome_options)
+# Browsers open at the same time in total, and at most per docket. The browsers of one docket
+# split its listing pages (browser k of n takes pages start+k, start+k+n, ...), so a large docket
+# does not become the straggler while small ones finish early.
+MAX_BROWSERS = 6
+BROWSERS_PER_DOCKET = 2
 
-try:
-    driver.get("https://www.regulations.gov/document/NTIA-2023-0009-0001/comment?pageNumber=14")
-    logger.info("Successfully opened the target page")
-except Exception as e:
-    logger.error(f"Failed to open target page: {e}")
-    driver.quit()
-    exit()
+# Lean crawling profile: headless Chrome that skips images, fonts, stylesheets and analytics scripts,
+# returns from driver.get() at DOMContentLoaded ("eager"), opens comment pages in a second tab that is
+# reused (the listing tab is never reloaded), and waits for elements instead of fixed sleeps.
+# Set LEAN = False to watch a full browser with the original fixed delays.
+LEAN = True
+PAGE_LOAD_STRATEGY = "eager"
+BLOCKED_URL_PATTERNS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.webp", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*nr-data.net*", "*newrelic.com*",
+]
+# Seconds to let a comment page finish rendering its attachment list after its text appears
+DETAIL_SETTLE_SECONDS = 1
 
-# Wait for the page to load
-time.sleep(5)
+# Direct downloads: attachment URLs are handed, with the browser's cookies, to a pooled HTTP
+# downloader (downloader.py) that fetches DOWNLOAD_WORKERS files at once while the browsers keep
+# crawling. Files resume with Range requests, are length-checked and named by content hash; the
+# original names are listed in each partition's downloads.jsonl. False clicks the button and waits for Chrome.
+DIRECT_DOWNLOADS = True
+DOWNLOAD_WORKERS = 8
+DOWNLOADER = None  # created in main()
+
+# Register every saved document (docket, comment ID, original name, URL) in the corpus catalog in
+# DOWNLOAD_ROOT; `python catalog.py build DOWNLOAD_ROOT` then extracts their text and sizes.
+USE_CATALOG = True
+CATALOG = None  # created in main()
+
+def make_driver(download_dir):
+    """Starts a Chrome instance that saves downloads into download_dir."""
+    chrome_options = webdriver.ChromeOptions()
+    prefs = {
+        "download.default_directory": download_dir,
+        "download.prompt_for_download": False,
+        "download.directory_upgrade": True,
+        "safebrowsing.enabled": True
+    }
+    if LEAN:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--disable-extensions")
+        chrome_options.add_argument("--blink-settings=imagesEnabled=false")
+        chrome_options.page_load_strategy = PAGE_LOAD_STRATEGY
+        prefs["profile.managed_default_content_settings.images"] = 2
+        prefs["profile.managed_default_content_settings.fonts"] = 2
+    chrome_options.add_experimental_option("prefs", prefs)
+    driver = webdriver.Chrome(options=chrome_options)
+    if LEAN:
+        # Block non-essential requests at the network layer and allow downloads in headless mode
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+        driver.execute_cdp_cmd("Browser.setDownloadBehavior", {"behavior": "allow", "downloadPath": download_dir})
+    return driver
 
 # Function to save text as PDF
-def save_text_as_pdf(text, filename):
+def save_text_as_pdf(text, filename, download_dir):
     """
     Saves extracted text as a PDF file.
     """
@@ -68,117 +110,257 @@ def save_text_as_pdf(text, filename):
             c.showPage()
             c.setFont("Helvetica", 12)
             y_position = 750
-    
+
     c.save()
     logger.info(f"Text comment saved as PDF: {pdf_path}")
 
-# Scrape all cards and download files or text
-while True:
-    try:
-        # Wait for cards to be present
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, "card-type-comment"))
-        )
-        cards = driver.find_elements(By.CLASS_NAME, "card-type-comment")
-        logger.info(f"Found {len(cards)} cards on current page")
-        
-        for index, card in enumerate(cards, 1):
-            try:
-                link = card.find_element(By.TAG_NAME, "a").get_attribute('href')
-                card_name = card.find_element(By.TAG_NAME, "a").text
-                logger.info(f"Processing card {index}/{len(cards)}: {card_name}")
-                
-                driver.get(link)
-                time.sleep(5)
+def register(download_dir, file_name, link, original_name=None, source_url=None):
+    """Adds a saved file to the corpus catalog under its partition-relative name."""
+    if CATALOG:
+        partition = os.path.basename(download_dir)
+        CATALOG.register(f"{partition}/{file_name}", docket=partition, comment_id=link.rstrip('/').split('/')[-1],
+                         original_name=original_name or file_name, source_url=source_url or link)
 
-                # Check if a downloadable file exists
-                file_downloaded = False
+def comment_text(driver):
+    """The comment's on-page text (the <div class="px-2"> blocks), or "" if it has none."""
+    comment_divs = driver.find_elements(By.CLASS_NAME, "px-2")
+    return "\n\n".join(text for text in (div.text.strip() for div in comment_divs) if text)
 
-                try:
-                    download_btn = driver.find_element(By.CSS_SELECTOR, "a.btn.btn-default.btn-block[download]")
-                    download_url = download_btn.get_attribute('href')
-                    original_filename = download_url.split('/')[-1]
-
-                    logger.info(f"Downloading: {original_filename}")
-                    download_btn.click()
-                    time.sleep(2)
-
-                    # Wait for the file to appear in the download directory
-                    elapsed_time = 0
-                    max_wait_time = 50
-                    downloaded_file = None
-
-                    while elapsed_time < max_wait_time:
-                        files = glob.glob(os.path.join(download_dir, "*.pdf"))
-                        if files:
-                            downloaded_file = max(files, key=os.path.getctime)
-                            if downloaded_file.endswith(".pdf"):
-                                file_downloaded = True
-                                break
-                        time.sleep(5)
-                        elapsed_time += 5
-
-                    if downloaded_file:
-                        logger.info(f"File successfully downloaded: {downloaded_file}")
-                    else:
-                        logger.warning(f"Download failed for: {card_name}")
+def save_comment_text(text, card_name, link, download_dir):
+    """Saves a comment's on-page text as a PDF and registers it."""
+    pdf_filename = f"{card_name.replace(' ', '_')}.pdf"
+    save_text_as_pdf(text, pdf_filename, download_dir)
+    register(download_dir, pdf_filename, link)
 
-                except Exception as e:
-                    logger.warning(f"No downloadable file found: {e}")
+def process_comment(driver, link, card_name, download_dir, saved=None):
+    """
+    Downloads a comment's attachment, or saves its on-page text as a PDF. Returns True if a file was
+    saved or its download queued. saved() is called for every file actually written; for a queued
+    download that is when it completes, or when its text is saved instead because it failed.
+    """
+    saved = saved or (lambda: None)
+    driver.get(link)
+    if LEAN:
+        # The comment text or the attachment button shows the page has rendered
+        try:
+            WebDriverWait(driver, 15).until(EC.any_of(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "a.btn.btn-default.btn-block[download]")),
+                EC.presence_of_element_located((By.CLASS_NAME, "px-2")),
+            ))
+        except Exception:
+            logger.warning(f"Comment page did not render in time: {link}")
+        time.sleep(DETAIL_SETTLE_SECONDS)
+    else:
+        time.sleep(5)
+
+    # Check if a downloadable file exists
+    file_downloaded = False
+
+    try:
+        download_btn = driver.find_element(By.CSS_SELECTOR, "a.btn.btn-default.btn-block[download]")
+        download_url = download_btn.get_attribute('href')
+        original_filename = download_url.split('/')[-1]
+
+        if DOWNLOADER:
+            # Queue it and move on; the download overlaps with crawling the next comments. The page text
+            # is read now, while the browser is still on this comment, in case the download fails.
+            logger.info(f"Queued download: {original_filename}")
+            try:
+                fallback_text = comment_text(driver)
+            except Exception as e:
+                logger.warning(f"Could not read the comment text of {card_name}: {e}")
+                fallback_text = ""
 
-                # If no file was downloaded, extract and save text as PDF
-                if not file_downloaded:
+            def downloaded(future):
+                # Register the file under its content-hash name once it has arrived
+                if future.exception() is None:
+                    entry = future.result()
+                    register(download_dir, entry["file"], link, entry["original"], download_url)
+                    saved()
+                elif fallback_text:
+                    logger.warning(f"Download failed for {card_name} ({future.exception()}); saving its text instead")
                     try:
-                        # Locate the text inside <div class="px-2">
-                        comment_divs = driver.find_elements(By.CLASS_NAME, "px-2")
+                        save_comment_text(fallback_text, card_name, link, download_dir)
+                        saved()
+                    except Exception as e:
+                        logger.error(f"Error saving text of {card_name}: {e}")
+                else:
+                    logger.warning(f"Download failed for {card_name} and it has no text to save: {future.exception()}")
 
-                        # Extract text
-                        comment_texts = [div.text.strip() for div in comment_divs if div.text.strip()]
-                        
-                        if comment_texts:
-                            full_comment_text = "\n\n".join(comment_texts)
-                            pdf_filename = f"{card_name.replace(' ', '_')}.pdf"
+            DOWNLOADER.submit(download_url, download_dir).add_done_callback(downloaded)
+            return True
 
-                            # Save the text as a PDF
-                            save_text_as_pdf(full_comment_text, pdf_filename)
+        logger.info(f"Downloading: {original_filename}")
+        download_btn.click()
 
-                        else:
-                            logger.warning("No text found in the comment section.")
+        # Wait for this file to appear in the partition (other browsers may be downloading into it too)
+        poll_seconds = 0.5 if LEAN else 5
+        deadline = time.time() + 50
+        downloaded_file = os.path.join(download_dir, original_filename)
 
-                    except Exception as e:
-                        logger.error(f"Error extracting text: {e}")
+        while time.time() < deadline:
+            if os.path.exists(downloaded_file):
+                file_downloaded = True
+                break
+            time.sleep(poll_seconds)
 
-                driver.back()
-                time.sleep(5)
-            except Exception as e:
-                logger.error(f"Error processing card {index}: {e}")
-                continue
+        if file_downloaded:
+            logger.info(f"File successfully downloaded: {downloaded_file}")
+            register(download_dir, original_filename, link, source_url=download_url)
+            saved()
+        else:
+            logger.warning(f"Download failed for: {card_name}")
 
-        # Check for next page
+    except Exception as e:
+        logger.warning(f"No downloadable file found: {e}")
+
+    # If no file was downloaded, extract and save text as PDF
+    if not file_downloaded:
         try:
-            # Re-fetch next button dynamically to avoid stale element issues
-            next_button = WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, "button[aria-label='Next page']"))
-            )
-
-            # Ensure button is visible and enabled
-            if next_button.is_displayed() and next_button.is_enabled():
-                logger.info("Moving to next page")
-                driver.execute_script("arguments[0].scrollIntoView();", next_button)
-                time.sleep(1)
-                driver.execute_script("arguments[0].click();", next_button)  # Use JavaScript click
-                time.sleep(5)
-            else:
-                logger.info("Next page button is disabled. Scraping complete.")
-                break
+            # Locate the text inside <div class="px-2"> and save it as a PDF
+            full_comment_text = comment_text(driver)
+            if full_comment_text:
+                save_comment_text(full_comment_text, card_name, link, download_dir)
+                saved()
+                return True
+            logger.warning("No text found in the comment section.")
 
         except Exception as e:
-            logger.info("No next page button found or reached the last page. Scraping complete.")
-            break
+            logger.error(f"Error extracting text: {e}")
+    return file_downloaded
 
-    except Exception as e:
-        logger.error(f"Error during scraping: {e}")
-        break
+def crawl_shard(document_id, start_page, shard, shards):
+    """
+    Crawls every shards-th listing page of one docket document, starting at start_page + shard,
+    into the docket's partition.
+
+    Returns:
+        dict: Counts of listing pages, comments processed and files saved, and the seconds taken.
+            Queued downloads add to "saved" as they complete, after this returns.
+    """
+    download_dir = os.path.join(DOWNLOAD_ROOT, docket_id(document_id))
+    os.makedirs(download_dir, exist_ok=True)
+    threading.current_thread().name = f"{docket_id(document_id)}#{shard}"
+    stats = {"pages": 0, "comments": 0, "saved": 0, "seconds": 0.0}
+    stats_lock = threading.Lock()
+
+    def saved():
+        # Also called from the downloader's threads
+        with stats_lock:
+            stats["saved"] += 1
+
+    started = time.time()
+    driver = make_driver(download_dir)
+    try:
+        listing_tab = driver.current_window_handle
+        detail_tab = None
+        if LEAN:
+            # Comment pages load in a second tab, so the listing is never navigated away from
+            driver.switch_to.new_window("tab")
+            detail_tab = driver.current_window_handle
+            driver.switch_to.window(listing_tab)
+        page = start_page + shard
+        while True:
+            try:
+                driver.switch_to.window(listing_tab)
+                driver.get(f"https://www.regulations.gov/document/{document_id}/comment?pageNumber={page}")
+                # Wait for cards to be present; a page past the end has none
+                WebDriverWait(driver, 10).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, "card-type-comment"))
+                )
+            except Exception:
+                logger.info(f"No comments on page {page}. Shard complete.")
+                break
+            if DOWNLOADER and stats["pages"] == 0:
+                # Downloads reuse this browser's session (cookies and user agent)
+                DOWNLOADER.session.headers["User-Agent"] = driver.execute_script("return navigator.userAgent")
+                DOWNLOADER.set_cookies(driver.get_cookies())
+            cards = driver.find_elements(By.CLASS_NAME, "card-type-comment")
+            logger.info(f"Found {len(cards)} cards on page {page}")
+            # Read every link first; the card elements go stale once the browser leaves the listing
+            comments = []
+            for card in cards:
+                try:
+                    anchor = card.find_element(By.TAG_NAME, "a")
+                    comments.append((anchor.get_attribute('href'), anchor.text))
+                except Exception as e:
+                    logger.error(f"Error reading card: {e}")
+            try:
+                next_button = driver.find_element(By.CSS_SELECTOR, "button[aria-label='Next page']")
+                last_page = not (next_button.is_displayed() and next_button.is_enabled())
+            except Exception:
+                last_page = True
+
+            if detail_tab:
+                driver.switch_to.window(detail_tab)
+            for index, (link, card_name) in enumerate(comments, 1):
+                try:
+                    logger.info(f"Processing card {index}/{len(comments)} on page {page}: {card_name}")
+                    process_comment(driver, link, card_name, download_dir, saved)
+                    stats["comments"] += 1
+                except Exception as e:
+                    logger.error(f"Error processing card {index}: {e}")
+                    continue
+            stats["pages"] += 1
+
+            minutes = (time.time() - started) / 60
+            logger.info(f"{stats['pages']} listing pages and {stats['comments']} comment pages in {minutes:.1f} min "
+                        f"({(stats['pages'] + stats['comments']) / minutes:.1f} pages/min)")
+
+            if last_page:
+                logger.info("Reached the last page. Shard complete.")
+                break
+            page += shards
+    finally:
+        driver.quit()
+        stats["seconds"] = time.time() - started
+    return stats
+
+def main():
+    global DOWNLOADER, CATALOG
+    start = time.time()
+    if USE_CATALOG:
+        os.makedirs(DOWNLOAD_ROOT, exist_ok=True)
+        CATALOG = CorpusCatalog(catalog_path(DOWNLOAD_ROOT))
+    if DIRECT_DOWNLOADS:
+        DOWNLOADER = AttachmentDownloader(workers=DOWNLOAD_WORKERS)
+    # One task per (docket, shard); the pool bounds the number of browsers open at once
+    tasks = [(document_id, start_page, shard, BROWSERS_PER_DOCKET)
+             for document_id, start_page in DOCUMENTS.items() for shard in range(BROWSERS_PER_DOCKET)]
+    shard_stats = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_BROWSERS) as executor:
+        future_to_task = {executor.submit(crawl_shard, *task): task for task in tasks}
+        for future in concurrent.futures.as_completed(future_to_task):
+            document_id, _, shard, _ = future_to_task[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                logger.error(f"Shard {shard} of {document_id} failed: {e}")
+                continue
+            shard_stats.append((document_id, stats))
+
+    if DOWNLOADER:
+        logger.info("Crawling finished; waiting for queued downloads.")
+        for url, error in DOWNLOADER.wait():
+            logger.warning(f"Download failed for {url}: {error}")
+        DOWNLOADER.close()
+        logger.info(DOWNLOADER.summary())
+
+    # Summed only now: queued downloads count as saved when they complete
+    totals = {}
+    for document_id, stats in shard_stats:
+        docket = totals.setdefault(docket_id(document_id), {"pages": 0, "comments": 0, "saved": 0, "seconds": 0.0})
+        for key, value in stats.items():
+            docket[key] += value
+    for docket, stats in sorted(totals.items()):
+        # Browser-minutes across the docket's shards, so the rate compares lean and full mode per browser
+        rate = (stats['pages'] + stats['comments']) / max(stats['seconds'] / 60, 1e-9)
+        logger.info(f"{docket}: {stats['pages']} pages, {stats['comments']} comments, {stats['saved']} files saved "
+                    f"to {os.path.join(DOWNLOAD_ROOT, docket)} ({rate:.1f} pages/min per browser)")
+    elapsed = time.time() - start
+    pages = sum(stats['pages'] + stats['comments'] for stats in totals.values())
+    logger.info(f"Scraping completed in {elapsed:.0f} seconds ({pages / max(elapsed / 60, 1e-9):.1f} pages/min overall, "
+                f"{'lean' if LEAN else 'full'} browser mode).")
 
-logger.info("Scraping completed. Closing browser.")
-driver.quit()
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,48 @@
 import os
-import fitz  # PyMuPDF
+from pdf_extract import extract_pages  # PyMuPDF, parallel for large PDFs
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
 import pandas as pd
 import concurrent.futures
 import time
+import json
 from tqdm import tqdm  # For progress tracking
+from packing import pack_documents, packed_question, answer_packs, is_text_answer
+from incremental import TEXT_HASH_COLUMN, MODEL_COLUMN, short_hash, prompt_hash_column, load_previous, reusable
+from model_routing import route, routed_calls
+from scheduler import SizeScheduler, document_sizes
+
+# Packing: short comments are sent several at a time in one request (each with a delimited ID)
+# instead of paying a full round trip and instruction prompt per document.
+PACKING = False
+PACK_TOKEN_BUDGET = 12000
+PACK_MAX_DOC_TOKENS = 1500
+
+# Default model. With MODEL_ROUTING the rules in model_routing.py may pick another model (and reasoning
+# effort / output cap) per document; the model that served the row is recorded in the "Model" column.
+# Packed requests always use MODEL; documents sent alone are routed like in process_pdf.
+MODEL = "o3-mini"
+# Sent ahead of every question (DualProviderRun.py sends the same one)
+SYSTEM_MESSAGE = "You are an AI assistant analyzing text."
+
+# Incremental mode: reuse the previous output's answer for every document whose text, prompt file and
+# model are unchanged; only new or changed documents are sent to the model (not used with PACKING).
+INCREMENTAL = True
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
 
 # Set up OpenAI API Key (Ensure to store securely)
 OPENAI_API_KEY = "your key here"  # Replace with your own API key
@@ -13,18 +52,20 @@ try:
     # For newer versions of the openai package (>=1.0.0)
     from openai import OpenAI
     
-    def analyze_text_with_openai(text, question):
+    @tracing.traced("model_call", text_args=("text", "question"))
+    def analyze_text_with_openai(text, question, model=MODEL, options=None):
         """Send text to the OpenAI GPT model with a specific question using new client."""
         prompt = f"{question}\n\n{text}"
 
         try:
             client = OpenAI(api_key=OPENAI_API_KEY)  # Create OpenAI client instance
             response = client.chat.completions.create(
-                model="o3-mini",  # Change to "gpt-4-turbo" if needed
+                model=model,  # Change MODEL to "gpt-4-turbo" if needed
                 messages=[
-                    {"role": "system", "content": "You are an AI assistant analyzing text."},
+                    {"role": "system", "content": SYSTEM_MESSAGE},
                     {"role": "user", "content": prompt}
-                ]
+                ],
+                **(options or {})
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
@@ -35,31 +76,33 @@ except (ImportError, AttributeError):
     # For older versions of the openai package (<1.0.0)
     import openai
     
-    def analyze_text_with_openai(text, question):
+    @tracing.traced("model_call", text_args=("text", "question"))
+    def analyze_text_with_openai(text, question, model=MODEL, options=None):
         """Send text to the OpenAI GPT model with a specific question using legacy client."""
         prompt = f"{question}\n\n{text}"
 
         try:
             openai.api_key = OPENAI_API_KEY
             response = openai.ChatCompletion.create(
-                model="o3-mini",  # Change to "gpt-4-turbo" if needed
+                model=model,  # Change MODEL to "gpt-4-turbo" if needed
                 messages=[
-                    {"role": "system", "content": "You are an AI assistant analyzing text."},
+                    {"role": "system", "content": SYSTEM_MESSAGE},
                     {"role": "user", "content": prompt}
-                ]
+                ],
+                **(options or {})
             )
             return response.choices[0].message.content.strip()
         except Exception as e:
             print(f"Error analyzing text with OpenAI: {e}")
             return None
 
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file."""
     text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text("text") + "\n"
+        # Large PDFs are split into page ranges and parsed across a process pool
+        text = "".join(page + "\n" for page in extract_pages(pdf_path))
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
@@ -73,15 +116,68 @@ def read_prompt_from_file(prompt_file):
         print(f"Error: Prompt file '{prompt_file}' not found.")
         return None
 
-def process_pdf(pdf_path, question):
-    """Process a single PDF file and return its analysis results."""
-    pdf_name = os.path.basename(pdf_path)
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf_path, question, previous=None, stats=None, pdf_name=None):
+    """Process a single PDF file and return its analysis results, reusing an unchanged previous answer."""
+    pdf_name = pdf_name or os.path.basename(pdf_path)  # docket partition files are named "<docket>/<file>.pdf"
     text = extract_text_from_pdf(pdf_path)
     if text:
-        response = analyze_text_with_openai(text, question)
-        return {"PDF File": pdf_name, "Response": response}
+        text_digest, prompt_digest = short_hash(text), short_hash(question)
+        model, options = route("sentiment", "openai", text, "score", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+        if reusable(previous, "Response", prompt_digest, text_digest, model):
+            response = previous["Response"]
+            if stats is not None:
+                stats.append("reused")
+        else:
+            response = analyze_text_with_openai(text, question, model, options)
+            if stats is not None:
+                stats.append("called")
+        return {"PDF File": pdf_name, "Response": response,
+                TEXT_HASH_COLUMN: text_digest, MODEL_COLUMN: model, prompt_hash_column(): prompt_digest}
     return {"PDF File": pdf_name, "Response": None}
 
+def process_packed(documents_path, pdf_files, question):
+    """Extract every PDF, answer short documents in packed requests and long ones alone."""
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        paths = [os.path.join(documents_path, pdf) for pdf in pdf_files]
+        texts = dict(zip(pdf_files, executor.map(extract_text_from_pdf, paths)))
+    results = [{"PDF File": pdf, "Response": None} for pdf, text in texts.items() if not text]
+    documents = {pdf: text for pdf, text in texts.items() if text}
+    packs, singles = pack_documents(documents, PACK_TOKEN_BUDGET, PACK_MAX_DOC_TOKENS)
+
+    pack_question = packed_question(question, "your answer for that document, as a string")
+    routed = lambda text: route("sentiment", "openai", text, "score", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    call_packed = lambda block: analyze_text_with_openai(block, pack_question)
+    call_single = lambda text: analyze_text_with_openai(text, question, *routed(text))
+
+    def row(pdf, answer, packed):
+        # Split the packed answer back into one row per document, with the columns process_pdf writes;
+        # the prompt hash of a packed answer is the packed question's, so it is never reused as a single answer
+        response = answer if answer is None or isinstance(answer, str) else json.dumps(answer)
+        return {"PDF File": pdf, "Response": response, TEXT_HASH_COLUMN: short_hash(documents[pdf]),
+                MODEL_COLUMN: MODEL if packed else routed(documents[pdf])[0],
+                prompt_hash_column(): short_hash(pack_question if packed else question)}
+
+    rerun_count = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        # Packs and long documents are submitted largest first within MODEL's rate limits
+        scheduler = SizeScheduler.for_model(MODEL) if SCHEDULE else SizeScheduler()
+        work = answer_packs(executor, scheduler, documents, packs, singles, call_packed, call_single, is_text_answer)
+        for names, future in tqdm(work, total=len(packs) + len(singles), desc="Processing packs"):
+            try:
+                answers, rerun = future.result()
+            except Exception as exc:
+                # Keep every document of the pack in the output with no answer, for RepairRun to re-run
+                print(f"Packed request for {len(names)} documents generated an exception: {exc}")
+                answers, rerun = dict.fromkeys(names), []
+            rerun_count += len(rerun)
+            for pdf, answer in answers.items():
+                results.append(row(pdf, answer, len(names) > 1 and pdf not in rerun))
+
+    print(f"{len(packs)} packed requests covered {sum(len(pack) for pack in packs)} documents; "
+          f"{len(singles)} sent alone; {rerun_count} re-run after a missing answer")
+    return results
+
 def main():
     start_time = time.time()
     documents_path = os.path.expanduser("your file location here")
@@ -90,7 +186,7 @@ def main():
     # Ensure the output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    pdf_files = [f for f in os.listdir(documents_path) if f.endswith(".pdf")]
+    pdf_files = select_documents(documents_path, "sentiment", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     
     prompt_file = "your text file location here"
     question = read_prompt_from_file(prompt_file)
@@ -101,33 +197,53 @@ def main():
 
     results = []
     total_files = len(pdf_files)
+    # Previous answers by document; empty when incremental mode is off or there is no earlier output
+    previous = load_previous(output_path, "PDF File") if INCREMENTAL and not PACKING else {}
+    stats = []  # "called" or "reused" per document
+    if planner.PLAN:
+        # ThreadPoolExecutor() default: min(32, CPUs + 4) threads
+        planner.print_plan("sentiment", "openai", MODEL, documents_path, pdf_files, [planner.Call(question, "score", "Response")],
+                           min(32, (os.cpu_count() or 1) + 4), MODEL_ROUTING, previous)
+        return
     
     print(f"Processing {total_files} PDF files in parallel...")
     
-    # Using ThreadPoolExecutor for I/O bound operations (PDF reading, API calls)
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Create a list of futures
-        future_to_pdf = {
-            executor.submit(process_pdf, os.path.join(documents_path, pdf), question): pdf 
-            for pdf in pdf_files
-        }
+    if PACKING:
+        results = process_packed(documents_path, pdf_files, question)
+    else:
+        # Using ThreadPoolExecutor for I/O bound operations (PDF reading, API calls)
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            # Submit the documents largest first within the rate limits
+            scheduler = SizeScheduler.for_routing(routed_calls("sentiment", "openai", ["score"], MODEL, MODEL_ROUTING)) if SCHEDULE else SizeScheduler()
+            sizes = document_sizes(documents_path, pdf_files) if SCHEDULE else {}
+            process = lambda pdf: process_pdf(os.path.join(documents_path, pdf), question, previous.get(pdf), stats, pdf)
         
-        # Process as they complete
-        for future in tqdm(concurrent.futures.as_completed(future_to_pdf), total=total_files, desc="Processing PDFs"):
-            pdf = future_to_pdf[future]
-            try:
-                result = future.result()
-                if result:
-                    results.append(result)
-            except Exception as exc:
-                print(f"{pdf} generated an exception: {exc}")
+            # Process as they complete
+            for pdf, future in tqdm(scheduler.run(executor, process, pdf_files, sizes), total=total_files, desc="Processing PDFs"):
+                try:
+                    result = future.result()
+                    if result:
+                        results.append(result)
+                except Exception as exc:
+                    print(f"{pdf} generated an exception: {exc}")
     
     df = pd.DataFrame(results)
-    df.to_csv(output_path, index=False)
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(documents_path, "sentiment", df.to_dict("records"), "PDF File")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_path, df, "PDF File")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_path, index=False)
     
     elapsed_time = time.time() - start_time
     print(f"Results saved to {output_path}")
+    if previous:
+        print(f"Model calls: {stats.count('called')}; answers reused from the previous output: {stats.count('reused')}")
     print(f"Total processing time: {elapsed_time:.2f} seconds")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
+    main()
+    tracing.finish()
\ No newline at end of file
@@ -1,11 +1,37 @@
 import os
-import fitz  # PyMuPDF
+import json
+from pdf_extract import extract_pages  # PyMuPDF, parallel for large PDFs
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
 import pandas as pd
 import google.generativeai as genai
 import concurrent.futures
 from functools import partial
 from absl import app
 from absl import logging
+from packing import pack_documents, packed_question, answer_packs, is_text_answer
+from incremental import TEXT_HASH_COLUMN, MODEL_COLUMN, short_hash, prompt_hash_column, load_previous, reusable
+from model_routing import route, routed_calls
+from scheduler import SizeScheduler, document_sizes
+
+# Send short comments several at a time in one request, each with a delimited ID
+PACKING = False
+PACK_TOKEN_BUDGET = 12000
+PACK_MAX_DOC_TOKENS = 1500
+
+# Default model. With MODEL_ROUTING the rules in model_routing.py may pick another model (and reasoning
+# effort / output cap) per document; the model that served the row is recorded in the "Model" column.
+# Packed requests always use MODEL; documents sent alone are routed like in process_pdf.
+MODEL = "gemini-2.0-flash"
+
+# Incremental mode: reuse the previous output's answer for every document whose text, prompt file and
+# model are unchanged; only new or changed documents are sent to the model (not used with PACKING).
+INCREMENTAL = True
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
 
 # Initialize Abseil logging
 logging.set_verbosity(logging.INFO)
@@ -14,13 +40,23 @@ logging.set_verbosity(logging.INFO)
 GENAI_API_KEY = "yourkeyhere"  # Load API key from environment variable
 genai.configure(api_key=GENAI_API_KEY)
 
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """Extract text from a PDF file."""
     text = ""
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                text += page.get_text("text") + "\n"
+        # Large PDFs are split into page ranges and parsed across a process pool
+        text = "".join(page + "\n" for page in extract_pages(pdf_path))
     except Exception as e:
         logging.error(f"Error extracting text from {pdf_path}: {e}")
     return text
@@ -34,29 +70,83 @@ def read_prompt_from_file(prompt_file):
         logging.error(f"Error: Prompt file '{prompt_file}' not found.")
         return None
 
-def analyze_text_with_gemini(text, question):
+@tracing.traced("model_call", text_args=("text", "question"))
+def analyze_text_with_gemini(text, question, model=MODEL, options=None):
     """Send text to the Gemini model with a specific question."""
-    model = genai.GenerativeModel("gemini-2.0-flash")
+    gemini_model = genai.GenerativeModel(model)
     prompt = f"{question}\n\n{text}"
     
     try:
-        response = model.generate_content(prompt)
+        response = gemini_model.generate_content(prompt, **(options or {}))
         return response.text.strip()
     except Exception as e:
         logging.error(f"Error analyzing text with Gemini: {e}")
         return None
 
-def process_pdf(pdf, documents_path, question):
-    """Process a single PDF file."""
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf, documents_path, question, previous=None, stats=None):
+    """Process a single PDF file, reusing an unchanged previous answer."""
     pdf_path = os.path.join(documents_path, pdf)
     text = extract_text_from_pdf(pdf_path)
     if text:
         analysis_results = {"PDF File": pdf}
-        response = analyze_text_with_gemini(text, question)
+        text_digest, prompt_digest = short_hash(text), short_hash(question)
+        model, options = route("sentiment", "gemini", text, "score", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+        if reusable(previous, "Response", prompt_digest, text_digest, model):
+            response = previous["Response"]
+            if stats is not None:
+                stats.append("reused")
+        else:
+            response = analyze_text_with_gemini(text, question, model, options)
+            if stats is not None:
+                stats.append("called")
         analysis_results["Response"] = response
+        analysis_results.update({TEXT_HASH_COLUMN: text_digest, MODEL_COLUMN: model, prompt_hash_column(): prompt_digest})
         return analysis_results
     return None
 
+def process_packed(documents_path, pdf_files, question):
+    """Extract every PDF, answer short documents in packed requests and long ones alone."""
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        paths = [os.path.join(documents_path, pdf) for pdf in pdf_files]
+        texts = dict(zip(pdf_files, executor.map(extract_text_from_pdf, paths)))
+    documents = {pdf: text for pdf, text in texts.items() if text}
+    packs, singles = pack_documents(documents, PACK_TOKEN_BUDGET, PACK_MAX_DOC_TOKENS)
+
+    pack_question = packed_question(question, "your answer for that document, as a string")
+    routed = lambda text: route("sentiment", "gemini", text, "score", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    call_packed = lambda block: analyze_text_with_gemini(block, pack_question)
+    call_single = lambda text: analyze_text_with_gemini(text, question, *routed(text))
+
+    def row(pdf, answer, packed):
+        # Split the packed answer back into one row per document, with the columns process_pdf writes;
+        # the prompt hash of a packed answer is the packed question's, so it is never reused as a single answer
+        response = answer if answer is None or isinstance(answer, str) else json.dumps(answer)
+        return {"PDF File": pdf, "Response": response, TEXT_HASH_COLUMN: short_hash(documents[pdf]),
+                MODEL_COLUMN: MODEL if packed else routed(documents[pdf])[0],
+                prompt_hash_column(): short_hash(pack_question if packed else question)}
+
+    results = []
+    rerun_count = 0
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        # Packs and long documents are submitted largest first within MODEL's rate limits
+        scheduler = SizeScheduler.for_model(MODEL) if SCHEDULE else SizeScheduler()
+        work = answer_packs(executor, scheduler, documents, packs, singles, call_packed, call_single, is_text_answer)
+        for names, future in work:
+            try:
+                answers, rerun = future.result()
+            except Exception as exc:
+                # Keep every document of the pack in the output with no answer, for RepairRun to re-run
+                logging.error(f"Packed request for {len(names)} documents generated an exception: {exc}")
+                answers, rerun = dict.fromkeys(names), []
+            rerun_count += len(rerun)
+            for pdf, answer in answers.items():
+                results.append(row(pdf, answer, len(names) > 1 and pdf not in rerun))
+
+    logging.info(f"{len(packs)} packed requests covered {sum(len(pack) for pack in packs)} documents; "
+                 f"{len(singles)} sent alone; {rerun_count} re-run after a missing answer")
+    return results
+
 def main(_):
     documents_path = os.path.expanduser("path to your file")
     output_path = os.path.expanduser("path to your file")
@@ -64,7 +154,7 @@ def main(_):
     # Ensure the output directory exists
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
 
-    pdf_files = [f for f in os.listdir(documents_path) if f.endswith(".pdf")]
+    pdf_files = select_documents(documents_path, "sentiment", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     
     prompt_file = "path to your prompt"  # Path to the text file containing the prompt
     question = read_prompt_from_file(prompt_file)
@@ -74,20 +164,47 @@ def main(_):
         return
 
     results = []
+    # Previous answers by document; empty when incremental mode is off or there is no earlier output
+    previous = load_previous(output_path, "PDF File") if INCREMENTAL and not PACKING else {}
+    stats = []  # "called" or "reused" per document
+    if planner.PLAN:
+        # ThreadPoolExecutor() default: min(32, CPUs + 4) threads
+        planner.print_plan("sentiment", "gemini", MODEL, documents_path, pdf_files, [planner.Call(question, "score", "Response")],
+                           min(32, (os.cpu_count() or 1) + 4), MODEL_ROUTING, previous)
+        return
     
-    # Use ThreadPoolExecutor for parallel processing
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Create a partial function with the fixed arguments
-        process_func = partial(process_pdf, documents_path=documents_path, question=question)
-        
-        # Process PDFs in parallel
-        for result in executor.map(process_func, pdf_files):
-            if result:
-                results.append(result)
+    if PACKING:
+        results = process_packed(documents_path, pdf_files, question)
+    else:
+        # Use ThreadPoolExecutor for parallel processing
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            # Create a partial function with the fixed arguments
+            process_func = partial(process_pdf, documents_path=documents_path, question=question, stats=stats)
+            
+            # Process PDFs in parallel, largest first within the rate limits
+            scheduler = SizeScheduler.for_routing(routed_calls("sentiment", "gemini", ["score"], MODEL, MODEL_ROUTING)) if SCHEDULE else SizeScheduler()
+            sizes = document_sizes(documents_path, pdf_files) if SCHEDULE else {}
+            for _, future in scheduler.run(executor, lambda pdf: process_func(pdf, previous=previous.get(pdf)), pdf_files, sizes):
+                result = future.result()
+                if result:
+                    results.append(result)
     
     df = pd.DataFrame(results)
-    df.to_csv(output_path, index=False)
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(documents_path, "sentiment", df.to_dict("records"), "PDF File")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_path, df, "PDF File")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_path, index=False)
     logging.info(f"Results saved to {output_path}")
+    if previous:
+        logging.info(f"Model calls: {stats.count('called')}; answers reused from the previous output: {stats.count('reused')}")
+    # app.run() exits the process when main returns, so the trace is written here
+    tracing.finish()
 
 if __name__ == "__main__":
+    # --profile is removed from argv before absl parses the flags
+    tracing.profile_from_argv()
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
     app.run(main)
\ No newline at end of file
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import argparse
+import pandas as pd
+from percent_schema import PERCENT_CATEGORIES
+from incremental import short_hash
+from partitions import docket_of
+try:
+    import pyarrow.feather as feather  # Arrow IPC cache files, read back memory-mapped
+except ImportError:
+    feather = None
+
+# Stage outputs the thesis figures are computed from (override with --percent, --organization, ...)
+OUTPUTS = {
+    "organization": "org_meta.csv",
+    "sentiment": "sentiment.csv",
+    "advocacy": "advocacy.csv",
+    "percent": "percent.csv",
+}
+# Column that identifies the document in each stage's output (as in RepairRun.KEY_COLUMNS)
+KEY_COLUMNS = {"organization": "PDF File", "sentiment": "PDF File", "advocacy": "PDF File", "percent": "Filename"}
+# Advocacy is scored for every % content topic except "Other"
+ADVOCACY_CATEGORIES = [category for category in PERCENT_CATEGORIES if category != "Other"]
+SENTIMENT_CLASSES = ["Pro", "Neutral", "De-Reg"]
+ADVOCACY_SCORE_RE = r"(?i)^\W*(?:score\W*)?(10|\d)\b"
+FIGURES_DIR = "figures"
+CACHE_DIR = ".analytics_cache"
+# Part of every cache key; bump it when _normalize changes how outputs are parsed
+PARSER_VERSION = 2
+
+def fingerprint(path):
+    """Changes whenever the file is rewritten (size and modification time) or the parser changes."""
+    stat = os.stat(path)
+    return f"v{PARSER_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+
+def _cache_file(cache_dir, name):
+    return os.path.join(cache_dir, name + (".arrow" if feather else ".pkl"))
+
+def _write_frame(df, path):
+    if feather:
+        feather.write_feather(df, path, compression="uncompressed")  # uncompressed so it can be memory-mapped
+    else:
+        df.to_pickle(path)
+
+def _read_frame(path):
+    if feather:
+        return feather.read_table(path, memory_map=True).to_pandas()
+    return pd.read_pickle(path)
+
+def _normalize(stage, df):
+    """One row per document: "Document" and "Docket" plus the stage's columns as analysis types."""
+    key = KEY_COLUMNS[stage]
+    df = df.drop_duplicates(key, keep="last").rename(columns={key: "Document"})
+    if stage == "organization":
+        df = df[["Document", "Org Title", "Org Category", "Industry", "Main Function"]]
+        for column in ["Org Category", "Industry", "Main Function"]:
+            df[column] = df[column].fillna("N/A").astype("category")
+    elif stage == "sentiment":
+        # The answer is free text; its class is the first Pro / Neutral / De-Reg it names
+        sentiment = df["Response"].astype("string").str.extract(r"(?i)\b(pro(?![a-z])|neutral|de-?\s?reg)", expand=False).str.lower()
+        sentiment = sentiment.str.replace(r"[-\s]", "", regex=True).map({"pro": "Pro", "neutral": "Neutral", "dereg": "De-Reg"})
+        df = pd.DataFrame({"Document": df["Document"], "Sentiment": pd.Categorical(sentiment, categories=SENTIMENT_CLASSES)})
+    elif stage == "advocacy":
+        # Each category answer starts with its 0-10 score ("7 - ...", "Score: 7"); a digit later in the
+        # answer ("Section 2 ...", "on a 0-10 scale") is not the score
+        scores = {}
+        for category in ADVOCACY_CATEGORIES:
+            if category in df.columns:
+                answers = df[category].astype("string")
+                scores[category] = pd.to_numeric(answers.str.extract(ADVOCACY_SCORE_RE, expand=False), errors="coerce")
+                unparsed = int((answers.notna() & scores[category].isna()).sum())
+                if unparsed:
+                    print(f"Advocacy {category}: {unparsed} of {int(answers.notna().sum())} answers do not start with "
+                          f"a 0-10 score and are left out of the averages")
+        df = pd.DataFrame({"Document": df["Document"], **{f"Advocacy {category}": values for category, values in scores.items()}})
+    elif stage == "percent":
+        if "Status" in df.columns:
+            df = df[df["Status"] != "failed"]
+        df = pd.DataFrame({"Document": df["Document"],
+                           **{category: pd.to_numeric(df[category], errors="coerce") for category in PERCENT_CATEGORIES}})
+    df["Docket"] = df["Document"].map(docket_of).fillna("").astype("category")
+    return df.reset_index(drop=True)
+
+class Analytics:
+    """
+    Loads the stage outputs and computes the thesis cross-tabs.
+
+    Every stage output is parsed once into a typed, columnar cache file (Arrow, memory-mapped, when
+    pyarrow is installed) keyed by the output's fingerprint, and every figure is cached with the
+    fingerprints of the outputs it reads. After a partial re-run only the changed stage is re-parsed,
+    and only the figures that depend on it are recomputed.
+    """
+
+    def __init__(self, outputs, cache_dir=CACHE_DIR):
+        self.outputs = {stage: path for stage, path in outputs.items() if path and os.path.exists(path)}
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+        self._manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.manifest = {}
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path, "r", encoding="utf-8") as file:
+                self.manifest = json.load(file)
+        self._frames = {}
+        self.stats = {"parsed": [], "figures_computed": [], "figures_cached": []}
+
+    def _save_manifest(self):
+        with open(self._manifest_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(self.manifest, file, indent=1)
+        os.replace(self._manifest_path + ".tmp", self._manifest_path)
+
+    def stage(self, stage):
+        """The normalized output of one stage, re-parsed only if the output file changed."""
+        if stage not in self._frames:
+            path = self.outputs[stage]
+            cache_path = _cache_file(self.cache_dir, f"stage_{stage}")
+            key = f"stage:{stage}"
+            if self.manifest.get(key) == fingerprint(path) and os.path.exists(cache_path):
+                df = _read_frame(cache_path)
+            else:
+                raw = pd.read_csv(path, keep_default_na=False, na_values=[""]) if path.lower().endswith(".csv") \
+                    else pd.read_excel(path, keep_default_na=False, na_values=[""])
+                df = _normalize(stage, raw)
+                _write_frame(df, cache_path)
+                self.manifest[key] = fingerprint(path)
+                self._save_manifest()
+                self.stats["parsed"].append(stage)
+            self._frames[stage] = df
+        return self._frames[stage]
+
+    def merged(self, stages):
+        """Inner join of the given stages on Document."""
+        df = self.stage(stages[0])
+        for stage in stages[1:]:
+            df = df.merge(self.stage(stage).drop(columns="Docket"), on="Document", how="inner")
+        return df
+
+    def figure(self, name):
+        """One figure's table, from the cache unless a stage output it reads has changed."""
+        stages, compute = FIGURES[name]
+        missing = [stage for stage in stages if stage not in self.outputs]
+        if missing:
+            return None
+        key = f"figure:{name}"
+        digest = short_hash(json.dumps([fingerprint(self.outputs[stage]) for stage in stages]))
+        cache_path = _cache_file(self.cache_dir, f"figure_{name}")
+        if self.manifest.get(key) == digest and os.path.exists(cache_path):
+            self.stats["figures_cached"].append(name)
+            return _read_frame(cache_path)
+        table = compute(self)
+        _write_frame(table.reset_index(), cache_path)
+        self.manifest[key] = digest
+        self._save_manifest()
+        self.stats["figures_computed"].append(name)
+        return table.reset_index()
+
+def topic_by_group(analytics, column):
+    df = analytics.merged(["percent", "organization"])
+    table = df.groupby(column, observed=True)[PERCENT_CATEGORIES].mean().round(2)
+    table.insert(0, "Documents", df.groupby(column, observed=True).size())
+    return table.sort_values("Documents", ascending=False)
+
+def advocacy_by_sentiment(analytics):
+    df = analytics.merged(["advocacy", "sentiment"])
+    columns = [column for column in df.columns if column.startswith("Advocacy ")]
+    table = df.groupby("Sentiment", observed=True)[columns].mean().round(2)
+    table.insert(0, "Documents", df.groupby("Sentiment", observed=True).size())
+    return table
+
+def sentiment_by_org_category(analytics):
+    df = analytics.merged(["sentiment", "organization"])
+    return pd.crosstab(df["Org Category"], df["Sentiment"], normalize="index").mul(100).round(1)
+
+def corpus_topic_shares(analytics):
+    df = analytics.stage("percent")
+    dockets = df["Docket"].astype(str).replace("", "(no docket)")
+    table = df.groupby(dockets)[PERCENT_CATEGORIES].mean()
+    table.loc["All"] = df[PERCENT_CATEGORIES].mean()
+    counts = dockets.value_counts()
+    counts["All"] = len(df)
+    table.insert(0, "Documents", counts)
+    return table.round(2)
+
+# Figure name -> (stage outputs it reads, function computing its table)
+FIGURES = {
+    "topic_by_org_category": (["percent", "organization"], lambda analytics: topic_by_group(analytics, "Org Category")),
+    "topic_by_industry": (["percent", "organization"], lambda analytics: topic_by_group(analytics, "Industry")),
+    "advocacy_by_sentiment": (["advocacy", "sentiment"], advocacy_by_sentiment),
+    "sentiment_by_org_category": (["sentiment", "organization"], sentiment_by_org_category),
+    "corpus_topic_shares": (["percent"], corpus_topic_shares),
+}
+
+def build_figures(outputs, figures_dir=FIGURES_DIR, cache_dir=CACHE_DIR, names=None):
+    """
+    Writes one CSV per figure table to figures_dir.
+
+    Returns:
+        Analytics: the instance used, with stats on what was re-parsed and recomputed
+    """
+    analytics = Analytics(outputs, cache_dir)
+    os.makedirs(figures_dir, exist_ok=True)
+    for name in names or FIGURES:
+        table = analytics.figure(name)
+        if table is None:
+            print(f"Skipping {name}: needs {', '.join(FIGURES[name][0])} output")
+            continue
+        table.to_csv(os.path.join(figures_dir, f"{name}.csv"), index=False)
+    return analytics
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute the thesis cross-tabs from the stage outputs (cached between runs).")
+    for stage, path in OUTPUTS.items():
+        parser.add_argument(f"--{stage}", default=path, help=f"{stage} output (default: {path})")
+    parser.add_argument("--figures-dir", default=FIGURES_DIR)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--figure", action="append", choices=list(FIGURES), help="Only this figure (repeatable)")
+    args = parser.parse_args()
+
+    start = time.time()
+    outputs = {stage: getattr(args, stage) for stage in OUTPUTS}
+    analytics = build_figures(outputs, args.figures_dir, args.cache_dir, args.figure)
+    stats = analytics.stats
+    print(f"Re-parsed: {', '.join(stats['parsed']) or 'none'}; figures computed: {len(stats['figures_computed'])}, "
+          f"from cache: {len(stats['figures_cached'])}; written to {args.figures_dir} in {time.time() - start:.2f} seconds")
+
+if __name__ == "__main__":
+    main()
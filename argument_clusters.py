@@ -0,0 +1,303 @@
+import os
+import time
+import argparse
+from collections import Counter
+import numpy as np
+import pandas as pd
+from topic_prefilter import tokenize, hashed_features, N_FEATURES
+from analytics import Analytics
+
+# Bullet splitting: one argument per line of the MainArgumentsv2_* answer, minus list markers
+BULLET_MARKER_RE = r"^\s*(?:[-*•▪‣–—]+|\(?\d{1,3}[.)]|[a-zA-Z][.)])\s*"
+MIN_BULLET_WORDS = 4
+
+# Embeddings: hashed unigram + bigram TF-IDF features folded into EMBEDDING_DIM signed buckets,
+# L2-normalized float32 (1M distinct bullets x 256 dims = 1 GB, memory-mapped to disk when an output dir is given)
+EMBEDDING_DIM = 256
+EMBED_CHUNK = 50000
+
+# Approximate nearest neighbours: inverted-file index over spherical k-means cells; each cell is
+# searched against its PROBES nearest cells
+PROBES = 4
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE = 50000
+NEIGHBORS = 10
+QUERY_CHUNK = 2048
+
+# Two bullets are the same argument when each is among the other's nearest neighbours with at
+# least this cosine similarity; themes are the connected groups of such pairs
+SIMILARITY_THRESHOLD = 0.5
+MIN_THEME_SIZE = 2
+SAMPLES_PER_THEME = 3
+TOP_TERMS = 6
+
+def split_bullets(arguments, key_column="Filename", text_column="Main Arguments"):
+    """
+    One row per argument bullet.
+
+    Returns:
+        pd.DataFrame: "Document", "Bullet"
+    """
+    lines = arguments[[key_column, text_column]].dropna().rename(columns={key_column: "Document", text_column: "Bullet"})
+    lines["Bullet"] = lines["Bullet"].astype(str).str.split(r"\n+")
+    lines = lines.explode("Bullet")
+    lines["Bullet"] = lines["Bullet"].str.replace(BULLET_MARKER_RE, "", regex=True).str.strip()
+    lines = lines[lines["Bullet"].str.count(r"\S+") >= MIN_BULLET_WORDS]
+    return lines.reset_index(drop=True)
+
+def embed(bullets, dim=EMBEDDING_DIM, path=None, seed=0):
+    """
+    Hashed TF-IDF embeddings, one L2-normalized row per bullet.
+
+    Every hashed feature (topic_prefilter.hashed_features) is assigned a fixed random bucket and
+    sign, so a bullet's vector is the signed sum of its IDF-weighted features: a random projection
+    of its sparse TF-IDF vector that keeps cosine similarities approximately.
+    """
+    feature_ids = [hashed_features(tokenize(bullet)).astype(np.int32) for bullet in bullets]
+    lengths = np.fromiter((len(ids) for ids in feature_ids), dtype=np.int64, count=len(feature_ids))
+    document_frequency = np.zeros(N_FEATURES, dtype=np.int64)
+    for ids in feature_ids:
+        document_frequency[np.unique(ids)] += 1
+    idf = (np.log((1 + len(bullets)) / (1 + document_frequency)) + 1.0).astype(np.float32)
+    rng = np.random.default_rng(seed)
+    bucket = rng.integers(0, dim, N_FEATURES)
+    signed_idf = idf * rng.choice(np.array([-1.0, 1.0], dtype=np.float32), N_FEATURES)
+
+    if path:
+        vectors = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(len(bullets), dim))
+    else:
+        vectors = np.zeros((len(bullets), dim), dtype=np.float32)
+    for start in range(0, len(bullets), EMBED_CHUNK):
+        stop = min(start + EMBED_CHUNK, len(bullets))
+        ids = np.concatenate(feature_ids[start:stop]) if stop > start else np.empty(0, dtype=np.int32)
+        rows = np.repeat(np.arange(stop - start), lengths[start:stop])
+        chunk = np.bincount(rows * dim + bucket[ids], weights=signed_idf[ids], minlength=(stop - start) * dim)
+        chunk = chunk.reshape(stop - start, dim).astype(np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        vectors[start:stop] = chunk / np.maximum(norms, 1e-12)
+    return vectors
+
+def group_sums(vectors, labels, groups):
+    """Row sums of vectors per label 0..groups-1 (sorted segments, no per-row Python work)."""
+    order = np.argsort(labels, kind="stable")
+    starts = np.searchsorted(labels[order], np.arange(groups + 1))
+    sums = np.zeros((groups, vectors.shape[1]), dtype=np.float32)
+    present = starts[1:] > starts[:-1]
+    if present.any():
+        # Empty groups are skipped, so each segment still ends where the next present group starts
+        sums[present] = np.add.reduceat(np.asarray(vectors)[order], starts[:-1][present], axis=0)
+    return sums
+
+def unit_rows(matrix):
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+class IVFIndex:
+    """
+    Inverted-file approximate nearest-neighbour index for unit vectors (cosine similarity).
+
+    Spherical k-means on a sample picks about 2*sqrt(n) cells; every vector is stored in the list
+    of its nearest cell, and a search only scans the lists of the query's nearest cells.
+    """
+
+    def __init__(self, vectors, cells=None, iterations=KMEANS_ITERATIONS, sample=KMEANS_SAMPLE, seed=0):
+        self.vectors = vectors
+        count = len(vectors)
+        cells = cells or max(1, min(count, int(2 * np.sqrt(count))))
+        rng = np.random.default_rng(seed)
+        training = np.asarray(vectors[np.sort(rng.choice(count, min(count, max(sample, cells)), replace=False))])
+        centroids = training[rng.choice(len(training), cells, replace=False)]
+        for _ in range(iterations):
+            sums = group_sums(training, (training @ centroids.T).argmax(axis=1), cells)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # keep empty cells where they were
+            centroids = unit_rows(sums)
+        self.centroids = centroids.astype(np.float32)
+        self.assignment = np.concatenate([(np.asarray(vectors[start:start + EMBED_CHUNK]) @ self.centroids.T).argmax(axis=1)
+                                          for start in range(0, count, EMBED_CHUNK)]) if count else np.empty(0, dtype=np.int64)
+        self.order = np.argsort(self.assignment, kind="stable")
+        self.offsets = np.searchsorted(self.assignment[self.order], np.arange(cells + 1))
+
+    def members(self, cell):
+        return self.order[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def nearest_cells(self, queries, probes=PROBES):
+        similarities = queries @ self.centroids.T
+        probes = min(probes, len(self.centroids))
+        return np.argpartition(-similarities, probes - 1, axis=1)[:, :probes]
+
+    def search(self, queries, k=NEIGHBORS, probes=PROBES):
+        """
+        Returns:
+            tuple: (indices, similarities), each (len(queries), k); -1 / -inf where fewer than k were found
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, cells in enumerate(self.nearest_cells(queries, probes)):
+            candidates = np.concatenate([self.members(cell) for cell in cells])
+            found = np.asarray(self.vectors[candidates]) @ queries[row]
+            top = np.argsort(-found)[:k]
+            indices[row, :len(top)], similarities[row, :len(top)] = candidates[top], found[top]
+        return indices, similarities
+
+    def neighbor_graph(self, k=NEIGHBORS, probes=PROBES, threshold=SIMILARITY_THRESHOLD):
+        """
+        k nearest neighbours of every indexed vector, searched cell by cell (all members of a cell
+        share its probe list, so each cell is one matrix product).
+
+        Returns:
+            tuple: (sources, targets, similarities) for neighbour pairs at or above threshold
+        """
+        sources, targets, weights = [], [], []
+        probe_lists = self.nearest_cells(self.centroids, probes)
+        for cell, cells in enumerate(probe_lists):
+            candidates = np.concatenate([self.members(other) for other in cells])
+            candidate_vectors = np.asarray(self.vectors[candidates])
+            take = min(k, len(candidates))
+            members = self.members(cell)
+            # Query rows in chunks so an oversized cell does not build one huge similarity matrix
+            for start in range(0, len(members), QUERY_CHUNK):
+                queries = members[start:start + QUERY_CHUNK]
+                similarities = np.asarray(self.vectors[queries]) @ candidate_vectors.T
+                similarities[queries[:, None] == candidates[None, :]] = -np.inf  # not its own neighbour
+                top = np.argpartition(-similarities, take - 1, axis=1)[:, :take]
+                found = np.take_along_axis(similarities, top, axis=1)
+                keep = found >= threshold
+                sources.append(np.broadcast_to(queries[:, None], top.shape)[keep])
+                targets.append(candidates[top][keep])
+                weights.append(found[keep])
+        if not sources:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(sources), np.concatenate(targets), np.concatenate(weights)
+
+def components(count, sources, targets):
+    """Connected component label (smallest member index) per node, by label propagation with pointer jumping."""
+    labels = np.arange(count)
+    while True:
+        updated = labels.copy()
+        np.minimum.at(updated, sources, labels[targets])
+        np.minimum.at(updated, targets, labels[sources])
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def mutual_neighbors(vectors, threshold):
+    """Neighbour pairs at or above threshold where each vector is among the other's nearest neighbours."""
+    sources, targets, _ = IVFIndex(vectors).neighbor_graph(threshold=threshold)
+    count = len(vectors)
+    mutual = np.isin(sources.astype(np.int64) * count + targets, targets.astype(np.int64) * count + sources)
+    return sources[mutual], targets[mutual]
+
+def connected_themes(vectors, threshold=SIMILARITY_THRESHOLD):
+    """
+    Theme label per bullet (0..T-1, or -1 for a bullet that joined no theme).
+
+    Bullets are first grouped by mutual nearest neighbours, which keeps hub bullets from chaining
+    unrelated arguments together but splits a popular argument into several tight groups; groups
+    whose centroids are mutual neighbours at least threshold similar are then merged.
+    """
+    count = len(vectors)
+    if count == 0:
+        return np.zeros(0, dtype=np.int64)
+    labels = components(count, *mutual_neighbors(vectors, threshold))
+    sizes = np.bincount(labels, minlength=count)
+    labels = np.where(sizes[labels] >= MIN_THEME_SIZE, labels, -1)
+
+    clustered = labels >= 0
+    groups, group_of = np.unique(labels[clustered], return_inverse=True)
+    if len(groups) > 1:
+        centroids = unit_rows(group_sums(np.asarray(vectors)[clustered], group_of, len(groups)))
+        group_of = np.unique(components(len(groups), *mutual_neighbors(centroids, threshold)), return_inverse=True)[1][group_of]
+    labels[clustered] = group_of
+    return labels
+
+def distinct_texts(bullets):
+    """
+    The same argument is often worded identically in many comments; it is embedded and indexed once.
+
+    Returns:
+        tuple: (row of each bullet in texts, array of distinct lower-cased bullet texts)
+    """
+    text_of, texts = pd.factorize(bullets["Bullet"].str.lower())
+    return text_of, np.asarray(texts)
+
+def cluster_arguments(bullets, vectors, text_of, organizations=None, threshold=SIMILARITY_THRESHOLD, samples=SAMPLES_PER_THEME):
+    """
+    Builds the theme tables from bullets (split_bullets) and the embeddings of their distinct texts.
+
+    Returns:
+        tuple: (bullets with "Theme" and "Similarity", themes table, themes by Org Category or None)
+    """
+    labels = connected_themes(vectors, threshold)
+
+    # Renumber themes 1..T by document coverage (0 = unclustered)
+    bullets = bullets.assign(Theme=labels[text_of])
+    clustered = bullets[bullets["Theme"] >= 0]
+    coverage = clustered.groupby("Theme")["Document"].nunique().sort_values(ascending=False, kind="stable")
+    renumber = pd.Series(np.arange(1, len(coverage) + 1), index=coverage.index)
+    theme = pd.Series(labels).map(renumber).fillna(0).astype(int).to_numpy()
+    bullets["Theme"] = theme[text_of]
+    # Similarity to the theme centroid (every occurrence of a text counts) ranks the sample bullets
+    occurrences = np.bincount(text_of, minlength=len(vectors)).astype(np.float32)
+    centroids = unit_rows(group_sums(np.asarray(vectors) * occurrences[:, None], theme, len(coverage) + 1))
+    bullets["Similarity"] = np.einsum("ij,ij->i", np.asarray(vectors), centroids[theme]).round(3)[text_of]
+
+    ranked = bullets[bullets["Theme"] > 0].sort_values(["Theme", "Similarity"], ascending=[True, False])
+    themes = ranked.groupby("Theme").agg(Documents=("Document", "nunique"), Bullets=("Bullet", "size"),
+                                         Representative=("Bullet", "first"))
+    top = ranked.drop_duplicates(["Theme", "Bullet"]).groupby("Theme").head(samples)
+    top = top.assign(Position=top.groupby("Theme").cumcount() + 1)
+    themes = themes.join(top.pivot(index="Theme", columns="Position", values="Bullet").add_prefix("Sample "))
+    # Most frequent words among the bullets closest to the theme centroid
+    themes["Top Terms"] = ranked.groupby("Theme").head(50).groupby("Theme")["Bullet"].agg(
+        lambda group: ", ".join(term for term, _ in Counter(token for bullet in group for token in tokenize(bullet)).most_common(TOP_TERMS)))
+
+    by_organization = None
+    if organizations is not None:
+        labelled = ranked.merge(organizations[["Document", "Org Category"]], on="Document", how="left")
+        labelled["Org Category"] = labelled["Org Category"].astype(str).replace("nan", "N/A")
+        by_organization = labelled.groupby(["Theme", "Org Category"]).agg(
+            Documents=("Document", "nunique"), Bullets=("Bullet", "size"), Sample=("Bullet", "first")).reset_index()
+        documents = by_organization.pivot(index="Theme", columns="Org Category", values="Documents").fillna(0).astype(int)
+        themes = themes.join(documents.add_prefix("Documents: "))
+    return bullets, themes.reset_index(), by_organization
+
+def main():
+    parser = argparse.ArgumentParser(description="Cluster MainArguments bullets into argument themes across documents.")
+    parser.add_argument("arguments", help="MainArgumentsv2_* output (.csv or .xlsx)")
+    parser.add_argument("--organization", help="Organization_* output, for the per-Org Category breakdown")
+    parser.add_argument("--output-dir", default="argument_themes")
+    parser.add_argument("--threshold", type=float, default=SIMILARITY_THRESHOLD, help="Cosine similarity for two bullets to share a theme")
+    args = parser.parse_args()
+
+    start = time.time()
+    os.makedirs(args.output_dir, exist_ok=True)
+    arguments = pd.read_csv(args.arguments) if args.arguments.lower().endswith(".csv") else pd.read_excel(args.arguments)
+    bullets = split_bullets(arguments)
+    print(f"{len(bullets)} bullets from {bullets['Document'].nunique()} documents")
+    if bullets.empty:
+        # Nothing to embed or cluster; write empty tables so an earlier run's output is not left behind
+        bullets.assign(Theme=pd.Series(dtype=int), Similarity=pd.Series(dtype=float)).to_csv(
+            os.path.join(args.output_dir, "bullets.csv"), index=False)
+        pd.DataFrame(columns=["Theme", "Documents", "Bullets", "Representative", "Top Terms"]).to_csv(
+            os.path.join(args.output_dir, "themes.csv"), index=False)
+        print(f"No argument bullets to cluster; empty tables written to {args.output_dir}")
+        return
+    text_of, texts = distinct_texts(bullets)
+    vectors = embed(texts, path=os.path.join(args.output_dir, "embeddings.npy"))
+    print(f"Embedded {len(texts)} distinct bullets in {time.time() - start:.1f} seconds")
+    organizations = None
+    if args.organization:
+        organizations = Analytics({"organization": args.organization}).stage("organization")
+    bullets, themes, by_organization = cluster_arguments(bullets, vectors, text_of, organizations, args.threshold)
+
+    bullets.to_csv(os.path.join(args.output_dir, "bullets.csv"), index=False)
+    themes.to_csv(os.path.join(args.output_dir, "themes.csv"), index=False)
+    if by_organization is not None:
+        by_organization.to_csv(os.path.join(args.output_dir, "themes_by_org_category.csv"), index=False)
+    clustered = (bullets["Theme"] > 0).mean() if len(bullets) else 0
+    print(f"{len(themes)} themes covering {clustered:.0%} of bullets; written to {args.output_dir} in {time.time() - start:.1f} seconds")
+
+if __name__ == "__main__":
+    main()
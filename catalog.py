@@ -0,0 +1,404 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+import concurrent.futures
+import pandas as pd
+from pdf_extract import extract_pages
+from packing import estimate_tokens
+from incremental import short_hash
+from partitions import list_pdfs, list_partitions, docket_of, MANIFEST_NAME
+
+# The catalog lives in the corpus root next to the docket partitions
+CATALOG_NAME = "corpus_catalog.db"
+EXTRACT_WORKERS = 8
+
+STATUS_PENDING = "pending"  # registered, text not extracted yet
+STATUS_OK = "ok"
+STATUS_EMPTY = "empty"  # no text (even after OCR)
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    name TEXT PRIMARY KEY,
+    docket TEXT,
+    comment_id TEXT,
+    original_name TEXT,
+    source_url TEXT,
+    organization TEXT,
+    bytes INTEGER,
+    mtime REAL,
+    pages INTEGER,
+    text_hash TEXT,
+    characters INTEGER,
+    tokens INTEGER,
+    extraction_status TEXT NOT NULL DEFAULT 'pending',
+    extraction_error TEXT,
+    added_at REAL,
+    extracted_at REAL,
+    org_category TEXT,
+    indexed INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS documents_docket ON documents (docket, tokens);
+CREATE INDEX IF NOT EXISTS documents_tokens ON documents (tokens);
+CREATE INDEX IF NOT EXISTS documents_status ON documents (extraction_status);
+CREATE INDEX IF NOT EXISTS documents_organization ON documents (organization);
+CREATE INDEX IF NOT EXISTS documents_org_category ON documents (org_category);
+CREATE TABLE IF NOT EXISTS stage_results (
+    stage TEXT NOT NULL,
+    name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    model TEXT,
+    text_hash TEXT,
+    updated_at REAL,
+    PRIMARY KEY (stage, name)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages USING fts5(text, name UNINDEXED, page UNINDEXED, tokenize = 'porter unicode61', prefix = '2 3');
+"""
+# Columns added after the first catalogs were built; added to an existing documents table on open
+ADDED_COLUMNS = {"org_category": "TEXT", "indexed": "INTEGER NOT NULL DEFAULT 0"}
+SNIPPET_TOKENS = 16
+
+def catalog_path(root):
+    return os.path.join(root, CATALOG_NAME)
+
+class CorpusCatalog:
+    """
+    SQLite catalog of the documents under one corpus root: docket, comment ID, original file name,
+    organization, page count, text hash, character/token counts and extraction status, plus which
+    stages have scored each document. The scraper registers documents as it saves them, `catalog.py
+    build` extracts their text, and the stage scripts select their work with an indexed query.
+
+    Extraction also keeps a full-text index (SQLite FTS5, one row per page, Porter-stemmed) that
+    search() queries for ranked documents and snippets.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(documents)")}
+            for column, definition in ADDED_COLUMNS.items():
+                if columns and column not in columns:
+                    connection.execute(f"ALTER TABLE documents ADD COLUMN {column} {definition}")
+            connection.executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def register(self, name, docket=None, comment_id=None, original_name=None, source_url=None):
+        """Adds a document (name relative to the corpus root), or fills in metadata that was missing."""
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO documents (name, docket, comment_id, original_name, source_url, added_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET docket = coalesce(excluded.docket, docket), "
+                "comment_id = coalesce(excluded.comment_id, comment_id), original_name = coalesce(excluded.original_name, original_name), "
+                "source_url = coalesce(excluded.source_url, source_url)",
+                (name, docket if docket is not None else docket_of(name), comment_id, original_name, source_url, time.time()),
+            )
+
+    def scan(self, root):
+        """
+        Registers every PDF under root that the catalog does not know yet (original names come from the
+        partitions' downloads.jsonl) and marks documents whose file changed for re-extraction.
+
+        Returns:
+            int: Number of documents that need extraction.
+        """
+        originals = {}
+        for partition in [None] + list_partitions(root):
+            manifest = os.path.join(root, partition, MANIFEST_NAME) if partition else os.path.join(root, MANIFEST_NAME)
+            if os.path.exists(manifest):
+                with open(manifest, "r", encoding="utf-8") as file:
+                    for line in filter(str.strip, file):
+                        entry = json.loads(line)
+                        originals[f"{partition}/{entry['file']}" if partition else entry["file"]] = entry
+        for name in list_pdfs(root):
+            entry = originals.get(name, {})
+            self.register(name, original_name=entry.get("original"), source_url=entry.get("url"))
+        known = {row["name"]: row for row in self._connection().execute("SELECT name, bytes, mtime FROM documents")}
+        with self._connection() as connection:
+            for name, row in known.items():
+                path = os.path.join(root, name)
+                if not os.path.exists(path):
+                    continue
+                stat = os.stat(path)
+                if row["bytes"] != stat.st_size or row["mtime"] != stat.st_mtime:
+                    connection.execute("UPDATE documents SET extraction_status = ? WHERE name = ?", (STATUS_PENDING, name))
+            # Documents extracted before the full-text index existed are extracted once more to index them
+            connection.execute("UPDATE documents SET extraction_status = ? WHERE extraction_status = ? AND indexed = 0",
+                               (STATUS_PENDING, STATUS_OK))
+        return self._connection().execute("SELECT count(*) FROM documents WHERE extraction_status = ?", (STATUS_PENDING,)).fetchone()[0]
+
+    def record_extraction(self, name, path, text=None, pages=None, error=None, page_texts=None):
+        """Stores the results of extracting one document's text and replaces its pages in the full-text index."""
+        stat = os.stat(path)
+        if error is not None:
+            values = (None, None, None, None, STATUS_FAILED, str(error))
+        else:
+            values = (pages, short_hash(text), len(text), estimate_tokens(text), STATUS_OK if text.strip() else STATUS_EMPTY, None)
+        with self._connection() as connection:
+            connection.execute(
+                "UPDATE documents SET pages = ?, text_hash = ?, characters = ?, tokens = ?, extraction_status = ?, "
+                "extraction_error = ?, bytes = ?, mtime = ?, extracted_at = ?, indexed = ? WHERE name = ?",
+                (*values, stat.st_size, stat.st_mtime, time.time(), int(page_texts is not None), name),
+            )
+            connection.execute("DELETE FROM pages WHERE name = ?", (name,))
+            if page_texts is not None:
+                connection.executemany("INSERT INTO pages (text, name, page) VALUES (?, ?, ?)",
+                                       [(page, name, number) for number, page in enumerate(page_texts, 1) if page.strip()])
+
+    def extract_pending(self, root, workers=EXTRACT_WORKERS):
+        """Extracts the text of every pending document (large PDFs are split across pdf_extract's process pool)."""
+        names = [row["name"] for row in self._connection().execute(
+            "SELECT name FROM documents WHERE extraction_status = ?", (STATUS_PENDING,))]
+
+        def extract(name):
+            path = os.path.join(root, name)
+            try:
+                pages = extract_pages(path)
+                self.record_extraction(name, path, "".join(page + "\n" for page in pages), len(pages), page_texts=pages)
+            except Exception as e:
+                print(f"Error extracting text from {path}: {e}")
+                if os.path.exists(path):
+                    self.record_extraction(name, path, error=e)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(extract, names))
+        return len(names)
+
+    def select(self, stage=None, dockets=None, min_tokens=None, max_tokens=None, pending_only=False, organization=None):
+        """
+        Names of the documents matching every given filter, e.g. select("sentiment", ["NTIA-2023-0009"],
+        min_tokens=10000, pending_only=True). pending_only skips documents this stage has already scored
+        successfully from the current text; token filters only match extracted documents.
+        """
+        clauses, parameters = [], []
+        if dockets:
+            clauses.append(f"d.docket IN ({', '.join('?' * len(dockets))})")
+            parameters += list(dockets)
+        if min_tokens is not None:
+            clauses.append("d.tokens >= ?")
+            parameters.append(min_tokens)
+        if max_tokens is not None:
+            clauses.append("d.tokens <= ?")
+            parameters.append(max_tokens)
+        if organization is not None:
+            clauses.append("d.organization = ?")
+            parameters.append(organization)
+        if pending_only and stage:
+            clauses.append("NOT EXISTS (SELECT 1 FROM stage_results r WHERE r.stage = ? AND r.name = d.name "
+                           "AND r.status = 'done' AND (r.text_hash IS d.text_hash OR d.text_hash IS NULL))")
+            parameters.append(stage)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return [row["name"] for row in self._connection().execute(f"SELECT d.name FROM documents d {where} ORDER BY d.name", parameters)]
+
+    def sizes(self, names=None):
+        """Document name -> estimated token count (None until extracted)."""
+        rows = self._connection().execute("SELECT name, tokens FROM documents")
+        sizes = {row["name"]: row["tokens"] for row in rows}
+        return sizes if names is None else {name: sizes.get(name) for name in names}
+
+    def text_info(self, names=None):
+        """Document name -> {"tokens", "text_hash", "organization"} as recorded at extraction."""
+        rows = self._connection().execute("SELECT name, tokens, text_hash, organization FROM documents")
+        info = {row["name"]: {"tokens": row["tokens"], "text_hash": row["text_hash"], "organization": row["organization"]} for row in rows}
+        return info if names is None else {name: info[name] for name in names if name in info}
+
+    def record_stage(self, stage, entries):
+        """Marks (name, status, model) entries as scored by a stage, against each document's current text hash."""
+        now = time.time()
+        with self._connection() as connection:
+            connection.executemany(
+                "INSERT INTO stage_results (stage, name, status, model, text_hash, updated_at) "
+                "VALUES (?, ?, ?, ?, (SELECT text_hash FROM documents WHERE name = ?), ?) "
+                "ON CONFLICT (stage, name) DO UPDATE SET status = excluded.status, model = excluded.model, "
+                "text_hash = excluded.text_hash, updated_at = excluded.updated_at",
+                [(stage, name, status, model, name, now) for name, status, model in entries],
+            )
+
+    def set_organizations(self, organizations, categories=None):
+        """Sets each document's organization (and Org Category, if given) from the Organization stage."""
+        categories = categories or {}
+        with self._connection() as connection:
+            connection.executemany("UPDATE documents SET organization = ?, org_category = coalesce(?, org_category) WHERE name = ?",
+                                   [(organization, categories.get(name), name) for name, organization in organizations.items()])
+
+    def search(self, query, dockets=None, organization=None, org_category=None, limit=20, snippet_tokens=SNIPPET_TOKENS):
+        """
+        Full-text search over the extracted pages, e.g. search('watermark* OR "compute threshold"').
+
+        Args:
+            query (str): FTS5 query: words (Porter-stemmed, so "watermarking" also finds "watermark"),
+                "phrases", prefix*, AND / OR / NOT, NEAR(a b, 10)
+            dockets (list, optional): Only documents in these dockets
+            organization (str, optional): Only documents whose organization contains this text
+            org_category (str, optional): Only documents of this Org Category
+            limit (int): Number of documents to return
+
+        Returns:
+            list: Best first, one dict per document: name, docket, organization, org_category,
+                score (BM25 of its best page, lower is better), pages (matching pages), page (best
+                page number) and snippet (matches in [brackets])
+        """
+        clauses, parameters = [], [query]
+        if dockets:
+            clauses.append(f"d.docket IN ({', '.join('?' * len(dockets))})")
+            parameters += list(dockets)
+        if organization:
+            clauses.append("d.organization LIKE ?")
+            parameters.append(f"%{organization}%")
+        if org_category:
+            clauses.append("d.org_category = ?")
+            parameters.append(org_category)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # Rank documents by their best page; min() makes SQLite return that page's rowid and number
+        rows = self._connection().execute(
+            "SELECT h.rowid AS rowid, h.name AS name, d.docket AS docket, d.organization AS organization, "
+            "d.org_category AS org_category, min(h.rank) AS score, count(*) AS pages, h.page AS page "
+            f"FROM (SELECT rowid, name, page, rank FROM pages WHERE pages MATCH ?) h JOIN documents d ON d.name = h.name {where} "
+            "GROUP BY h.name ORDER BY score LIMIT ?", parameters + [limit]).fetchall()
+        results = []
+        for row in rows:
+            # Snippets only for the returned pages, not for every match
+            snippet = self._connection().execute(
+                "SELECT snippet(pages, 0, '[', ']', '…', ?) FROM pages WHERE pages MATCH ? AND rowid = ?",
+                (snippet_tokens, query, row["rowid"])).fetchone()[0]
+            result = {key: row[key] for key in ("name", "docket", "organization", "org_category", "pages", "page")}
+            results.append({**result, "score": row["score"], "snippet": " ".join(snippet.split())})
+        return results
+
+    def summary(self):
+        rows = self._connection().execute(
+            "SELECT coalesce(docket, '-') AS docket, extraction_status, count(*) AS documents, sum(tokens) AS tokens "
+            "FROM documents GROUP BY 1, 2 ORDER BY 1, 2").fetchall()
+        stages = self._connection().execute(
+            "SELECT stage, status, count(*) AS documents FROM stage_results GROUP BY 1, 2 ORDER BY 1, 2").fetchall()
+        lines = [f"{row['docket']}: {row['documents']} {row['extraction_status']} ({row['tokens'] or 0} tokens)" for row in rows]
+        lines += [f"{row['stage']}: {row['documents']} {row['status']}" for row in stages]
+        return "\n".join(lines)
+
+def select_documents(root, stage=None, dockets=None, min_tokens=None, max_tokens=None, pending_only=False):
+    """
+    The documents a stage script should process: an indexed catalog query when root has a catalog,
+    otherwise every PDF in the selected partitions (token and pending filters need the catalog).
+
+    The directory decides which documents exist: PDFs added since the last `catalog.py build` are
+    registered (unextracted, so token filters cannot match them until the next build), and catalogued
+    documents whose file is gone are left out.
+    """
+    on_disk = list_pdfs(root, dockets)
+    if not os.path.exists(catalog_path(root)):
+        if min_tokens is not None or max_tokens is not None or pending_only:
+            print(f"No catalog in {root}; run `python catalog.py build {root}` to filter by size or stage status.")
+        return on_disk
+    catalog = CorpusCatalog(catalog_path(root))
+    known = set(catalog.select(dockets=dockets))
+    new = [name for name in on_disk if name not in known]
+    for name in new:
+        catalog.register(name)
+    if new:
+        print(f"{len(new)} PDFs in {root} were not in the catalog and have been registered; "
+              f"run `python catalog.py build {root}` to extract them.")
+    present = set(on_disk)
+    selected = catalog.select(stage, dockets, min_tokens, max_tokens, pending_only)
+    missing = [name for name in selected if name not in present]
+    if missing:
+        print(f"Skipping {len(missing)} catalogued documents whose files are no longer in {root}.")
+    return [name for name in selected if name in present]
+
+def record_results(root, stage, rows, key_column):
+    """
+    Records in the catalog (if root has one) which documents a stage scored: rows that RepairRun would
+    re-run are stored as failed, so PENDING_ONLY runs pick them up again. Organization rows also set
+    each document's organization.
+    """
+    if not os.path.exists(catalog_path(root)):
+        return
+    from RepairRun import failure_reason  # imported here: RepairRun imports the stage runners
+    catalog = CorpusCatalog(catalog_path(root))
+    rows = [row for row in rows if row and row.get(key_column)]
+    catalog.record_stage(stage, [(row[key_column], "failed" if failure_reason(stage, row) else "done", row.get("Model"))
+                                 for row in rows])
+    if stage == "organization":
+        known = [row for row in rows if row.get("Org Title") and row["Org Title"] != "N/A"]
+        catalog.set_organizations({row[key_column]: row["Org Title"] for row in known},
+                                  {row[key_column]: row.get("Org Category") for row in known})
+
+def merge_previous(output_path, df, key_column):
+    """
+    For PENDING_ONLY runs, which score only new documents: the stage's earlier output with this run's
+    rows merged in by document name, so writing it does not drop the documents scored before.
+    """
+    if not os.path.exists(output_path):
+        return df
+    from RepairRun import read_output, merge_repairs
+    from percent_schema import PERCENT_CATEGORIES
+    merged = merge_repairs(read_output(output_path), key_column, df.to_dict("records"))
+    if all(column in merged.columns for column in PERCENT_CATEGORIES):
+        # Blank (failed) cells made pandas read the columns as floats; write whole numbers again
+        merged[PERCENT_CATEGORIES] = merged[PERCENT_CATEGORIES].apply(pd.to_numeric).astype("Int64")
+    return merged
+
+def main():
+    parser = argparse.ArgumentParser(description="Corpus catalog: register and extract documents, and select work for a stage.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Register new PDFs under ROOT and extract their text")
+    build.add_argument("root")
+    build.add_argument("--workers", type=int, default=EXTRACT_WORKERS)
+    select = commands.add_parser("select", help="Print the documents matching the filters")
+    select.add_argument("root")
+    select.add_argument("--stage")
+    select.add_argument("--docket", action="append")
+    select.add_argument("--min-tokens", type=int)
+    select.add_argument("--max-tokens", type=int)
+    select.add_argument("--organization")
+    select.add_argument("--pending-only", action="store_true", help="Only documents the stage has not scored yet")
+    status = commands.add_parser("status", help="Documents and tokens per docket and extraction status")
+    status.add_argument("root")
+    search = commands.add_parser("search", help="Full-text search of the extracted text (run build first)")
+    search.add_argument("root")
+    search.add_argument("query", help='FTS5 query, e.g. \'watermark* OR "compute threshold"\'')
+    search.add_argument("--docket", action="append")
+    search.add_argument("--organization", help="Organization name contains this text")
+    search.add_argument("--org-category")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    catalog = CorpusCatalog(catalog_path(args.root))
+    if args.command == "build":
+        start = time.time()
+        pending = catalog.scan(args.root)
+        print(f"{pending} documents to extract")
+        catalog.extract_pending(args.root, args.workers)
+        print(catalog.summary())
+        print(f"Catalog built in {time.time() - start:.1f} seconds")
+    elif args.command == "select":
+        for name in catalog.select(args.stage, args.docket, args.min_tokens, args.max_tokens, args.pending_only, args.organization):
+            print(name)
+    elif args.command == "search":
+        start = time.time()
+        try:
+            results = catalog.search(args.query, args.docket, args.organization, args.org_category, args.limit)
+        except sqlite3.OperationalError as e:
+            print(f"Invalid search query {args.query!r}: {e}")
+            return
+        for rank, result in enumerate(results, 1):
+            organization = f" ({result['organization']})" if result["organization"] else ""
+            print(f"{rank}. {result['name']}{organization}: {result['pages']} matching pages, best p. {result['page']}")
+            print(f"   {result['snippet']}")
+        print(f"{len(results)} documents in {(time.time() - start) * 1000:.0f} ms")
+    else:
+        print(catalog.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+import os
+import json
+import hashlib
+import argparse
+import threading
+import concurrent.futures
+from urllib.parse import urlparse, unquote
+import requests
+from requests.adapters import HTTPAdapter
+from partitions import MANIFEST_NAME  # per-directory record of finished downloads
+
+# Parallel downloads share one pooled HTTP session (keep-alive connections per host)
+DOWNLOAD_WORKERS = 8
+CHUNK_SIZE = 1 << 20
+RETRIES = 3
+TIMEOUT = 60
+# Unfinished downloads, kept between runs so they resume with an HTTP Range request
+PARTIAL_DIR = ".partial"
+
+class DownloadError(Exception):
+    pass
+
+def sha256_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def original_name(url):
+    return unquote(os.path.basename(urlparse(url).path)) or "download"
+
+class AttachmentDownloader:
+    """
+    Downloads attachment URLs concurrently on a bounded thread pool while the caller keeps crawling.
+
+    Each file is streamed to DIRECTORY/.partial/, resumed with a Range request if a previous attempt
+    stopped part-way, checked against the server's length (and an expected SHA-256 when one is known),
+    and stored under its content hash ("<sha256[:16]>.pdf"), so the same attachment posted twice is
+    kept once. The original name is recorded in DIRECTORY/downloads.jsonl.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, retries=RETRIES, timeout=TIMEOUT, headers=None):
+        self.retries = retries
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="download")
+        self._futures = {}  # Future -> url
+        self._lock = threading.Lock()
+        self._manifests = {}  # directory -> {url: manifest entry}
+        self.stats = {"downloaded": 0, "resumed": 0, "skipped": 0, "duplicates": 0, "failed": 0, "bytes": 0}
+
+    def set_cookies(self, cookies):
+        """Copies browser session cookies (Selenium driver.get_cookies() dicts) into the HTTP session."""
+        with self._lock:
+            for cookie in cookies:
+                self.session.cookies.set(cookie["name"], cookie["value"], domain=cookie.get("domain"), path=cookie.get("path", "/"))
+
+    def submit(self, url, directory, expected_sha256=None):
+        """Queues one download and returns its Future (result: the manifest entry)."""
+        future = self._pool.submit(self.download, url, directory, expected_sha256)
+        with self._lock:
+            self._futures[future] = url
+        return future
+
+    def _manifest(self, directory):
+        with self._lock:
+            if directory not in self._manifests:
+                entries = {}
+                path = os.path.join(directory, MANIFEST_NAME)
+                if os.path.exists(path):
+                    with open(path, "r", encoding="utf-8") as file:
+                        for line in file:
+                            if line.strip():
+                                entry = json.loads(line)
+                                entries[entry["url"]] = entry
+                self._manifests[directory] = entries
+            return self._manifests[directory]
+
+    def _record(self, directory, entry, counter):
+        with self._lock:
+            self._manifests[directory][entry["url"]] = entry
+            with open(os.path.join(directory, MANIFEST_NAME), "a", encoding="utf-8") as file:
+                file.write(json.dumps(entry) + "\n")
+            self.stats[counter] += 1
+            self.stats["bytes"] += entry["bytes"]
+
+    def _fetch(self, url, partial_path):
+        """Streams url into partial_path, resuming from its current size. Returns the expected total size or None."""
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        headers = {"Range": f"bytes={offset}-"} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 416 and offset:
+                # Nothing left to fetch; the length check decides whether the partial file is complete
+                return offset
+            response.raise_for_status()
+            if offset and response.status_code == 206:
+                with self._lock:
+                    self.stats["resumed"] += 1
+                total = response.headers.get("Content-Range", "").rpartition("/")[2]
+                mode = "ab"
+            else:
+                # Fresh download, or a server that ignored the Range header
+                offset = 0
+                total = response.headers.get("Content-Length")
+                mode = "wb"
+            with open(partial_path, mode) as file:
+                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                    file.write(chunk)
+            return int(total) if total and total.isdigit() else None
+
+    def download(self, url, directory, expected_sha256=None):
+        """
+        Downloads one URL into directory (skipping it if the manifest already has it).
+
+        Returns:
+            dict: Manifest entry {"url", "original", "file", "sha256", "bytes"}
+        """
+        os.makedirs(os.path.join(directory, PARTIAL_DIR), exist_ok=True)
+        known = self._manifest(directory).get(url)
+        if known and os.path.exists(os.path.join(directory, known["file"])):
+            with self._lock:
+                self.stats["skipped"] += 1
+            return known
+        partial_path = os.path.join(directory, PARTIAL_DIR, hashlib.sha256(url.encode("utf-8")).hexdigest()[:16] + ".part")
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                total = self._fetch(url, partial_path)
+            except requests.RequestException as e:
+                # Keep the partial file; the next attempt resumes from where this one stopped
+                last_error = e
+                status = e.response.status_code if e.response is not None else None
+                if status is not None and status < 500 and status not in (408, 429):
+                    break  # not found / forbidden: retrying will not help
+                continue
+            size = os.path.getsize(partial_path)
+            if total is not None and size != total:
+                last_error = DownloadError(f"expected {total} bytes, have {size}")
+                if size > total:
+                    os.remove(partial_path)
+                continue
+            digest = sha256_file(partial_path)
+            if expected_sha256 and digest != expected_sha256.lower():
+                last_error = DownloadError(f"checksum mismatch ({digest[:16]} != {expected_sha256[:16]})")
+                os.remove(partial_path)
+                continue
+            extension = os.path.splitext(original_name(url))[1].lower() or ".bin"
+            file_name = f"{digest[:16]}{extension}"
+            target = os.path.join(directory, file_name)
+            counter = "downloaded"
+            if os.path.exists(target):
+                # Same content already stored (the attachment was posted more than once)
+                os.remove(partial_path)
+                counter = "duplicates"
+            else:
+                os.replace(partial_path, target)
+            entry = {"url": url, "original": original_name(url), "file": file_name, "sha256": digest, "bytes": size}
+            self._record(directory, entry, counter)
+            return entry
+        with self._lock:
+            self.stats["failed"] += 1
+        raise DownloadError(f"Download failed: {url} ({last_error})")
+
+    def wait(self):
+        """
+        Blocks until every queued download has finished.
+
+        Returns:
+            list: (url, error) for the downloads that failed
+        """
+        with self._lock:
+            futures = dict(self._futures)
+        failures = []
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failures.append((futures[future], e))
+        return failures
+
+    def close(self):
+        self.wait()
+        self._pool.shutdown()
+        self.session.close()
+
+    def summary(self):
+        stats = self.stats
+        return (f"Downloads: {stats['downloaded']} new, {stats['duplicates']} duplicate content, {stats['skipped']} already present, "
+                f"{stats['resumed']} resumed, {stats['failed']} failed; {stats['bytes'] / 1e6:.1f} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Download files in parallel with resume, checksums and content-hash names.")
+    parser.add_argument("urls", nargs="+")
+    parser.add_argument("--directory", required=True)
+    parser.add_argument("--workers", type=int, default=DOWNLOAD_WORKERS)
+    args = parser.parse_args()
+
+    downloader = AttachmentDownloader(workers=args.workers)
+    for url in args.urls:
+        downloader.submit(url, args.directory)
+    for url, error in downloader.wait():
+        print(error)
+    downloader.close()
+    print(downloader.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import os
+import re
+import argparse
+from collections import deque
+import pandas as pd
+
+# Terms and phrases that count as evidence that a comment discusses an advocacy category. Matching is
+# case-insensitive and punctuation counts as a space ("red-team" matches "red team"). A term matches
+# whole words only ("test" would not match "testimony"); a term ending in "*" is a stem matched at the
+# start of a word ("watermark*" covers watermarks and watermarking). Where terms overlap in the text
+# ("red teaming" and "red team*", "third party audit" and "audit") only the longest match counts. Generic
+# policy words that appear in comments on any topic ("standard", "environment", "union", "fair", "harm")
+# are only listed inside phrases. Categories without an entry are never gated.
+LEXICON = {
+    "Testing": ["red team*", "red teaming", "testing", "adversarial test*", "stress test*", "pre deployment test*",
+                "test and evaluation", "tevv", "testbed*", "test bed*", "model evaluation*", "safety evaluation*",
+                "capability evaluation*", "third party evaluation*", "independent evaluation*", "evaluations",
+                "benchmark*", "audits", "auditing", "auditor*", "third party audit*", "algorithmic audit*",
+                "conformity assessment*", "regulatory sandbox*", "validation and verification", "assurance", "audit",
+                "audited", "test and evaluate"],
+    "Privacy": ["privacy", "personal data", "personal information", "personally identifiable", "pii",
+                "data protection", "data minimization", "surveillance", "biometric*", "facial recognition",
+                "informed consent", "without consent", "confidentiality", "anonymi*", "de identif*", "gdpr",
+                "hipaa", "ccpa"],
+    "Governance": ["governance", "regulation*", "regulator*", "regulatory", "regulate*", "regulating", "oversight",
+                   "accountability", "risk management", "legislation", "licensing", "liability", "enforcement",
+                   "compliance", "executive order", "agency", "agencies", "policymaker*", "federal framework",
+                   "standards development", "procurement", "safe harbor*", "rulemaking"],
+    "Auth": ["authentication", "authenticity", "authenticate*", "provenance", "watermark*", "content credential*",
+             "c2pa", "deepfake*", "deep fake*", "synthetic content", "synthetic media", "ai generated content",
+             "digital identit*", "identity verification", "impersonat*", "disinformation", "misinformation",
+             "content label*"],
+    "Global": ["international cooperation", "international standard*", "international coordination",
+               "international partner*", "international alignment", "internationally", "global governance",
+               "global south", "allies", "multilateral", "cross border", "across borders", "treaty", "treaties",
+               "international", "overseas", "foreign", "oecd", "g7", "g20", "united nations", "unesco", "eu ai act", "european union", "china", "chinese",
+               "prc", "export control*", "geopolit*", "foreign adversar*", "foreign actor*"],
+    "Labor": ["labor market*", "labour market*", "worker", "workers", "workforce", "employment", "unemployment",
+              "employee", "employees", "jobs", "job loss*", "job displacement", "wages", "labor union*",
+              "labour union*", "trade union*", "unions", "collective bargaining", "reskill*", "upskill*", "hiring",
+              "workplace*", "layoff*", "gig work*", "displace workers", "displaced workers"],
+    "Ethics": ["ethics", "ethical", "unethical", "bias", "biases", "biased", "algorithmic bias", "fairness",
+               "discriminat*", "civil rights", "civil libert*", "human rights", "equity", "equitable", "inequit*",
+               "trustworth*", "responsible ai", "explainab*", "marginalized", "underserved communit*",
+               "economic justice", "social justice", "algorithmic harm*", "disparate impact*", "disparate harm*",
+               "disparate treatment", "unfair treatment", "harmful bias*"],
+    "Energy": ["energy", "electricity", "power consumption", "power grid", "electric grid", "carbon", "emissions",
+               "climate", "sustainability", "environmental impact*", "environmental cost*", "environmental footprint",
+               "data center", "data centers", "datacenter*", "water consumption", "water usage", "renewable*",
+               "kilowatt*", "megawatt*", "gigawatt*", "kwh", "mwh", "gwh", "energy efficien*"],
+}
+# Term matches a category needs before its question is sent to the model; with 1, only categories with
+# no evidence at all are gated
+MIN_EVIDENCE = 1
+# Output column listing the categories a document was gated on (separated by GATE_SEPARATOR)
+GATED_COLUMN = "Gated"
+GATE_SEPARATOR = ";"
+# Answer recorded for a gated category; it starts with the score like the model's answers do
+GATED_ANSWER = "0 - no evidence of this topic in the document (lexical evidence gate, not sent to the model)"
+
+NON_WORD_RE = re.compile(r"\W+")
+
+def normalize(text):
+    """Lowercase words separated by single spaces, with a space before and after every word."""
+    return " " + NON_WORD_RE.sub(" ", text.lower()).strip() + " "
+
+def pattern(term):
+    """What a lexicon term matches in normalized text: " word " for a whole word, " stem" for "stem*"."""
+    if term.endswith("*"):
+        return normalize(term[:-1]).rstrip()
+    return normalize(term)
+
+class Automaton:
+    """
+    Aho-Corasick automaton over a set of patterns: one pass over a text finds every occurrence of every
+    pattern, however many patterns there are. Overlapping occurrences are resolved to the longest one.
+    """
+
+    def __init__(self, patterns):
+        """
+        Args:
+            patterns (dict): pattern -> labels reported when it occurs; a leading or trailing space is a
+                word boundary and is not part of the occurrence when deciding overlaps
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        # Per state: the longest pattern ending there as (start offset, end offset, labels), or None
+        self.match = [None]
+        self.longest = max((len(pattern) for pattern in patterns), default=0)
+        for pattern, labels in patterns.items():
+            state = 0
+            for character in pattern:
+                if character not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.match.append(None)
+                    self.goto[state][character] = len(self.goto) - 1
+                state = self.goto[state][character]
+            self.match[state] = (len(pattern) - 1 - pattern.startswith(" "), int(pattern.endswith(" ")), sorted(set(labels)))
+        # Failure links breadth first: the longest proper suffix that is also a pattern prefix
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and character not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(character, 0)
+                if self.match[child] is None:
+                    self.match[child] = self.match[self.fail[child]]
+
+    def count(self, text, enough=None):
+        """
+        Non-overlapping occurrences per label in text. An occurrence inside a longer one is dropped
+        ("red team" in "red teaming"), and of two partly overlapping occurrences the first is kept.
+
+        Args:
+            enough (int, optional): Stop scanning once every label has this many occurrences
+
+        Returns:
+            dict: label -> occurrences (at least `enough` for every label when the scan stopped early)
+        """
+        goto, fail, match = self.goto, self.fail, self.match
+        counts = {}
+        labels = {label for found in match if found for label in found[2]}
+        remaining = len(labels)
+        stop_at = None
+        kept = []  # (start, end, labels) of the occurrences counted so far, in text order
+
+        def add(found_labels, step):
+            nonlocal remaining
+            for label in found_labels:
+                counts[label] = counts.get(label, 0) + step
+                if enough and counts[label] == (enough if step > 0 else enough - 1):
+                    remaining -= step
+
+        state = 0
+        for position, character in enumerate(text):
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+            found = match[state]
+            if found:
+                start, end = position - found[0], position - found[1]
+                # Occurrences inside this one stop counting; one this overlaps keeps it from counting
+                while kept and kept[-1][0] >= start:
+                    add(kept.pop()[2], -1)
+                if not kept or kept[-1][1] < start:
+                    kept.append((start, end, found[2]))
+                    add(found[2], 1)
+            if enough:
+                # A later, longer occurrence can still replace the last ones; stop once none can
+                if remaining:
+                    stop_at = None
+                elif stop_at is None:
+                    stop_at = position + self.longest
+                elif position >= stop_at:
+                    return counts
+        return counts
+
+class EvidenceGate:
+    """
+    Decides which category questions a document needs the model for. A category whose lexicon has
+    fewer than min_evidence matches in the text gets GATED_ANSWER (a score of 0) without a call.
+    """
+
+    def __init__(self, lexicon=None, min_evidence=MIN_EVIDENCE):
+        self.lexicon = LEXICON if lexicon is None else lexicon
+        self.min_evidence = min_evidence
+        patterns = {}
+        for category, terms in self.lexicon.items():
+            for term in terms:
+                patterns.setdefault(pattern(term), []).append(category)
+        self.automaton = Automaton(patterns)
+
+    def evidence(self, text, enough=None):
+        """Lexicon matches per category (counting stops once every category has `enough`)."""
+        counts = self.automaton.count(normalize(text), enough)
+        return {category: counts.get(category, 0) for category in self.lexicon}
+
+    def gated(self, text, categories):
+        """The categories (of those given) without enough evidence in text."""
+        evidence = self.evidence(text, self.min_evidence)
+        return {category for category in categories if category in evidence and evidence[category] < self.min_evidence}
+
+_default_gate = None
+
+def gated(text, categories):
+    """EvidenceGate.gated() with the module's LEXICON and MIN_EVIDENCE."""
+    global _default_gate
+    if _default_gate is None:
+        _default_gate = EvidenceGate()
+    return _default_gate.gated(text, categories)
+
+def gated_categories(row):
+    """The categories one output row was gated on."""
+    value = row.get(GATED_COLUMN) if row else None
+    if not isinstance(value, str) or not value:
+        return set()
+    return set(value.split(GATE_SEPARATOR))
+
+def audit(df, categories):
+    """
+    Per category: documents scored, calls gated, documents sent to the model, and the share gated.
+    Rows without text (every category empty) are not counted.
+    """
+    scored = df[df[list(categories)].notna().any(axis=1)] if len(df) else df
+    gated_sets = [gated_categories(row) for row in scored.to_dict("records")]
+    rows = []
+    for category in categories:
+        count = sum(category in gated_set for gated_set in gated_sets)
+        rows.append({"Category": category, "Documents": len(scored), "Gated": count, "Sent to model": len(scored) - count,
+                     "Gated %": round(100 * count / len(scored), 1) if len(scored) else 0.0})
+    report = pd.DataFrame(rows)
+    total = {"Category": "All", "Documents": len(scored) * len(categories), "Gated": report["Gated"].sum(),
+             "Sent to model": report["Sent to model"].sum()}
+    total["Gated %"] = round(100 * total["Gated"] / total["Documents"], 1) if total["Documents"] else 0.0
+    return pd.concat([report, pd.DataFrame([total])], ignore_index=True)
+
+def audit_path(output_path):
+    """Where a stage writes the audit for its output: <output>_gate_audit.csv."""
+    return os.path.splitext(output_path)[0] + "_gate_audit.csv"
+
+def write_audit(df, categories, output_path):
+    """Prints the gate audit for a stage's output and saves it next to the output."""
+    report = audit(df, categories)
+    report.to_csv(audit_path(output_path), index=False)
+    print(f"Evidence gate (calls answered 0 without the model, per category), saved to {audit_path(output_path)}:")
+    print(report.to_string(index=False))
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Evidence gate audit of an advocacy output, or the gate's decision for documents.")
+    parser.add_argument("output", nargs="?", help="Advocacy output CSV to audit")
+    parser.add_argument("--documents", nargs="+", metavar="PDF", help="Show each PDF's evidence per category instead")
+    args = parser.parse_args()
+    if args.documents:
+        from pdf_extract import extract_pages
+        gate = EvidenceGate()
+        for path in args.documents:
+            text = "".join(page + "\n" for page in extract_pages(path))
+            evidence = gate.evidence(text)
+            print(f"{os.path.basename(path)}: " +
+                  ", ".join(f"{category} {hits}{' (gated)' if hits < gate.min_evidence else ''}" for category, hits in evidence.items()))
+    elif args.output:
+        df = pd.read_csv(args.output)
+        categories = [category for category in LEXICON if category in df.columns]
+        print(audit(df, categories).to_string(index=False))
+    else:
+        parser.error("give an advocacy output to audit or --documents")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+import os
+import hashlib
+import pandas as pd
+
+# Output columns that record what produced each answer
+TEXT_HASH_COLUMN = "Text Hash"
+MODEL_COLUMN = "Model"
+
+def short_hash(value):
+    """First 16 hex digits of the SHA-256 of a string (enough to tell prompt/document versions apart)."""
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+def prompt_hash_column(category=None):
+    """Name of the column holding the prompt hash for one question ("Testing Prompt Hash") or the stage's prompt."""
+    return f"{category} Prompt Hash" if category else "Prompt Hash"
+
+def load_previous(output_path, key_column):
+    """
+    Reads an earlier output of the same stage.
+
+    Returns:
+        dict: Document name -> previous row (empty if the file does not exist or has no hash columns).
+    """
+    if not os.path.exists(output_path):
+        return {}
+    # Keep literal "N/A" answers; only blank cells are missing
+    df = pd.read_csv(output_path, keep_default_na=False, na_values=[""])
+    if TEXT_HASH_COLUMN not in df.columns or key_column not in df.columns:
+        print(f"{output_path} has no hash columns; every cell will be recomputed.")
+        return {}
+    return {row[key_column]: row for row in df.to_dict("records")}
+
+def reusable(previous_row, answer_column, prompt_digest, text_digest, model, category=None):
+    """
+    True if the previous answer for this (document, question) cell was produced from the same
+    document text, prompt and model, and is not empty, so the model call can be skipped.
+    """
+    if not previous_row:
+        return False
+    answer = previous_row.get(answer_column)
+    if answer is None or (isinstance(answer, float) and pd.isna(answer)) or str(answer).strip() == "":
+        return False
+    return (previous_row.get(TEXT_HASH_COLUMN) == text_digest
+            and previous_row.get(MODEL_COLUMN) == model
+            and previous_row.get(prompt_hash_column(category)) == prompt_digest)
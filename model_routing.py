@@ -0,0 +1,103 @@
+from collections import Counter
+from packing import estimate_tokens
+
+# Routing rules, checked in order; the first rule whose conditions all match picks the model and
+# call options for that provider. Conditions (all optional):
+#   "stages":         stage names ("arguments", "organization", "sentiment", "advocacy", "percent")
+#   "question_types": kinds of question ("title", "description", "classification", "score", "extraction", "distribution")
+#   "min_tokens" / "max_tokens": estimated document size range
+# Per provider, "model" plus options:
+#   OpenAI: "reasoning_effort" ("low", "medium", "high"; o-series models only) and "max_completion_tokens"
+#   Gemini: "max_output_tokens"
+# A call that matches no rule keeps the calling script's own model with no extra options.
+ROUTING_RULES = [
+    # Enumerated answers (Org Category, Industry): a fast non-reasoning model with a tight output cap.
+    # The title and description questions keep the script's model: finding the organization's name
+    # means reading the whole comment.
+    {"question_types": ["classification"],
+     "openai": {"model": "gpt-4o-mini", "max_completion_tokens": 20},
+     "gemini": {"model": "gemini-2.0-flash-lite", "max_output_tokens": 20}},
+    # Long argument extraction keeps the reasoning model and gets more effort
+    {"stages": ["arguments"], "min_tokens": 8000,
+     "openai": {"model": "o3-mini", "reasoning_effort": "high"},
+     "gemini": {"model": "gemini-2.0-flash"}},
+    # Short comments: the same model with less reasoning
+    {"stages": ["arguments"], "max_tokens": 2000,
+     "openai": {"model": "o3-mini", "reasoning_effort": "low"},
+     "gemini": {"model": "gemini-2.0-flash"}},
+    # The % content answer is nine whole numbers; low effort is enough with the JSON schema
+    {"stages": ["percent"],
+     "openai": {"model": "o3-mini", "reasoning_effort": "low"},
+     "gemini": {"model": "gemini-2.0-flash"}},
+]
+
+def _matches(rule, stage, tokens, question_type):
+    if "stages" in rule and stage not in rule["stages"]:
+        return False
+    if "question_types" in rule and question_type not in rule["question_types"]:
+        return False
+    if "min_tokens" in rule and tokens < rule["min_tokens"]:
+        return False
+    if "max_tokens" in rule and tokens > rule["max_tokens"]:
+        return False
+    return True
+
+def route(stage, provider, text="", question_type=None, default_model=None, rules=None, tokens=None):
+    """
+    Picks the model for one call.
+
+    Args:
+        stage (str): The calling stage
+        provider (str): "openai" or "gemini"
+        text (str): The document text (only its estimated token count is used)
+        question_type (str, optional): The kind of question being asked
+        default_model (str): The model to use when no rule matches
+        rules (list, optional): Rules to use instead of ROUTING_RULES
+        tokens (int, optional): The document's token count, if already known (instead of text)
+
+    Returns:
+        tuple: (model name, dict of call options in the provider's own keyword format)
+    """
+    if tokens is None:
+        tokens = estimate_tokens(text)
+    for rule in ROUTING_RULES if rules is None else rules:
+        if provider in rule and _matches(rule, stage, tokens, question_type):
+            settings = dict(rule[provider])
+            return settings.pop("model", default_model), provider_options(provider, settings)
+    return default_model, {}
+
+def provider_options(provider, settings):
+    """Turns rule settings into keyword arguments for chat.completions.create / generate_content."""
+    if provider == "gemini":
+        return {"generation_config": settings} if settings else {}
+    return settings
+
+def routed_calls(stage, provider, question_types, default_model, routing=True, rules=None):
+    """
+    The calls one document makes to each model, for pacing every call against the rate limits of the
+    model it is routed to (scheduler.SizeScheduler.for_routing).
+
+    Args:
+        question_types (list): The question type of each call made per document (None when untyped)
+        routing (bool): The script's MODEL_ROUTING; when False every call goes to default_model
+
+    Returns:
+        callable: document tokens -> {model: calls}
+    """
+    def calls(tokens):
+        return dict(Counter(route(stage, provider, question_type=question_type, default_model=default_model, rules=rules,
+                                  tokens=tokens)[0] if routing else default_model for question_type in question_types))
+    return calls
+
+def provider_routing(stage, text="", question_type=None, routing=True, rules=None):
+    """
+    Routing for a Hedger or FailoverRouter call, whose providers each need options in their own format.
+
+    Returns:
+        callable: provider -> (model, call options), the provider's own model being the default
+    """
+    def routed(provider):
+        if not routing:
+            return provider.model, {}
+        return route(stage, provider.name, text, question_type, default_model=provider.model, rules=rules)
+    return routed
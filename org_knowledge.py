@@ -0,0 +1,205 @@
+import os
+import re
+import csv
+import json
+import difflib
+import threading
+import unicodedata
+try:
+    import fcntl  # locks the knowledge base file while processes sharing it save (POSIX only)
+except ImportError:
+    fcntl = None
+
+# Classification fields reused for every comment from the same organization
+FIELDS = ["Main Function", "Org Category", "Industry"]
+
+# Values for the "Classification Source" column
+SOURCE_MODEL = "model"
+SOURCE_KNOWLEDGE_BASE = "knowledge base"
+SOURCE_OVERRIDE = "override"
+
+# Trailing legal-form words that do not change which organization a name refers to
+LEGAL_SUFFIXES = {"inc", "incorporated", "llc", "ltd", "limited", "corp", "corporation", "co", "company",
+                  "plc", "lp", "llp", "pbc", "gmbh", "ag", "sa"}
+# Different names for the same organization (normalized name -> normalized canonical name).
+# Add project-specific ones through the Aliases column of the overrides file.
+BUILTIN_ALIASES = {
+    "alphabet": "google",
+    "facebook": "meta",
+    "meta platforms": "meta",
+    "international business machines": "ibm",
+}
+# Minimum difflib similarity (0-1) for two normalized names to count as the same organization
+FUZZY_THRESHOLD = 0.92
+# Seconds to wait for another thread that is classifying the same organization
+CLAIM_TIMEOUT = 300
+
+def normalize_org_name(name):
+    """
+    Lower-case words without accents, punctuation, a leading "the" or trailing legal suffixes
+    ("Google LLC" -> "google"). Words in other scripts are kept ("清华大学" stays "清华大学").
+    """
+    name = "".join(character for character in unicodedata.normalize("NFKD", str(name))
+                   if not unicodedata.combining(character)).casefold()
+    name = name.replace("&", " and ").replace(".", "")
+    words = re.findall(r"[^\W_]+", name)
+    if words[:1] == ["the"]:
+        words = words[1:]
+    while len(words) > 1 and words[-1] in LEGAL_SUFFIXES:
+        words = words[:-1]
+    return " ".join(words)
+
+class OrgKnowledgeBase:
+    """
+    Persistent store of organization classifications keyed on the normalized organization name.
+
+    A name is first mapped through the aliases, then matched against manual overrides and stored
+    names, and finally fuzzy-matched against stored names that share a word with it. claim()/add() make sure that when several threads meet a new
+    organization at the same time, only one of them classifies it and the others reuse the result.
+    """
+
+    def __init__(self, path, overrides_path=None, threshold=FUZZY_THRESHOLD):
+        self.path = path
+        self.threshold = threshold
+        self.entries = {}
+        self.aliases = dict(BUILTIN_ALIASES)
+        self._file_aliases = {}  # aliases kept in the knowledge base file itself
+        self.overrides = {}
+        self._words = {}  # word -> normalized names containing it (in-memory index for fuzzy lookups)
+        self._pending = {}  # normalized name -> Event set when its classification is stored
+        self._added = set()  # normalized names classified by this process, written over the file's entries on save
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        data = self._read()
+        self._file_aliases = data.get("aliases", {})
+        self.aliases.update(self._file_aliases)
+        for key, entry in data.get("entries", {}).items():
+            self._store(key, entry)
+        if overrides_path and os.path.exists(overrides_path):
+            self.load_overrides(overrides_path)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r", encoding="utf-8") as file:
+            return json.load(file)
+
+    def load_overrides(self, overrides_path):
+        """
+        Reads manual classifications from a CSV with columns Org Title, Main Function, Org Category,
+        Industry and optionally Aliases (other names separated by ";"). Overrides always win.
+        """
+        with open(overrides_path, "r", encoding="utf-8", newline="") as file:
+            for row in csv.DictReader(file):
+                key = normalize_org_name(row["Org Title"])
+                self.overrides[key] = {"Org Title": row["Org Title"], **{field: row.get(field, "") for field in FIELDS}}
+                for alias in filter(None, (alias.strip() for alias in (row.get("Aliases") or "").split(";"))):
+                    self.aliases[normalize_org_name(alias)] = key
+                self._index(key)
+
+    def _index(self, key):
+        for word in key.split():
+            self._words.setdefault(word, set()).add(key)
+
+    def _store(self, key, entry):
+        self.entries[key] = entry
+        self._index(key)
+
+    def _resolve(self, key):
+        """Normalized name of the stored organization this name refers to, or None."""
+        key = self.aliases.get(key, key)
+        if key in self.overrides or key in self.entries:
+            return key
+        candidates = set()
+        for word in key.split():
+            candidates |= self._words.get(word, set())
+        best, best_score = None, self.threshold
+        for candidate in candidates:
+            score = difflib.SequenceMatcher(None, key, candidate).ratio()
+            if score >= best_score:
+                best, best_score = candidate, score
+        return best
+
+    def _entry(self, key):
+        if key in self.overrides:
+            return {**self.overrides[key], "Source": SOURCE_OVERRIDE}
+        return {**self.entries[key], "Source": SOURCE_KNOWLEDGE_BASE}
+
+    def lookup(self, org_title):
+        """
+        Returns:
+            dict or None: The stored classification (FIELDS plus "Source") for this organization or a variant of its name.
+        """
+        key = normalize_org_name(org_title)
+        if not key:
+            return None
+        with self._lock:
+            key = self._resolve(key)
+            return self._entry(key) if key else None
+
+    def claim(self, org_title):
+        """
+        Returns the stored classification, waiting if another thread is classifying the same
+        organization right now. Returns None when the caller should classify it and then call add().
+        """
+        key = normalize_org_name(org_title)
+        if not key:
+            # Nothing left of the name to match on; classify it without the knowledge base
+            return None
+        key = self.aliases.get(key, key)
+        while True:
+            with self._lock:
+                resolved = self._resolve(key)
+                if resolved:
+                    self.hits += 1
+                    return self._entry(resolved)
+                event = self._pending.get(key)
+                if event is None:
+                    self.misses += 1
+                    self._pending[key] = threading.Event()
+                    return None
+            if not event.wait(CLAIM_TIMEOUT):
+                # The other thread never finished; classify independently
+                with self._lock:
+                    self.misses += 1
+                return None
+
+    def add(self, org_title, classification):
+        """Stores a model classification (skipped if any field is missing) and wakes threads waiting on it."""
+        key = normalize_org_name(org_title)
+        if not key:
+            return
+        key = self.aliases.get(key, key)
+        with self._lock:
+            if all(classification.get(field) not in (None, "") for field in FIELDS):
+                self._store(key, {"Org Title": org_title, **{field: classification[field] for field in FIELDS}})
+                self._added.add(key)
+            event = self._pending.pop(key, None)
+        if event:
+            event.set()
+
+    def save(self):
+        """
+        Merges this process's classifications into the file and writes it atomically (overrides stay
+        in their own file). The file is locked while merging, so processes sharing one knowledge base
+        (queue workers, repair runs) keep each other's entries instead of the last writer winning.
+        """
+        with open(f"{self.path}.lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)  # released when the lock file is closed
+            on_disk = self._read()
+            with self._lock:
+                for key, entry in on_disk.get("entries", {}).items():
+                    if key not in self._added:
+                        self._store(key, entry)
+                self._file_aliases = {**on_disk.get("aliases", {}), **self._file_aliases}
+                data = {"entries": self.entries, "aliases": self._file_aliases}
+                temp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as file:
+                    json.dump(data, file, indent=1, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+
+    def summary(self):
+        return (f"Org knowledge base: {len(self.entries)} organizations, {len(self.overrides)} overrides; "
+                f"{self.hits} reused, {self.misses} classified by the model")
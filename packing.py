@@ -0,0 +1,149 @@
+import json
+import re
+
+# Rough token estimate used for packing decisions (about four characters per token for English prose)
+CHARS_PER_TOKEN = 4
+
+# Defaults: documents up to PACK_MAX_DOC_TOKENS are packed together until PACK_TOKEN_BUDGET is reached
+PACK_TOKEN_BUDGET = 12000
+PACK_MAX_DOC_TOKENS = 1500
+
+def estimate_tokens(text):
+    """Approximate number of tokens in a piece of text."""
+    return max(1, len(text or "") // CHARS_PER_TOKEN)
+
+def pack_documents(documents, token_budget=PACK_TOKEN_BUDGET, max_doc_tokens=PACK_MAX_DOC_TOKENS):
+    """
+    Groups short documents into packs that fit a token budget.
+
+    Args:
+        documents (dict): Document name -> extracted text
+        token_budget (int): Maximum estimated document tokens per packed request
+        max_doc_tokens (int): Documents larger than this are never packed
+
+    Returns:
+        tuple: (list of packs, each a list of document names; list of names to run alone)
+    """
+    packs, singles = [], []
+    current, current_tokens = [], 0
+    # Largest first so packs fill evenly (first-fit decreasing on a single bin at a time)
+    for name in sorted(documents, key=lambda name: estimate_tokens(documents[name]), reverse=True):
+        tokens = estimate_tokens(documents[name])
+        if tokens > max_doc_tokens:
+            singles.append(name)
+            continue
+        if current and current_tokens + tokens > token_budget:
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(name)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    # A pack of one gains nothing over a normal request
+    for pack in [pack for pack in packs if len(pack) == 1]:
+        packs.remove(pack)
+        singles.extend(pack)
+    return packs, singles
+
+def packed_question(question, answer_format):
+    """
+    Wraps a stage's instructions for a packed request.
+
+    Args:
+        question (str): The stage's normal instructions for one document
+        answer_format (str): What each per-document value in the JSON answer should look like
+
+    Returns:
+        str: Instructions asking for one answer per delimited document ID
+    """
+    return (
+        f"{question}\n\n"
+        "The text that follows contains several separate documents. Each document starts with a line "
+        "<<<DOC id>>> and ends with a line <<<END id>>>. Wherever the instructions above refer to the text, "
+        "the document or the feedback message, they mean each delimited document on its own. Apply them to "
+        "each document independently; do not let one document influence the answer for another.\n\n"
+        "Output Format: Respond with ONLY a JSON object whose keys are the document IDs (e.g., \"D1\") and whose "
+        f"values are {answer_format}. Include every document ID exactly once."
+    )
+
+def packed_text(documents, pack):
+    """
+    Builds the delimited document block for one pack.
+
+    Returns:
+        tuple: (text block, dict of short document ID -> document name)
+    """
+    ids = {f"D{index}": name for index, name in enumerate(pack, 1)}
+    block = "\n\n".join(f"<<<DOC {doc_id}>>>\n{documents[name]}\n<<<END {doc_id}>>>" for doc_id, name in ids.items())
+    return block, ids
+
+def parse_packed_response(response_text, ids):
+    """
+    Splits a packed JSON answer back into per-document answers.
+
+    Returns:
+        dict: Document name -> answer value, only for IDs that were present in the response
+    """
+    if not response_text:
+        return {}
+    text = response_text.strip()
+    if text.startswith("```"):
+        text = re.sub(r"^```(?:json)?|```$", "", text).strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {ids[doc_id]: value for doc_id, value in data.items() if doc_id in ids and value not in (None, "")}
+
+def is_text_answer(answer):
+    """A per-document answer the stage asked for "as a string": non-empty text."""
+    return isinstance(answer, str) and bool(answer.strip())
+
+def run_pack(documents, pack, call_packed, call_single, valid=None):
+    """
+    Answers one pack with a single request and re-runs alone any document whose answer is missing
+    or malformed.
+
+    Args:
+        documents (dict): Document name -> extracted text
+        pack (list): Document names in this pack
+        call_packed (callable): block text -> raw model response (str or None)
+        call_single (callable): document text -> answer for one document
+        valid (callable, optional): per-document answer -> whether it has the requested format
+            (e.g. is_text_answer); without it any present answer is accepted
+
+    Returns:
+        tuple: (dict of document name -> answer, list of names that had to be re-run alone)
+    """
+    block, ids = packed_text(documents, pack)
+    answers = parse_packed_response(call_packed(block), ids)
+    rerun = [name for name in pack if name not in answers or (valid and not valid(answers[name]))]
+    for name in rerun:
+        answers[name] = call_single(documents[name])
+    return answers, rerun
+
+def answer_packs(executor, scheduler, documents, packs, singles, call_packed, call_single, valid=None):
+    """
+    Submits every pack, and every document that runs alone, through a SizeScheduler (largest first,
+    paced by its rate limits) and yields each one's future as it completes.
+
+    Args:
+        scheduler (SizeScheduler): e.g. SizeScheduler.for_model(MODEL, workers)
+        (other arguments as for run_pack)
+
+    Yields:
+        tuple: (document names of the pack or single, future of (dict of name -> answer, names re-run alone))
+    """
+    work = packs + [[name] for name in singles]
+    sizes = {index: sum(estimate_tokens(documents[name]) for name in names) for index, names in enumerate(work)}
+
+    def answer(index):
+        names = work[index]
+        if len(names) == 1:
+            return {names[0]: call_single(documents[names[0]])}, []
+        return run_pack(documents, names, call_packed, call_single, valid)
+
+    for index, future in scheduler.run(executor, answer, list(sizes), sizes):
+        yield work[index], future
@@ -0,0 +1,43 @@
+import os
+
+# Scraper.py writes each docket into its own subdirectory of the corpus root (one partition per
+# docket). Stage scripts list their documents with list_pdfs(), so a document is named by its
+# partition-relative path ("NTIA-2023-0009/comment.pdf") and os.path.join(root, name) still finds it.
+
+# Per-partition record of downloaded attachments (written by downloader.py): one JSON object per
+# line with the url, original name, stored file name, sha256 and size
+MANIFEST_NAME = "downloads.jsonl"
+
+def docket_id(document_id):
+    """Docket of a regulations.gov document ID ("NTIA-2023-0009-0001" -> "NTIA-2023-0009")."""
+    parts = document_id.split("-")
+    return "-".join(parts[:3]) if len(parts) > 3 else document_id
+
+def list_partitions(root):
+    """Docket partitions (subdirectories) under the corpus root."""
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir() and not entry.name.startswith("."))
+
+def list_pdfs(root, dockets=None):
+    """
+    Lists the PDFs to analyze under a corpus root.
+
+    Args:
+        root (str): Corpus root (or a flat directory of PDFs, as before partitioning)
+        dockets (list, optional): Only these docket partitions; None means every partition
+            plus any PDFs directly in root
+
+    Returns:
+        list: Names relative to root, "<docket>/<file>.pdf" for partitioned documents
+    """
+    names = []
+    if dockets is None:
+        names += sorted(f for f in os.listdir(root) if f.lower().endswith(".pdf"))
+    for partition in list_partitions(root):
+        if dockets is not None and partition not in dockets:
+            continue
+        names += sorted(f"{partition}/{f}" for f in os.listdir(os.path.join(root, partition)) if f.lower().endswith(".pdf"))
+    return names
+
+def docket_of(name):
+    """Docket partition of a document name from list_pdfs(), or None for a flat-directory document."""
+    return name.split("/", 1)[0] if "/" in name else None
@@ -0,0 +1,186 @@
+import os
+import atexit
+import hashlib
+import threading
+import multiprocessing
+import concurrent.futures
+
+# PDFs with at least this many pages are split into page ranges and parsed across a process pool.
+# Smaller PDFs are parsed in the calling thread as before. Both values can be changed at run time,
+# e.g. `pdf_extract.LARGE_PDF_PAGES = 50`.
+LARGE_PDF_PAGES = 100
+PAGES_PER_RANGE = 25
+EXTRACT_PROCESSES = os.cpu_count() or 4
+# The pool is created lazily from inside the stage scripts' worker threads. Forking a process whose
+# other threads hold locks (HTTP clients, logging, MuPDF) can deadlock the children, so workers are
+# started from a clean forkserver process instead (spawn where forkserver is unavailable, e.g. Windows).
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# OCR fallback: pages that yield fewer than OCR_MIN_CHARS characters and contain an image (e.g.,
+# scanned letters) are rendered and run through Tesseract in the process pool. Results are cached on
+# disk by (PDF contents, page, DPI, language), checked before rendering, so the same page is never
+# rendered or OCR'd twice across runs or stages.
+OCR_FALLBACK = True
+OCR_MIN_CHARS = 10
+OCR_DPI = 300
+OCR_LANGUAGE = "eng"
+OCR_CACHE_DIR = os.path.expanduser("~/.cache/thepoliticsofusaipolicy/ocr")
+
+try:
+    import pytesseract  # Local OCR engine (requires the tesseract binary)
+    from PIL import Image
+except ImportError:
+    pytesseract = None
+
+_pool = None
+_pool_lock = threading.Lock()
+# The missing-OCR warning is printed once per process, not once per scanned document
+_ocr_warned = False
+
+def _get_pool():
+    """Create the shared process pool on first use (only runs that meet a large PDF pay for it)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = concurrent.futures.ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES,
+                                                           mp_context=multiprocessing.get_context(START_METHOD))
+            atexit.register(_pool.shutdown)
+        return _pool
+
+def page_count(pdf_path, engine="fitz"):
+    """Number of pages in a PDF."""
+    if engine == "pypdf2":
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            return len(PyPDF2.PdfReader(file).pages)
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return doc.page_count
+
+def page_ranges(total_pages, pages_per_range):
+    """Split [0, total_pages) into consecutive (start, stop) ranges."""
+    return [(start, min(start + pages_per_range, total_pages)) for start in range(0, total_pages, pages_per_range)]
+
+def extract_page_range(pdf_path, start, stop, engine="fitz"):
+    """
+    Extract the text of pages [start, stop). Runs inside a worker process, which opens its own
+    handle on the file, so several workers can parse the same PDF at once.
+
+    Returns:
+        list: One string per page, in page order.
+    """
+    if engine == "pypdf2":
+        import PyPDF2
+        with open(pdf_path, 'rb') as file:
+            reader = PyPDF2.PdfReader(file)
+            return [reader.pages[page_num].extract_text() for page_num in range(start, stop)]
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        return [doc[page_num].get_text("text") for page_num in range(start, stop)]
+
+def file_digest(path):
+    """SHA-256 of a file's contents, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def ocr_cache_path(cache_dir, pdf_digest, page_num, dpi, language):
+    """Cache file for one page's OCR text, keyed on the PDF's contents, the page and the OCR settings."""
+    key = hashlib.sha256(f"{pdf_digest}:{page_num}:{dpi}:{language}".encode()).hexdigest()
+    return os.path.join(cache_dir, key[:2], f"{key}.txt")
+
+def ocr_page(pdf_path, page_num, dpi, language, cache_path):
+    """
+    Render one page, OCR it and cache the text at cache_path. Runs inside a worker process.
+
+    Returns:
+        str: The recognized text of the page.
+    """
+    import fitz  # PyMuPDF is used for rendering regardless of the text engine
+    with fitz.open(pdf_path) as doc:
+        pixmap = doc[page_num].get_pixmap(dpi=dpi)
+    mode = "RGBA" if pixmap.alpha else "RGB"
+    image = Image.frombytes(mode, (pixmap.width, pixmap.height), pixmap.samples)
+    text = pytesseract.image_to_string(image, lang=language)
+
+    # Write atomically so concurrent workers never read a half-written cache entry
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temp_path, cache_path)
+    return text
+
+def ocr_missing_pages(pdf_path, pages):
+    """
+    Replace text-less pages with OCR output, OCR'ing all of them in parallel. Pages without any
+    image (blank separators, a lone page number) cannot be scans and are left as they are, and
+    pages OCR'd before are read from the cache without rendering them.
+
+    Returns:
+        list: The pages, with OCR text substituted where the text layer was empty.
+    """
+    missing = [page_num for page_num, page in enumerate(pages) if len((page or "").strip()) < OCR_MIN_CHARS]
+    if not missing or not OCR_FALLBACK:
+        return pages
+    import fitz  # PyMuPDF
+    with fitz.open(pdf_path) as doc:
+        missing = [page_num for page_num in missing if doc[page_num].get_images()]
+    if not missing:
+        return pages
+    if pytesseract is None:
+        global _ocr_warned
+        with _pool_lock:
+            warn, _ocr_warned = not _ocr_warned, True
+        if warn:
+            print(f"OCR skipped for scanned pages (first: {len(missing)} page(s) of {pdf_path}): "
+                  "install pytesseract and Pillow to enable it.")
+        return pages
+    pdf_digest = file_digest(pdf_path)
+    pages = list(pages)
+    futures = {}
+    for page_num in missing:
+        cache_path = ocr_cache_path(OCR_CACHE_DIR, pdf_digest, page_num, OCR_DPI, OCR_LANGUAGE)
+        if os.path.exists(cache_path):
+            with open(cache_path, "r", encoding="utf-8") as file:
+                pages[page_num] = file.read()
+        else:
+            # Settings are passed explicitly so worker processes use the caller's current values
+            futures[page_num] = _get_pool().submit(ocr_page, pdf_path, page_num, OCR_DPI, OCR_LANGUAGE, cache_path)
+    for page_num, future in futures.items():
+        try:
+            pages[page_num] = future.result()
+        except Exception as e:
+            print(f"OCR failed for page {page_num + 1} of {pdf_path}: {e}")
+    return pages
+
+def extract_pages(pdf_path, engine="fitz", large_pdf_pages=None, pages_per_range=None):
+    """
+    Extract every page of a PDF, splitting large documents across the process pool.
+
+    Args:
+        pdf_path (str): The full path to the PDF file
+        engine (str): "fitz" (PyMuPDF) or "pypdf2", matching the calling script's extractor
+        large_pdf_pages (int, optional): Page threshold for parallel parsing (default LARGE_PDF_PAGES)
+        pages_per_range (int, optional): Pages per worker task (default PAGES_PER_RANGE)
+
+    Returns:
+        list: One string per page, reassembled in page order, with OCR text for text-less pages.
+    """
+    large_pdf_pages = large_pdf_pages or LARGE_PDF_PAGES
+    pages_per_range = pages_per_range or PAGES_PER_RANGE
+    total_pages = page_count(pdf_path, engine)
+    if total_pages < large_pdf_pages:
+        pages = extract_page_range(pdf_path, 0, total_pages, engine)
+    else:
+        pool = _get_pool()
+        futures = [pool.submit(extract_page_range, pdf_path, start, stop, engine)
+                   for start, stop in page_ranges(total_pages, pages_per_range)]
+        pages = []
+        # Futures are read in submission order, so pages come back in document order
+        for future in futures:
+            pages.extend(future.result())
+    # Scanned pages have no text layer; only those pages are rendered and OCR'd
+    return ocr_missing_pages(pdf_path, pages)
@@ -0,0 +1,140 @@
+import json
+import numpy as np
+import pandas as pd
+import tracing
+
+# The nine topic columns written by percentoutputGPT.py / percentoutputGEm.py, in output order
+PERCENT_CATEGORIES = ['Testing', 'Privacy', 'Governance', 'Auth', 'Global', 'Labor', 'Ethics', 'Energy', 'Other']
+
+# Row status values written to the "Status" column in structured mode
+STATUS_OK = "ok"              # the model returned whole numbers that already summed to 100
+STATUS_REPAIRED = "repaired"  # the model's answer was valid but had to be rescaled/rounded to sum to 100
+STATUS_FAILED = "failed"      # the API call failed or the answer could not be parsed; no percentages are reported
+
+# JSON schema for OpenAI structured outputs (strict mode requires additionalProperties to be false)
+OPENAI_PERCENT_SCHEMA = {
+    "name": "topic_percentages",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {category: {"type": "integer"} for category in PERCENT_CATEGORIES},
+        "required": PERCENT_CATEGORIES,
+        "additionalProperties": False,
+    },
+}
+
+# Equivalent response schema for Gemini (OpenAPI subset, no additionalProperties)
+GEMINI_PERCENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {category: {"type": "INTEGER"} for category in PERCENT_CATEGORIES},
+    "required": PERCENT_CATEGORIES,
+}
+
+# Output instructions that replace the "Testing: A ..." line format in structured mode
+STRUCTURED_OUTPUT_INSTRUCTIONS = (
+    "Provide ONLY a JSON object with exactly these nine keys: "
+    + ", ".join(PERCENT_CATEGORIES)
+    + ". Each value must be a whole number (e.g., 13 not 12.5) and the nine values must sum to exactly 100. "
+    "Do not include any text outside the JSON object."
+)
+
+# Per-document answer format used when several documents are packed into one request
+PACKED_ANSWER_FORMAT = (
+    "JSON objects with exactly these nine keys: " + ", ".join(PERCENT_CATEGORIES)
+    + ", each a whole number, summing to exactly 100 for that document"
+)
+
+@tracing.traced("parse", text_args=("response_text",))
+def parse_structured_response(response_text):
+    """
+    Parses a JSON percentage answer into a list of values in PERCENT_CATEGORIES order.
+
+    Parameters:
+        response_text (str or None): The raw model response, or None if the API call failed.
+
+    Returns:
+        list or None: Nine non-negative floats, or None if the response is missing, is not a
+        nine-key JSON object, or contains a value that is not a non-negative number.
+    """
+    if not response_text:
+        return None
+    text = response_text.strip()
+    # Some models wrap JSON in a markdown code fence even when asked not to
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    values = []
+    for category in PERCENT_CATEGORIES:
+        value = data.get(category)
+        if isinstance(value, str):
+            try:
+                value = float(value.strip().replace('%', ''))
+            except ValueError:
+                return None
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value) or value < 0:
+            return None
+        values.append(float(value))
+    return values
+
+def valid_packed_answer(answer):
+    """Whether one document's value in a packed answer (object or JSON text) is a usable percentage answer."""
+    return parse_structured_response(answer if isinstance(answer, str) else json.dumps(answer)) is not None
+
+def normalize_percent_matrix(raw):
+    """
+    Rounds every row of a percentage matrix to whole numbers summing to 100 in one vectorized
+    largest-remainder pass.
+
+    Parameters:
+        raw (array-like): An (n_rows, 9) float matrix; rows containing NaN are treated as failed.
+
+    Returns:
+        tuple: (percentages, status) where percentages is an (n_rows, 9) int64 matrix (zeros for
+        failed rows) and status is an array of STATUS_OK / STATUS_REPAIRED / STATUS_FAILED.
+    """
+    raw = np.asarray(raw, dtype=float).reshape(-1, len(PERCENT_CATEGORIES))
+    sums = np.nansum(raw, axis=1)
+    failed = np.isnan(raw).any(axis=1) | (sums <= 0)
+    safe = np.where(failed[:, None], 0.0, raw)
+
+    # Rescale each row to 100 and take the integer floor of every share
+    scaled = safe * (100.0 / np.where(failed, 1.0, sums))[:, None]
+    floors = np.floor(scaled)
+    remainders = scaled - floors
+    shortfall = (100 - floors.sum(axis=1)).astype(np.int64)
+    shortfall[failed] = 0
+
+    # Give the missing units to the categories with the largest remainders (stable on ties)
+    order = np.argsort(-remainders, axis=1, kind='stable')
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(raw.shape[1])[None, :].repeat(raw.shape[0], axis=0), axis=1)
+    percentages = (floors + (ranks < shortfall[:, None])).astype(np.int64)
+
+    unchanged = (percentages == safe).all(axis=1)
+    status = np.where(failed, STATUS_FAILED, np.where(unchanged, STATUS_OK, STATUS_REPAIRED))
+    return percentages, status
+
+def normalize_percent_frame(df):
+    """
+    Normalizes the category columns of a results DataFrame and adds a "Status" column.
+
+    Parameters:
+        df (pd.DataFrame): Results with one float column per category (NaN for failed rows).
+
+    Returns:
+        pd.DataFrame: A copy with integer category columns (<NA> for failed rows) and a "Status" column.
+    """
+    df = df.copy()
+    percentages, status = normalize_percent_matrix(df[PERCENT_CATEGORIES].to_numpy(dtype=float))
+    df[PERCENT_CATEGORIES] = pd.DataFrame(percentages, index=df.index, columns=PERCENT_CATEGORIES).astype('Int64')
+    # Failed rows must not report a fabricated distribution (e.g., "Other: 100")
+    df.loc[status == STATUS_FAILED, PERCENT_CATEGORIES] = pd.NA
+    df['Status'] = status
+    return df
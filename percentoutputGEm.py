@@ -1,28 +1,84 @@
 import os
+import random
+import json
 import pandas as pd
-import PyPDF2
+from pdf_extract import extract_pages
+import tracing
+import planner
+from catalog import select_documents, record_results, merge_previous
 import google.generativeai as genai
 from tqdm import tqdm
 import concurrent.futures
 from functools import partial
+from percent_schema import (
+    PERCENT_CATEGORIES, GEMINI_PERCENT_SCHEMA, STRUCTURED_OUTPUT_INSTRUCTIONS,
+    PACKED_ANSWER_FORMAT, parse_structured_response, valid_packed_answer, normalize_percent_frame,
+)
+from topic_prefilter import TopicPrefilter, calibration_report
+from packing import pack_documents, packed_question, answer_packs
+from incremental import TEXT_HASH_COLUMN, short_hash, prompt_hash_column
+from model_routing import route, routed_calls
+from scheduler import SizeScheduler, document_sizes
 
+# Ask for a fixed nine-key JSON object and normalize all rows together in main()
+STRUCTURED_OUTPUT = True
+
+# Score documents locally first; only uncertain ones (plus a calibration sample) go to the model
+PREFILTER = True
+CALIBRATION_RATE = 0.05
+
+# Structured mode only: pack short documents into one request with delimited IDs
+PACKING = False
+PACK_TOKEN_BUDGET = 12000
+PACK_MAX_DOC_TOKENS = 1500
+
+# Default model. With MODEL_ROUTING the rules in model_routing.py may pick another model (and output cap)
+# per document; model rows record the serving model in the "Model" column.
+# Packed requests always use MODEL; documents sent alone are routed like in process_pdf.
+MODEL = "gemini-2.0-flash"
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     text = ""
     try:
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
+        text = "".join(extract_pages(pdf_path, engine="pypdf2"))
     except Exception as e:
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
 
-def analyze_with_gemini(text, api_key):
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-2.0-flash')
-    prompt = f"""
-    Context: In October 2023, President Biden signed Executive Order (EO) 14110 titled, "Executive Order on Safe, Secure, and Trustworthy Development and Use of Artificial Intelligence". This Executive Order called on many agencies in the U.S. government to ask the U.S. public for feedback on how they think the Executive Order should be improved. The text that follows is one of the feedback messages from the public to the National Institute of Standards and Technology (NIST) government agency. 
+LEGACY_OUTPUT_FORMAT = """Provide ONLY the percentages as whole numbers (e.g., 13 not 12.5%) in this exact format:
+    Testing: A
+    Privacy: B
+    Governance: C
+    Auth: D
+    Global: E
+    Labor: F
+    Ethics: G
+    Energy: H
+    Other: I"""
+
+def build_prompt(text, structured=False, packed=False):
+    output_format = STRUCTURED_OUTPUT_INSTRUCTIONS if structured else LEGACY_OUTPUT_FORMAT
+    subject = "is one of the feedback messages"
+    if packed:
+        output_format = packed_question("", PACKED_ANSWER_FORMAT).strip()
+        subject = "contains several separate feedback messages"
+    return f"""
+    Context: In October 2023, President Biden signed Executive Order (EO) 14110 titled, "Executive Order on Safe, Secure, and Trustworthy Development and Use of Artificial Intelligence". This Executive Order called on many agencies in the U.S. government to ask the U.S. public for feedback on how they think the Executive Order should be improved. The text that follows {subject} from the public to the National Institute of Standards and Technology (NIST) government agency. 
 
 1. Model Security and Vulnerability Testing: Concerns about AI's impact on personal privacy, the effectiveness of data protection strategies, and alternatives for securing sensitive data.
 2. Data Privacy and Protection Mechanisms: Concerns about AI's impact on personal privacy, the effectiveness of data protection strategies, and alternatives for securing sensitive data.
@@ -36,27 +92,56 @@ def analyze_with_gemini(text, api_key):
 
     You will evaulate the percent of each document that is discussing each of these main topics. The percentages must sum to exactly 100%. 
 
-    Provide ONLY the percentages as whole numbers (e.g., 13 not 12.5%) in this exact format:
-    Testing: A
-    Privacy: B
-    Governance: C
-    Auth: D
-    Global: E
-    Labor: F
-    Ethics: G
-    Energy: H
-    Other: I
+    {output_format}
 
     Text for analysis:
     {text}
     """
+
+@tracing.traced("model_call", text_args=("text",))
+def analyze_with_gemini(text, api_key, model_name=MODEL, options=None):
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(model_name)
+    prompt = build_prompt(text)
     try:
-        response = model.generate_content(prompt)
+        response = model.generate_content(prompt, **(options or {}))
         return response.text
     except Exception as e:
         print(f"API Error: {e}")
         return "Testing: 0\nPrivacy: 0\nGovernance: 0\nAuth: 0\nGlobal: 0\nLabor: 0\nEthics: 0\nEnergy: 0\nOther: 100"
 
+@tracing.traced("model_call", text_args=("text",))
+def analyze_with_gemini_structured(text, api_key, model_name=MODEL, options=None):
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(model_name)
+    # Routed settings (e.g. max_output_tokens) are added to the JSON schema configuration
+    routed_config = (options or {}).get("generation_config", {})
+    try:
+        response = model.generate_content(
+            build_prompt(text, structured=True),
+            generation_config={"response_mime_type": "application/json", "response_schema": GEMINI_PERCENT_SCHEMA, **routed_config},
+        )
+        return response.text
+    except Exception as e:
+        # No fallback distribution; the row is flagged as failed during normalization
+        print(f"API Error: {e}")
+        return None
+
+@tracing.traced("model_call", text_args=("block",))
+def analyze_packed_with_gemini(block, api_key):
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(MODEL)
+    try:
+        response = model.generate_content(
+            build_prompt(block, structured=True, packed=True),
+            generation_config={"response_mime_type": "application/json"},
+        )
+        return response.text
+    except Exception as e:
+        print(f"API Error: {e}")
+        return None
+
+@tracing.traced("parse", text_args=("response_text",))
 def parse_percentages(response_text):
     try:
         lines = response_text.strip().split('\n')
@@ -94,13 +179,40 @@ def parse_percentages(response_text):
         print(f"Error parsing response: {e}")
         return {'Testing': 0, 'Privacy': 0, 'Governance': 0, 'Auth': 0, 'Global': 0, 'Labor': 0, 'Ethics': 0, 'Energy': 0, 'Other': 100}
 
-def process_pdf(pdf_file, pdf_directory, api_key):
+def hash_columns(text, packed=False):
+    """Text Hash and Prompt Hash columns of a model row; the prompt hash tells packed answers from single ones."""
+    return {TEXT_HASH_COLUMN: short_hash(text), prompt_hash_column(): short_hash(build_prompt("", STRUCTURED_OUTPUT or packed, packed))}
+
+def apply_prefilter(pdf_file, text, prefilter):
+    if not prefilter:
+        return None, {}
+    local, confident = prefilter.classify(text)
+    if confident and random.random() >= CALIBRATION_RATE:
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, local)), 'Source': 'local'}, {}
+    extra = {'Source': 'model'}
+    if confident:
+        extra.update({f'Local_{category}': value for category, value in zip(PERCENT_CATEGORIES, local)})
+    return None, extra
+
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf_file, pdf_directory, api_key, prefilter=None):
     pdf_path = os.path.join(pdf_directory, pdf_file)
     text = extract_text_from_pdf(pdf_path)
     if not text:
         print(f"No text extracted from {pdf_file}, skipping.")
         return None
-    response = analyze_with_gemini(text, api_key)
+    local_row, extra = apply_prefilter(pdf_file, text, prefilter)
+    if local_row:
+        return local_row
+    model, options = route("percent", "gemini", text, "distribution", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    extra['Model'] = model
+    extra.update(hash_columns(text))
+    if STRUCTURED_OUTPUT:
+        values = parse_structured_response(analyze_with_gemini_structured(text, api_key, model, options))
+        if values is None:
+            values = [float('nan')] * len(PERCENT_CATEGORIES)
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, values)), **extra}
+    response = analyze_with_gemini(text, api_key, model, options)
     percentages = parse_percentages(response)
     result = {
         'Filename': pdf_file,
@@ -112,53 +224,140 @@ def process_pdf(pdf_file, pdf_directory, api_key):
         'Labor': percentages.get('Labor', 0),
         'Ethics': percentages.get('Ethics', 0),
         'Energy': percentages.get('Energy', 0),
-        'Other': percentages.get('Other', 0)
+        'Other': percentages.get('Other', 0),
+        **extra
     }
     return result
 
+def process_packed(pdf_files, pdf_directory, api_key, prefilter=None, max_workers=5):
+    """
+    Structured-mode alternative to running process_pdf per file: extracts every PDF, then answers
+    short documents several at a time in packed requests and long documents alone.
+
+    Returns:
+        list: One result row per document with text, in the same format as process_pdf.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = [os.path.join(pdf_directory, pdf_file) for pdf_file in pdf_files]
+        texts = dict(zip(pdf_files, executor.map(extract_text_from_pdf, paths)))
+    results, extras, documents = [], {}, {}
+    for pdf_file, text in texts.items():
+        if not text:
+            print(f"No text extracted from {pdf_file}, skipping.")
+            continue
+        local_row, extras[pdf_file] = apply_prefilter(pdf_file, text, prefilter)
+        if local_row:
+            results.append(local_row)
+        else:
+            documents[pdf_file] = text
+    packs, singles = pack_documents(documents, PACK_TOKEN_BUDGET, PACK_MAX_DOC_TOKENS)
+
+    routed = lambda text: route("percent", "gemini", text, "distribution", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    call_packed = lambda block: analyze_packed_with_gemini(block, api_key)
+    call_single = lambda text: analyze_with_gemini_structured(text, api_key, *routed(text))
+
+    def row(pdf_file, answer, packed):
+        # Packed answers arrive as parsed objects, single answers as JSON text
+        values = parse_structured_response(answer if answer is None or isinstance(answer, str) else json.dumps(answer))
+        if values is None:
+            values = [float('nan')] * len(PERCENT_CATEGORIES)
+        text = documents[pdf_file]
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, values)), **extras[pdf_file],
+                'Model': MODEL if packed else routed(text)[0], **hash_columns(text, packed)}
+
+    rerun_count = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Packs and long documents are submitted largest first within MODEL's rate limits
+        scheduler = SizeScheduler.for_model(MODEL, max_workers) if SCHEDULE else SizeScheduler(max_workers)
+        work = answer_packs(executor, scheduler, documents, packs, singles, call_packed, call_single, valid_packed_answer)
+        for names, future in tqdm(work, total=len(packs) + len(singles), desc="Processing packs"):
+            try:
+                answers, rerun = future.result()
+            except Exception as exc:
+                # Keep every document of the pack in the output; the rows are normalized to Status "failed"
+                print(f"Packed request for {len(names)} documents generated an exception: {exc}")
+                answers, rerun = dict.fromkeys(names), []
+            rerun_count += len(rerun)
+            for pdf_file, answer in answers.items():
+                results.append(row(pdf_file, answer, len(names) > 1 and pdf_file not in rerun))
+
+    print(f"{len(packs)} packed requests covered {sum(len(pack) for pack in packs)} documents; "
+          f"{len(singles)} sent alone; {rerun_count} re-run after a missing answer")
+    return results
+
 def main():
     pdf_directory = "path to your file"
     desktop_path = "path to your file"
     api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
+    if not api_key and not planner.PLAN:
         api_key = input("Enter your Gemini API key: ")
     if not os.path.exists(pdf_directory):
         print(f"Directory not found: {pdf_directory}")
         return
-    pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
+    pdf_files = select_documents(pdf_directory, "percent", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     if not pdf_files:
         print(f"No PDF files found in {pdf_directory}")
         return
     max_workers = 5
-    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key)
+    if planner.PLAN:
+        planner.print_plan("percent", "gemini", MODEL, pdf_directory, pdf_files, [planner.Call(build_prompt("", structured=STRUCTURED_OUTPUT), "distribution")],
+                           max_workers, MODEL_ROUTING)
+        return
+    prefilter = TopicPrefilter() if PREFILTER else None
+    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key, prefilter=prefilter)
     results = []
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_pdf = {executor.submit(process_pdf_with_args, pdf_file): pdf_file for pdf_file in pdf_files}
-        for future in tqdm(concurrent.futures.as_completed(future_to_pdf), total=len(pdf_files), desc="Processing PDFs"):
-            pdf_file = future_to_pdf[future]
-            try:
-                result = future.result()
-                if result:
-                    results.append(result)
-            except Exception as e:
-                print(f"Error processing {pdf_file}: {e}")
+    if PACKING and STRUCTURED_OUTPUT:
+        results = process_packed(pdf_files, pdf_directory, api_key, prefilter, max_workers)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            scheduler = SizeScheduler.for_routing(routed_calls("percent", "gemini", ["distribution"], MODEL, MODEL_ROUTING), max_workers) if SCHEDULE else SizeScheduler(max_workers)
+            sizes = document_sizes(pdf_directory, pdf_files) if SCHEDULE else {}
+            for pdf_file, future in tqdm(scheduler.run(executor, process_pdf_with_args, pdf_files, sizes), total=len(pdf_files), desc="Processing PDFs"):
+                try:
+                    result = future.result()
+                    if result:
+                        results.append(result)
+                except Exception as e:
+                    print(f"Error processing {pdf_file}: {e}")
     df = pd.DataFrame(results)
     output_csv = os.path.join(desktop_path, "analysis_resultsGEM.csv")
     output_excel = os.path.join(desktop_path, "analysis_resultsGEM.xlsx")
-    numeric_columns = ['Testing', 'Privacy', 'Governance', 'Auth', 'Global', 'Labor', 'Ethics', 'Energy', 'Other']
-    df[numeric_columns] = df[numeric_columns].astype(int)
-    df.to_csv(output_csv, index=False)
-    with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Results')
-        worksheet = writer.sheets['Results']
-        # Apply number format for each numeric column
-        for col in range(2, 11):  # columns 2 to 10 (inclusive) correspond to our numeric columns
-            for row in range(2, len(df) + 2):
-                cell = worksheet.cell(row=row, column=col)
-                cell.number_format = '0'
+    if STRUCTURED_OUTPUT:
+        df = normalize_percent_frame(df)
+        print(f"Row status: {df['Status'].value_counts().to_dict()}")
+    else:
+        numeric_columns = ['Testing', 'Privacy', 'Governance', 'Auth', 'Global', 'Labor', 'Ethics', 'Energy', 'Other']
+        df[numeric_columns] = df[numeric_columns].astype(int)
+    if PREFILTER and len(df):
+        local_columns = [f'Local_{category}' for category in PERCENT_CATEGORIES]
+        if set(local_columns).issubset(df.columns):
+            report = calibration_report(df[df[local_columns[0]].notna()])
+            report_csv = os.path.join(desktop_path, "prefilter_calibrationGEM.csv")
+            report.to_csv(report_csv, index=False)
+            print(f"Pre-classifier calibration report saved to: {report_csv}")
+            df = df.drop(columns=local_columns)
+        print(f"Documents scored locally: {(df['Source'] == 'local').sum()} of {len(df)}")
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(pdf_directory, "percent", df.to_dict("records"), "Filename")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_csv, df, "Filename")
+    with tracing.span("write_output", rows=len(df)):
+        df.to_csv(output_csv, index=False)
+        with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False, sheet_name='Results')
+            worksheet = writer.sheets['Results']
+            # Apply number format for each numeric column
+            for col in range(2, 11):  # columns 2 to 10 (inclusive) correspond to our numeric columns
+                for row in range(2, len(df) + 2):
+                    cell = worksheet.cell(row=row, column=col)
+                    cell.number_format = '0'
     print(f"Analysis complete. Results saved to:")
     print(f"- CSV: {output_csv}")
     print(f"- Excel: {output_excel}")
 
 if __name__ == "__main__":
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
     main()
+    tracing.finish()
@@ -1,11 +1,61 @@
 import os  # Provides functions for interacting with the operating system
+import random  # Used to pick the pre-classifier calibration sample
+import json  # Used to re-serialize per-document answers from packed requests
 import pandas as pd  # Used for data manipulation and analysis
-import PyPDF2  # Library for reading and extracting text from PDF files
+from pdf_extract import extract_pages  # PyPDF2 page extraction, parallel for large PDFs
+import tracing
+import planner  # --plan dry run
+from catalog import select_documents, record_results, merge_previous
 import openai  # OpenAI Python library to interact with GPT models
 from tqdm import tqdm  # Provides a progress bar for loops
 import concurrent.futures  # For parallel execution using threads
 from functools import partial  # Allows partial function application
+from percent_schema import (  # Structured (JSON) output mode and vectorized normalization
+    PERCENT_CATEGORIES, OPENAI_PERCENT_SCHEMA, STRUCTURED_OUTPUT_INSTRUCTIONS,
+    PACKED_ANSWER_FORMAT, parse_structured_response, valid_packed_answer, normalize_percent_frame,
+)
+from topic_prefilter import TopicPrefilter, calibration_report  # Local CPU topic estimates
+from packing import pack_documents, packed_question, answer_packs  # Several short documents per request
+from incremental import TEXT_HASH_COLUMN, short_hash, prompt_hash_column  # Text / prompt hashes per row
+from model_routing import route, routed_calls  # Model / reasoning effort per document
+from scheduler import SizeScheduler, document_sizes  # Largest-first submission within RPM/TPM
 
+# When True, ask the model for a fixed nine-key JSON object and normalize all rows together in main().
+# Failed or unparsable rows are reported with Status "failed" instead of a fabricated "Other: 100".
+STRUCTURED_OUTPUT = True
+
+# When True, a local CPU pre-classifier scores every document first. Short documents that are clearly
+# about one topic get their percentages locally and never reach the model. A random CALIBRATION_RATE of
+# those documents is still sent to the model and written to a calibration report.
+PREFILTER = True
+CALIBRATION_RATE = 0.05
+
+# When True (structured mode only), short documents are packed into one request with delimited IDs
+# and the per-ID answers are split back into rows; a document missing from the answer is re-run alone.
+PACKING = False
+PACK_TOKEN_BUDGET = 12000
+PACK_MAX_DOC_TOKENS = 1500
+
+# Default model. With MODEL_ROUTING the rules in model_routing.py may pick another model (and reasoning
+# effort / output cap) per document; model rows record the serving model in the "Model" column.
+# Packed requests always use MODEL; documents sent alone are routed like in process_pdf.
+MODEL = "o3-mini"
+MODEL_ROUTING = True
+# Submit the largest documents first and pace each call to the RPM/TPM limits of the model it is routed to (scheduler.py);
+# with SCHEDULE = False documents are submitted in listing order as fast as the workers take them
+SCHEDULE = True
+
+# Docket partitions under the document directory to analyze (subdirectories written by Scraper.py);
+# None analyzes every partition plus any PDFs directly in the directory.
+DOCKETS = None
+# With a corpus catalog in the document directory (`python catalog.py build <dir>`), documents are
+# picked by an indexed query instead: DOCKETS, a token range, and PENDING_ONLY to skip documents
+# this stage has already scored.
+MIN_TOKENS = None
+MAX_TOKENS = None
+PENDING_ONLY = False
+
+@tracing.traced("extract_text_from_pdf")
 def extract_text_from_pdf(pdf_path):
     """
     Extracts text from a PDF file.
@@ -18,36 +68,46 @@ def extract_text_from_pdf(pdf_path):
     """
     text = ""
     try:
-        # Open the PDF file in binary read mode
-        with open(pdf_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-            # Loop through each page and extract text
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
+        # Extract every page with PyPDF2; large PDFs are split into page ranges parsed across a process pool
+        text = "".join(extract_pages(pdf_path, engine="pypdf2"))
     except Exception as e:
         # Print an error message if extraction fails
         print(f"Error extracting text from {pdf_path}: {e}")
     return text
 
-def analyze_with_gpt(text, api_key):
+# Output format used by the original free-text mode (parsed by parse_percentages)
+LEGACY_OUTPUT_FORMAT = """Provide ONLY the percentages as whole numbers (e.g., 13 not 12.5%) in this exact format:
+    Testing: A
+    Privacy: B
+    Governance: C
+    Auth: D
+    Global: E
+    Labor: F
+    Ethics: G
+    Energy: H
+    Other: I"""
+
+def build_prompt(text, structured=False, packed=False):
     """
-    Sends the extracted text to the GPT o3 mini model using OpenAI's API for analysis and retrieves the response.
+    Builds the topic-percentage prompt for a document.
 
     Parameters:
         text (str): The text extracted from the PDF.
-        api_key (str): API key for authentication with the OpenAI service.
+        structured (bool): If True, request a JSON object instead of the line format.
+        packed (bool): If True, `text` is a block of delimited documents and one JSON answer per ID is requested.
 
     Returns:
-        str: The text response from the GPT model.
+        str: The full prompt sent to the model.
     """
-    # Set the OpenAI API key
-    openai.api_key = api_key
-    
+    output_format = STRUCTURED_OUTPUT_INSTRUCTIONS if structured else LEGACY_OUTPUT_FORMAT
+    subject = "is one of the feedback messages"
+    if packed:
+        output_format = packed_question("", PACKED_ANSWER_FORMAT).strip()
+        subject = "contains several separate feedback messages"
     # Define the prompt with context, instructions, and the text for analysis.
     # The output should include percentages for Testing, Privacy, Governance, Auth, Global, Labor, Ethics, Energy, and Other that sum to 100.
-    prompt = f"""
-    Context: In October 2023, President Biden signed Executive Order (EO) 14110 titled, "Executive Order on Safe, Secure, and Trustworthy Development and Use of Artificial Intelligence". This Executive Order called on many agencies in the U.S. government to ask the U.S. public for feedback on how they think the Executive Order should be improved. The text that follows is one of the feedback messages from the public to the National Institute of Standards and Technology (NIST) government agency. 
+    return f"""
+    Context: In October 2023, President Biden signed Executive Order (EO) 14110 titled, "Executive Order on Safe, Secure, and Trustworthy Development and Use of Artificial Intelligence". This Executive Order called on many agencies in the U.S. government to ask the U.S. public for feedback on how they think the Executive Order should be improved. The text that follows {subject} from the public to the National Institute of Standards and Technology (NIST) government agency. 
 
 1. Model Security and Vulnerability Testing: Concerns about AI's impact on personal privacy, the effectiveness of data protection strategies, and alternatives for securing sensitive data.
 2. Data Privacy and Protection Mechanisms: Concerns about AI's impact on personal privacy, the effectiveness of data protection strategies, and alternatives for securing sensitive data.
@@ -61,28 +121,38 @@ def analyze_with_gpt(text, api_key):
 
     You will evaulate the percent of each document that is discussing each of these main topics. The percentages must sum to exactly 100%. 
 
-    Provide ONLY the percentages as whole numbers (e.g., 13 not 12.5%) in this exact format:
-    Testing: A
-    Privacy: B
-    Governance: C
-    Auth: D
-    Global: E
-    Labor: F
-    Ethics: G
-    Energy: H
-    Other: I
+    {output_format}
 
     Text for analysis:
     {text}
     """
+
+@tracing.traced("model_call", text_args=("text",))
+def analyze_with_gpt(text, api_key, model=MODEL, options=None):
+    """
+    Sends the extracted text to the GPT o3 mini model using OpenAI's API for analysis and retrieves the response.
+
+    Parameters:
+        text (str): The text extracted from the PDF.
+        api_key (str): API key for authentication with the OpenAI service.
+        model (str): The model to call (o3-mini unless routed elsewhere).
+        options (dict, optional): Extra request options such as reasoning_effort.
+
+    Returns:
+        str: The text response from the GPT model.
+    """
+    # Set the OpenAI API key
+    openai.api_key = api_key
+    
+    prompt = build_prompt(text)
     try:
         # Use OpenAI's ChatCompletion endpoint to generate the content
         response = openai.ChatCompletion.create(
-            model="o3-mini",  # Specify the GPT o3 mini model
+            model=model,  # GPT o3 mini unless a routing rule picked another model
             messages=[
                 {"role": "user", "content": prompt}
             ],
-
+            **(options or {})
         )
         # Extract the content from the response
         return response['choices'][0]['message']['content']
@@ -92,6 +162,63 @@ def analyze_with_gpt(text, api_key):
         # Default response with Energy set to 0 and Other adjusted so the sum is 100
         return "Testing: 0\nPrivacy: 0\nGovernance: 0\nAuth: 0\nGlobal: 0\nLabor: 0\nEthics: 0\nEnergy: 0\nOther: 100"
 
+@tracing.traced("model_call", text_args=("text",))
+def analyze_with_gpt_structured(text, api_key, model=MODEL, options=None):
+    """
+    Sends the extracted text to the GPT o3 mini model and requests a schema-constrained JSON answer.
+
+    Parameters:
+        text (str): The text extracted from the PDF.
+        api_key (str): API key for authentication with the OpenAI service.
+        model (str): The model to call (o3-mini unless routed elsewhere).
+        options (dict, optional): Extra request options such as reasoning_effort.
+
+    Returns:
+        str or None: The JSON response text, or None if the API call failed.
+    """
+    openai.api_key = api_key
+    try:
+        response = openai.ChatCompletion.create(
+            model=model,
+            messages=[
+                {"role": "user", "content": build_prompt(text, structured=True)}
+            ],
+            response_format={"type": "json_schema", "json_schema": OPENAI_PERCENT_SCHEMA},
+            **(options or {})
+        )
+        return response['choices'][0]['message']['content']
+    except Exception as e:
+        # Do not invent a distribution; the row is flagged as failed during normalization
+        print(f"API Error: {e}")
+        return None
+
+@tracing.traced("model_call", text_args=("block",))
+def analyze_packed_with_gpt(block, api_key):
+    """
+    Sends a block of delimited documents to the GPT o3 mini model in one request.
+
+    Parameters:
+        block (str): Documents wrapped in <<<DOC id>>> / <<<END id>>> markers.
+        api_key (str): API key for authentication with the OpenAI service.
+
+    Returns:
+        str or None: A JSON object mapping document IDs to percentage objects, or None if the API call failed.
+    """
+    openai.api_key = api_key
+    try:
+        response = openai.ChatCompletion.create(
+            model=MODEL,
+            messages=[
+                {"role": "user", "content": build_prompt(block, structured=True, packed=True)}
+            ],
+            response_format={"type": "json_object"},
+        )
+        return response['choices'][0]['message']['content']
+    except Exception as e:
+        print(f"API Error: {e}")
+        return None
+
+@tracing.traced("parse", text_args=("response_text",))
 def parse_percentages(response_text):
     """
     Parses the GPT model's response and extracts percentage values for each category.
@@ -146,7 +273,30 @@ def parse_percentages(response_text):
         # Return a default set of percentages if parsing fails
         return {'Testing': 0, 'Privacy': 0, 'Governance': 0, 'Auth': 0, 'Global': 0, 'Labor': 0, 'Ethics': 0, 'Energy': 0, 'Other': 100}
 
-def process_pdf(pdf_file, pdf_directory, api_key):
+def hash_columns(text, packed=False):
+    """Text Hash and Prompt Hash columns of a model row; the prompt hash tells packed answers from single ones."""
+    return {TEXT_HASH_COLUMN: short_hash(text), prompt_hash_column(): short_hash(build_prompt("", STRUCTURED_OUTPUT or packed, packed))}
+
+def apply_prefilter(pdf_file, text, prefilter):
+    """
+    Consults the local pre-classifier for one document.
+
+    Returns:
+        tuple: (a finished row if the local estimate is used, else None; extra columns for the model row)
+    """
+    if not prefilter:
+        return None, {}
+    # Confident local estimates skip the model, except for the random calibration sample
+    local, confident = prefilter.classify(text)
+    if confident and random.random() >= CALIBRATION_RATE:
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, local)), 'Source': 'local'}, {}
+    extra = {'Source': 'model'}
+    if confident:
+        extra.update({f'Local_{category}': value for category, value in zip(PERCENT_CATEGORIES, local)})
+    return None, extra
+
+@tracing.traced("process_pdf", document=True)
+def process_pdf(pdf_file, pdf_directory, api_key, prefilter=None):
     """
     Processes a single PDF file:
       - Extracts text from the PDF.
@@ -158,6 +308,7 @@ def process_pdf(pdf_file, pdf_directory, api_key):
         pdf_file (str): The name of the PDF file.
         pdf_directory (str): The directory where the PDF file is located.
         api_key (str): The API key for the OpenAI service.
+        prefilter (TopicPrefilter, optional): Local classifier consulted before calling the model.
 
     Returns:
         dict or None: A dictionary containing the filename and category percentages, or None if extraction fails.
@@ -169,8 +320,20 @@ def process_pdf(pdf_file, pdf_directory, api_key):
     if not text:
         print(f"No text extracted from {pdf_file}, skipping.")
         return None
+    local_row, extra = apply_prefilter(pdf_file, text, prefilter)
+    if local_row:
+        return local_row
+    model, options = route("percent", "openai", text, "distribution", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    extra['Model'] = model
+    extra.update(hash_columns(text))
+    if STRUCTURED_OUTPUT:
+        # Keep the raw values (NaN when the call or parse failed); main() normalizes all rows at once
+        values = parse_structured_response(analyze_with_gpt_structured(text, api_key, model, options))
+        if values is None:
+            values = [float('nan')] * len(PERCENT_CATEGORIES)
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, values)), **extra}
     # Analyze the extracted text with the GPT model
-    response = analyze_with_gpt(text, api_key)
+    response = analyze_with_gpt(text, api_key, model, options)
     # Parse the GPT response to extract percentage values
     percentages = parse_percentages(response)
     # Organize the results into a dictionary, including the new 'Energy' category
@@ -184,10 +347,67 @@ def process_pdf(pdf_file, pdf_directory, api_key):
         'Labor': percentages.get('Labor', 0),
         'Ethics': percentages.get('Ethics', 0),
         'Energy': percentages.get('Energy', 0),
-        'Other': percentages.get('Other', 0)
+        'Other': percentages.get('Other', 0),
+        **extra
     }
     return result
 
+def process_packed(pdf_files, pdf_directory, api_key, prefilter=None, max_workers=5):
+    """
+    Structured-mode alternative to running process_pdf per file: extracts every PDF, then answers
+    short documents several at a time in packed requests and long documents alone.
+
+    Returns:
+        list: One result row per document with text, in the same format as process_pdf.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paths = [os.path.join(pdf_directory, pdf_file) for pdf_file in pdf_files]
+        texts = dict(zip(pdf_files, executor.map(extract_text_from_pdf, paths)))
+    results, extras, documents = [], {}, {}
+    for pdf_file, text in texts.items():
+        if not text:
+            print(f"No text extracted from {pdf_file}, skipping.")
+            continue
+        local_row, extras[pdf_file] = apply_prefilter(pdf_file, text, prefilter)
+        if local_row:
+            results.append(local_row)
+        else:
+            documents[pdf_file] = text
+    packs, singles = pack_documents(documents, PACK_TOKEN_BUDGET, PACK_MAX_DOC_TOKENS)
+
+    routed = lambda text: route("percent", "openai", text, "distribution", default_model=MODEL) if MODEL_ROUTING else (MODEL, {})
+    call_packed = lambda block: analyze_packed_with_gpt(block, api_key)
+    call_single = lambda text: analyze_with_gpt_structured(text, api_key, *routed(text))
+
+    def row(pdf_file, answer, packed):
+        # Packed answers arrive as parsed objects, single answers as JSON text
+        values = parse_structured_response(answer if answer is None or isinstance(answer, str) else json.dumps(answer))
+        if values is None:
+            values = [float('nan')] * len(PERCENT_CATEGORIES)
+        text = documents[pdf_file]
+        return {'Filename': pdf_file, **dict(zip(PERCENT_CATEGORIES, values)), **extras[pdf_file],
+                'Model': MODEL if packed else routed(text)[0], **hash_columns(text, packed)}
+
+    rerun_count = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Packs and long documents are submitted largest first within MODEL's rate limits
+        scheduler = SizeScheduler.for_model(MODEL, max_workers) if SCHEDULE else SizeScheduler(max_workers)
+        work = answer_packs(executor, scheduler, documents, packs, singles, call_packed, call_single, valid_packed_answer)
+        for names, future in tqdm(work, total=len(packs) + len(singles), desc="Processing packs"):
+            try:
+                answers, rerun = future.result()
+            except Exception as exc:
+                # Keep every document of the pack in the output; the rows are normalized to Status "failed"
+                print(f"Packed request for {len(names)} documents generated an exception: {exc}")
+                answers, rerun = dict.fromkeys(names), []
+            rerun_count += len(rerun)
+            for pdf_file, answer in answers.items():
+                results.append(row(pdf_file, answer, len(names) > 1 and pdf_file not in rerun))
+
+    print(f"{len(packs)} packed requests covered {sum(len(pack) for pack in packs)} documents; "
+          f"{len(singles)} sent alone; {rerun_count} re-run after a missing answer")
+    return results
+
 def main():
     """
     Main function to:
@@ -199,9 +419,9 @@ def main():
     pdf_directory = "path to your file"
     # Path to the desktop where results will be saved
     desktop_path = "path to your file"
-    # Retrieve the API key from environment variables or prompt the user
+    # Retrieve the API key from environment variables or prompt the user (a --plan run makes no calls)
     api_key = os.environ.get("OPENAI_API_KEY")
-    if not api_key:
+    if not api_key and not planner.PLAN:
         api_key = input("Enter your OpenAI API key: ")
     
     # Check if the specified PDF directory exists
@@ -210,50 +430,82 @@ def main():
         return
     
     # List all PDF files in the directory (case-insensitive match for .pdf extension)
-    pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
+    pdf_files = select_documents(pdf_directory, "percent", DOCKETS, MIN_TOKENS, MAX_TOKENS, PENDING_ONLY)
     if not pdf_files:
         print(f"No PDF files found in {pdf_directory}")
         return
     
     # Maximum number of worker threads for concurrent processing
     max_workers = 5
+    if planner.PLAN:
+        # Upper bound: documents the pre-classifier would settle locally are still counted as calls
+        planner.print_plan("percent", "openai", MODEL, pdf_directory, pdf_files, [planner.Call(build_prompt("", structured=STRUCTURED_OUTPUT), "distribution")],
+                           max_workers, MODEL_ROUTING)
+        return
+    # Build the local pre-classifier once; it is read-only and shared by all threads
+    prefilter = TopicPrefilter() if PREFILTER else None
     # Use partial to fix pdf_directory and api_key arguments for the process_pdf function
-    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key)
+    process_pdf_with_args = partial(process_pdf, pdf_directory=pdf_directory, api_key=api_key, prefilter=prefilter)
     results = []
     
-    # Process PDF files concurrently using a ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # Map each PDF file to a future for concurrent processing
-        future_to_pdf = {executor.submit(process_pdf_with_args, pdf_file): pdf_file for pdf_file in pdf_files}
-        # Use tqdm to show a progress bar as futures complete
-        for future in tqdm(concurrent.futures.as_completed(future_to_pdf), total=len(pdf_files), desc="Processing PDFs"):
-            pdf_file = future_to_pdf[future]
-            try:
-                result = future.result()
-                if result:
-                    results.append(result)
-            except Exception as e:
-                print(f"Error processing {pdf_file}: {e}")
+    if PACKING and STRUCTURED_OUTPUT:
+        # Pack short documents into shared requests; results have the same row format
+        results = process_packed(pdf_files, pdf_directory, api_key, prefilter, max_workers)
+    else:
+        # Process PDF files concurrently using a ThreadPoolExecutor
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Submit the PDF files largest first, paced by the model's rate limits
+            scheduler = SizeScheduler.for_routing(routed_calls("percent", "openai", ["distribution"], MODEL, MODEL_ROUTING), max_workers) if SCHEDULE else SizeScheduler(max_workers)
+            sizes = document_sizes(pdf_directory, pdf_files) if SCHEDULE else {}
+            # Use tqdm to show a progress bar as futures complete
+            for pdf_file, future in tqdm(scheduler.run(executor, process_pdf_with_args, pdf_files, sizes), total=len(pdf_files), desc="Processing PDFs"):
+                try:
+                    result = future.result()
+                    if result:
+                        results.append(result)
+                except Exception as e:
+                    print(f"Error processing {pdf_file}: {e}")
     
     # Create a DataFrame from the list of results
     df = pd.DataFrame(results)
     # Define paths for output CSV and Excel files
     output_csv = os.path.join(desktop_path, "analysis_resultsGPT.csv")
     output_excel = os.path.join(desktop_path, "analysis_resultsGPT.xlsx")
-    # Ensure numeric columns are treated as integers, including the new 'Energy' column
-    numeric_columns = ['Testing', 'Privacy', 'Governance', 'Auth', 'Global', 'Labor', 'Ethics', 'Energy', 'Other']
-    df[numeric_columns] = df[numeric_columns].astype(int)
-    # Save the DataFrame to CSV
-    df.to_csv(output_csv, index=False)
-    # Save the DataFrame to an Excel file with number formatting for numeric columns
-    with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Results')
-        worksheet = writer.sheets['Results']
-        # Format numeric columns to display numbers without decimals
-        for col in range(2, 11):  # Columns 2 to 10 correspond to the numeric values in the Excel sheet
-            for row in range(2, len(df) + 2):
-                cell = worksheet.cell(row=row, column=col)
-                cell.number_format = '0'
+    if STRUCTURED_OUTPUT:
+        # Largest-remainder rounding over the whole result matrix; adds the per-row "Status" column
+        df = normalize_percent_frame(df)
+        print(f"Row status: {df['Status'].value_counts().to_dict()}")
+    else:
+        # Ensure numeric columns are treated as integers, including the new 'Energy' column
+        numeric_columns = ['Testing', 'Privacy', 'Governance', 'Auth', 'Global', 'Labor', 'Ethics', 'Energy', 'Other']
+        df[numeric_columns] = df[numeric_columns].astype(int)
+    if PREFILTER and len(df):
+        # Compare local estimates with the model on the calibration sample, then drop the helper columns
+        local_columns = [f'Local_{category}' for category in PERCENT_CATEGORIES]
+        if set(local_columns).issubset(df.columns):
+            report = calibration_report(df[df[local_columns[0]].notna()])
+            report_csv = os.path.join(desktop_path, "prefilter_calibrationGPT.csv")
+            report.to_csv(report_csv, index=False)
+            print(f"Pre-classifier calibration report saved to: {report_csv}")
+            df = df.drop(columns=local_columns)
+        print(f"Documents scored locally: {(df['Source'] == 'local').sum()} of {len(df)}")
+    # Note in the corpus catalog (if there is one) which documents this stage has scored
+    record_results(pdf_directory, "percent", df.to_dict("records"), "Filename")
+    if PENDING_ONLY:
+        # Only documents not scored before were run; keep the earlier rows of the output file
+        df = merge_previous(output_csv, df, "Filename")
+    with tracing.span("write_output", rows=len(df)):
+        # Save the DataFrame to CSV
+        df.to_csv(output_csv, index=False)
+        # Save the DataFrame to an Excel file with number formatting for numeric columns
+        with pd.ExcelWriter(output_excel, engine='openpyxl') as writer:
+            df.to_excel(writer, index=False, sheet_name='Results')
+            worksheet = writer.sheets['Results']
+            # Format numeric columns to display numbers without decimals
+            for col in range(2, 11):  # Columns 2 to 10 correspond to the numeric values in the Excel sheet
+                for row in range(2, len(df) + 2):
+                    cell = worksheet.cell(row=row, column=col)
+                    cell.number_format = '0'
     
     # Print confirmation messages with the output file paths
     print(f"Analysis complete. Results saved to:")
@@ -261,5 +513,8 @@ def main():
     print(f"- Excel: {output_excel}")
 
 if __name__ == "__main__":
+    tracing.profile_from_argv()  # --profile / --profile-memory
+    planner.plan_from_argv()  # --plan: count calls, tokens, time and cost without calling a model
     # Execute the main function when the script is run directly
     main()
+    tracing.finish()
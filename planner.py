@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import concurrent.futures
+from collections import namedtuple, defaultdict
+from pdf_extract import extract_pages
+from packing import estimate_tokens
+from incremental import short_hash, reusable
+from model_routing import route
+from catalog import CorpusCatalog, catalog_path
+from scheduler import RATE_LIMITS  # RPM / TPM per model
+
+# Dry-run planning is off unless a script is started with --plan (optionally --plan-trace TRACE.json)
+PLAN = False
+# Chrome trace from an earlier --profile run; its model_call spans give the observed latency
+PLAN_TRACE = None
+
+# Expected answer length in tokens per kind of question (stage name when the call has no question type)
+OUTPUT_TOKENS = {
+    "arguments": 400, "title": 10, "description": 40, "classification": 5,
+    "score": 150, "sentiment": 150, "advocacy": 150, "distribution": 60, "percent": 60,
+}
+# Hidden reasoning tokens billed as output per call by reasoning models, by reasoning effort
+REASONING_TOKENS = {"low": 300, "medium": 1000, "high": 3000}
+REASONING_MODELS = ("o1", "o3", "o4")
+
+# USD per million (input, output) tokens
+PRICES = {
+    "o3-mini": (1.10, 4.40),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-2.0-flash-lite": (0.075, 0.30),
+}
+# Seconds per call as (fixed, per output token) when there is no trace to measure it from
+LATENCY = {
+    "o3-mini": (4.0, 0.008),
+    "gpt-4o": (1.0, 0.012),
+    "gpt-4o-mini": (0.5, 0.008),
+    "gemini-2.0-flash": (0.8, 0.005),
+    "gemini-2.0-flash-lite": (0.5, 0.004),
+}
+DEFAULT_LATENCY = (2.0, 0.01)
+EXTRACT_WORKERS = 8
+
+# One model call made per document: the question/instructions sent with the document text.
+# column/category identify the answer for incremental reuse (Advocacy_*, SentimentScore_*).
+Call = namedtuple("Call", "prompt question_type column category", defaults=(None, None, None))
+
+def plan_from_argv(argv=None):
+    """Turn planning on if --plan is on the command line; removes --plan and --plan-trace PATH from sys.argv."""
+    global PLAN, PLAN_TRACE
+    argv = sys.argv if argv is None else argv
+    if "--plan-trace" in argv:
+        index = argv.index("--plan-trace")
+        PLAN_TRACE = argv[index + 1]
+        del argv[index:index + 2]
+    if "--plan" in argv:
+        argv.remove("--plan")
+        PLAN = True
+    return PLAN
+
+def organization_calls(analyze_organization):
+    """The four Organization_* questions, captured by running analyze_organization with a recording stub."""
+    calls = []
+
+    def record(text, question, question_type=None):
+        calls.append(Call(question, question_type))
+        return "Example Organization" if question_type == "title" else "Example"
+
+    analyze_organization("", record)
+    return calls
+
+def observed_latency(trace_path):
+    """
+    Fits seconds = fixed + per_token * output_tokens to the model_call spans of a Chrome trace.
+
+    Returns:
+        tuple: (fixed seconds, seconds per output token), or None if the trace has no model calls
+    """
+    with open(trace_path, "r", encoding="utf-8") as file:
+        events = [event for event in json.load(file)["traceEvents"] if event["name"] == "model_call"]
+    if not events:
+        return None
+    samples = [(event["args"].get("output_tokens", 0), event["dur"] / 1e6) for event in events]
+    mean_tokens = sum(tokens for tokens, _ in samples) / len(samples)
+    mean_seconds = sum(seconds for _, seconds in samples) / len(samples)
+    spread = sum((tokens - mean_tokens) ** 2 for tokens, _ in samples)
+    if len(samples) < 10 or spread == 0:
+        return mean_seconds, 0.0
+    per_token = max(sum((tokens - mean_tokens) * (seconds - mean_seconds) for tokens, seconds in samples) / spread, 0.0)
+    return mean_seconds - per_token * mean_tokens, per_token
+
+def document_info(root, names):
+    """
+    Token count and text hash per document, from the corpus catalog when root has one (no PDF is
+    opened), otherwise by extracting the text.
+    """
+    if os.path.exists(catalog_path(root)):
+        known = CorpusCatalog(catalog_path(root)).text_info(names)
+        missing = [name for name in names if known.get(name, {}).get("tokens") is None]
+        if missing:
+            print(f"{len(missing)} documents are not extracted in the catalog; run `python catalog.py build {root}`. Extracting them now.")
+        info = {name: known[name] for name in names if name not in missing}
+    else:
+        missing, info = list(names), {}
+
+    def extract(name):
+        try:
+            text = "".join(page + "\n" for page in extract_pages(os.path.join(root, name)))
+        except Exception as e:
+            print(f"Error extracting text from {name}: {e}")
+            text = ""
+        return name, {"tokens": estimate_tokens(text), "text_hash": short_hash(text), "organization": None}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=EXTRACT_WORKERS) as executor:
+        info.update(executor.map(extract, missing))
+    return info
+
+def output_tokens(stage, question_type, model, options):
+    tokens = OUTPUT_TOKENS.get(question_type or stage, 200)
+    cap = options.get("max_completion_tokens") or options.get("generation_config", {}).get("max_output_tokens")
+    if cap:
+        tokens = min(tokens, cap)
+    if model.startswith(REASONING_MODELS):
+        tokens += REASONING_TOKENS[options.get("reasoning_effort", "medium")]
+    return tokens
+
+def plan_stage(stage, provider, default_model, root, names, calls, routing=True, previous=None, knowledge_base=None):
+    """
+    Counts the model calls one stage would make over the given documents, without calling anything.
+    Calls that incremental reuse (previous output rows) or the organization knowledge base would
+    answer are counted separately and cost nothing.
+
+    Returns:
+        dict: model -> {"calls", "input_tokens", "output_tokens", "reused", "skipped"}
+    """
+    info = document_info(root, names)
+    totals = defaultdict(lambda: {"calls": 0, "input_tokens": 0, "output_tokens": 0, "reused": 0, "skipped": 0})
+    prompt_tokens = [estimate_tokens(call.prompt) for call in calls]
+    prompt_digests = [short_hash(call.prompt) for call in calls]
+    for name in names:
+        document = info[name]
+        if not document["tokens"] or document["tokens"] <= 1:
+            continue  # no text: the stage skips the document
+        known_organization = (knowledge_base is not None and document.get("organization")
+                              and knowledge_base.lookup(document["organization"]) is not None)
+        previous_row = (previous or {}).get(name)
+        for call, tokens, digest in zip(calls, prompt_tokens, prompt_digests):
+            model, options = (route(stage, provider, question_type=call.question_type, default_model=default_model,
+                                    tokens=document["tokens"]) if routing else (default_model, {}))
+            total = totals[model]
+            if known_organization and call.question_type != "title":
+                total["skipped"] += 1  # answered from the organization knowledge base
+                continue
+            if previous_row and call.column and reusable(previous_row, call.column, digest, document["text_hash"],
+                                                         model, call.category):
+                total["reused"] += 1
+                continue
+            total["calls"] += 1
+            total["input_tokens"] += document["tokens"] + tokens
+            total["output_tokens"] += output_tokens(stage, call.question_type, model, options)
+    return dict(totals)
+
+def project(totals, workers, latency=None):
+    """
+    Wall time and cost of a plan: calls run `workers` at a time and each model is also held to its
+    RATE_LIMITS, so the projection is the slowest of the concurrency, RPM and TPM bounds.
+
+    Returns:
+        dict: model -> {"seconds", "bound", "cost"}, plus "total" with the stage's wall time and cost
+    """
+    projection, busy_seconds, rate_seconds = {}, 0.0, 0.0
+    for model, total in totals.items():
+        fixed, per_token = latency or LATENCY.get(model, DEFAULT_LATENCY)
+        call_seconds = total["calls"] * fixed + total["output_tokens"] * per_token
+        limits = RATE_LIMITS.get(model, {})
+        bounds = {"concurrency": call_seconds / max(workers, 1)}
+        if limits.get("rpm"):
+            bounds["rpm"] = total["calls"] / limits["rpm"] * 60
+        if limits.get("tpm"):
+            bounds["tpm"] = (total["input_tokens"] + total["output_tokens"]) / limits["tpm"] * 60
+        bound = max(bounds, key=bounds.get)
+        input_price, output_price = PRICES.get(model, (0.0, 0.0))
+        cost = (total["input_tokens"] * input_price + total["output_tokens"] * output_price) / 1e6
+        projection[model] = {"seconds": bounds[bound], "bound": bound, "cost": cost}
+        busy_seconds += bounds["concurrency"]
+        rate_seconds = max(rate_seconds, bounds.get("rpm", 0), bounds.get("tpm", 0))
+    projection["total"] = {"seconds": max(busy_seconds, rate_seconds),
+                           "cost": sum(entry["cost"] for entry in projection.values())}
+    return projection
+
+def format_plan(stage, totals, projection, documents):
+    lines = [f"Plan for {stage}: {documents} documents",
+             "Model                      calls  reused skipped   input tok  output tok   est. cost   bound"]
+    for model, total in sorted(totals.items()):
+        entry = projection[model]
+        lines.append(f"{model:<25} {total['calls']:>6} {total['reused']:>7} {total['skipped']:>7} {total['input_tokens']:>11,} "
+                     f"{total['output_tokens']:>11,}  ${entry['cost']:>9.2f}   {entry['bound']}")
+    seconds = projection["total"]["seconds"]
+    lines.append(f"Projected wall time: {seconds:,.0f} s ({seconds / 3600:.2f} h); projected cost: ${projection['total']['cost']:.2f}")
+    return "\n".join(lines)
+
+def print_plan(stage, provider, default_model, root, names, calls, workers, routing=True, previous=None, knowledge_base=None):
+    """Prints the dry-run plan for one stage script (its --plan mode)."""
+    latency = observed_latency(PLAN_TRACE) if PLAN_TRACE else None
+    totals = plan_stage(stage, provider, default_model, root, names, calls, routing, previous, knowledge_base=knowledge_base)
+    print(format_plan(stage, totals, project(totals, workers, latency), len(names)))
+    if latency:
+        print(f"Latency from {PLAN_TRACE}: {latency[0]:.2f} s + {latency[1] * 1000:.2f} ms per output token")
@@ -0,0 +1,325 @@
+import os
+import time
+import threading
+import concurrent.futures
+from collections import deque
+
+class OpenAIProvider:
+    """Calls an OpenAI chat model with a single user prompt. Raises on API errors."""
+
+    name = "openai"
+
+    def __init__(self, model="o3-mini", api_key=None, timeout=None):
+        self.model = model
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY")
+        self.timeout = timeout
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def label(self):
+        return f"{self.name}:{self.model}"
+
+    def _get_client(self):
+        # Create the client once and reuse it across threads (keeps HTTP connections warm)
+        with self._lock:
+            if self._client is None:
+                try:
+                    # For newer versions of the openai package (>=1.0.0)
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key, timeout=self.timeout)
+                except (ImportError, AttributeError):
+                    # For older versions of the openai package (<1.0.0)
+                    import openai
+                    openai.api_key = self.api_key
+                    self._client = openai
+            return self._client
+
+    def complete(self, prompt, model=None, system=None, **options):
+        """
+        Send the prompt (to `model` instead of the provider's own model, if given), after an optional
+        system message, and return the response text.
+        """
+        client = self._get_client()
+        messages = [{"role": "user", "content": prompt}]
+        if system:
+            messages.insert(0, {"role": "system", "content": system})
+        if hasattr(client, "chat"):
+            response = client.chat.completions.create(model=model or self.model, messages=messages, **options)
+            return response.choices[0].message.content.strip()
+        response = client.ChatCompletion.create(model=model or self.model, messages=messages, request_timeout=self.timeout, **options)
+        return response["choices"][0]["message"]["content"].strip()
+
+class GeminiProvider:
+    """Calls a Gemini model with a single prompt. Raises on API errors."""
+
+    name = "gemini"
+
+    def __init__(self, model="gemini-2.0-flash", api_key=None, timeout=None):
+        self.model = model
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+        self.timeout = timeout
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @property
+    def label(self):
+        return f"{self.name}:{self.model}"
+
+    def _get_model(self, model=None):
+        model = model or self.model
+        with self._lock:
+            if model not in self._models:
+                import google.generativeai as genai
+                genai.configure(api_key=self.api_key)
+                self._models[model] = genai.GenerativeModel(model)
+            return self._models[model]
+
+    def complete(self, prompt, model=None, **options):
+        """Send the prompt (to `model` instead of the provider's own model, if given) and return the response text."""
+        if self.timeout:
+            options.setdefault("request_options", {"timeout": self.timeout})
+        response = self._get_model(model).generate_content(prompt, **options)
+        return response.text.strip()
+
+def _routed(provider, routing, options):
+    """
+    (model, call options) for one provider: routing(provider) when a routing function is given,
+    since routed options are in each provider's own keyword format, else its own model and `options`.
+    """
+    return routing(provider) if routing else (provider.model, options)
+
+class LatencyTracker:
+    """Keeps a rolling window of successful call latencies for one provider."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, quantile, min_samples=10):
+        """Return the latency at the given quantile (0-1), or None until enough samples exist."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < min_samples:
+            return None
+        index = min(len(samples) - 1, int(quantile * len(samples)))
+        return samples[index]
+
+class Hedger:
+    """
+    Sends each prompt to a primary provider and, if it has not answered by the hedge deadline,
+    fires the same prompt at a backup provider and keeps whichever answer arrives first.
+
+    The deadline is the observed `quantile` latency of the primary (default_deadline until
+    min_samples calls have completed), so only the slow tail pays for a second request.
+    `max_hedge_ratio` caps the fraction of calls that may be hedged to bound extra cost.
+
+    The losing request is not cancelled: a call already in flight cannot be interrupted, so it runs
+    to completion in the background, its answer is discarded, and its tokens are still billed by
+    that provider. Every hedged call therefore costs two requests.
+    """
+
+    def __init__(self, primary, backup, quantile=0.95, default_deadline=60.0, min_samples=10,
+                 max_hedge_ratio=0.1, max_workers=32):
+        self.primary = primary
+        self.backup = backup
+        self.quantile = quantile
+        self.default_deadline = default_deadline
+        self.min_samples = min_samples
+        self.max_hedge_ratio = max_hedge_ratio
+        self.tracker = LatencyTracker()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.hedged = 0
+        self.wins = {primary.label: 0, backup.label: 0}
+
+    def deadline(self):
+        """Seconds to wait on the primary before hedging."""
+        observed = self.tracker.percentile(self.quantile, self.min_samples)
+        return self.default_deadline if observed is None else observed
+
+    def _may_hedge(self):
+        with self._lock:
+            return self.hedged < max(1, self.max_hedge_ratio * self.calls)
+
+    def _record_win(self, provider):
+        with self._lock:
+            self.wins[provider.label] += 1
+
+    def complete(self, prompt, routing=None, **options):
+        """
+        Args:
+            routing (callable, optional): provider -> (model, call options) for that provider
+                (e.g. from model_routing.route); without it every provider gets `options`
+
+        Returns:
+            tuple: (response text, "provider:model" that served it)
+
+        Raises the last provider error if neither provider returns an answer.
+        """
+        with self._lock:
+            self.calls += 1
+        calls = {provider: _routed(provider, routing, options) for provider in (self.primary, self.backup)}
+        def submit(provider):
+            model, provider_options = calls[provider]
+            return self._executor.submit(provider.complete, prompt, model=model, **provider_options)
+        def label(provider):
+            return f"{provider.name}:{calls[provider][0]}"
+        start = time.monotonic()
+        primary_future = submit(self.primary)
+        # Record the primary's true latency even when the backup wins, so the deadline tracks the real tail
+        primary_future.add_done_callback(
+            lambda f: None if f.cancelled() or f.exception() else self.tracker.record(time.monotonic() - start)
+        )
+        done, _ = concurrent.futures.wait([primary_future], timeout=self.deadline())
+
+        if primary_future in done and primary_future.exception() is None:
+            self._record_win(self.primary)
+            return primary_future.result(), label(self.primary)
+
+        # The primary is slow (or already failed): hedge with the backup if the budget allows
+        if primary_future not in done and not self._may_hedge():
+            text = primary_future.result()
+            self._record_win(self.primary)
+            return text, label(self.primary)
+        with self._lock:
+            self.hedged += 1
+        backup_future = submit(self.backup)
+        providers = {primary_future: self.primary, backup_future: self.backup}
+
+        last_error = None
+        for future in concurrent.futures.as_completed(providers):
+            if future.exception() is not None:
+                last_error = future.exception()
+                continue
+            winner = providers[future]
+            # Only a loser that has not started yet is cancelled; one in flight is abandoned (and still billed)
+            for other in providers:
+                if other is not future:
+                    other.cancel()
+            self._record_win(winner)
+            return future.result(), label(winner)
+        raise last_error
+
+    def summary(self):
+        """One-line report of hedge rate and winners, printed at the end of a run."""
+        return (f"Hedged {self.hedged}/{self.calls} calls "
+                f"(deadline {self.deadline():.1f}s); wins: {self.wins}")
+
+class ProvidersUnavailableError(Exception):
+    """Raised when every provider in a failover chain is failing or has an open circuit."""
+
+class CircuitBreaker:
+    """
+    Per provider/model circuit breaker.
+
+    closed:    calls flow normally; `failure_threshold` consecutive errors open the circuit.
+    open:      calls are rejected without touching the API for `reset_timeout` seconds.
+    half-open: up to `half_open_max_calls` probe requests are let through; a success closes
+               the circuit again, a failure re-opens it for another `reset_timeout`.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_max_calls=1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """Return True if a call may be made now (reserves a probe slot when half-open)."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probes = 0
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+                self._probes += 1
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+# One breaker per provider/model label, shared by every router in the process
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def breaker_for(provider, **settings):
+    """Return the shared CircuitBreaker for a provider's label, creating it on first use."""
+    with _breakers_lock:
+        if provider.label not in _breakers:
+            _breakers[provider.label] = CircuitBreaker(**settings)
+        return _breakers[provider.label]
+
+class FailoverRouter:
+    """
+    Sends each prompt to the first provider in `providers` whose circuit is not open and
+    falls through to the next one on error, so an outage routes traffic to the fallback
+    instead of failing every row.
+    """
+
+    def __init__(self, providers, failure_threshold=5, reset_timeout=30.0):
+        self.providers = list(providers)
+        self.breakers = [breaker_for(provider, failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+                         for provider in self.providers]
+        self._lock = threading.Lock()
+        self.served = {provider.label: 0 for provider in self.providers}
+        self.rejected = 0
+
+    def complete(self, prompt, routing=None, **options):
+        """
+        Args:
+            routing (callable, optional): provider -> (model, call options) for that provider
+                (e.g. from model_routing.route); without it every provider gets `options`
+
+        Returns:
+            tuple: (response text, "provider:model" that served it)
+
+        Raises ProvidersUnavailableError if no provider could answer.
+        """
+        last_error = None
+        for provider, breaker in zip(self.providers, self.breakers):
+            if not breaker.allow_request():
+                continue
+            model, provider_options = _routed(provider, routing, options)
+            try:
+                text = provider.complete(prompt, model=model, **provider_options)
+            except Exception as e:
+                breaker.record_failure()
+                last_error = e
+                continue
+            breaker.record_success()
+            with self._lock:
+                self.served[provider.label] += 1
+            return text, f"{provider.name}:{model}"
+        with self._lock:
+            self.rejected += 1
+        raise ProvidersUnavailableError(f"No provider available (last error: {last_error})")
+
+    def summary(self):
+        """One-line report of rows served per provider and current circuit states."""
+        states = {provider.label: breaker.state for provider, breaker in zip(self.providers, self.breakers)}
+        return f"Served: {self.served}; unavailable: {self.rejected}; circuits: {states}"
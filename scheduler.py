@@ -0,0 +1,241 @@
+import os
+import time
+import bisect
+import threading
+import concurrent.futures
+from collections import deque
+
+# Requests and tokens per minute allowed for the API project, per model
+RATE_LIMITS = {
+    "o3-mini": {"rpm": 5000, "tpm": 4000000},
+    "gpt-4o": {"rpm": 5000, "tpm": 800000},
+    "gpt-4o-mini": {"rpm": 5000, "tpm": 4000000},
+    "gemini-2.0-flash": {"rpm": 2000, "tpm": 4000000},
+    "gemini-2.0-flash-lite": {"rpm": 4000, "tpm": 4000000},
+}
+WINDOW_SECONDS = 60.0
+# Tokens added to every call for the question / instructions sent with the document
+PROMPT_TOKENS = 1000
+# Without a corpus catalog, document size is estimated from the PDF's size on disk
+PDF_BYTES_PER_TOKEN = 40
+
+class RateBudget:
+    """
+    Sliding one-minute window of requests and tokens spent against RPM and TPM limits
+    (None means unlimited). Thread-safe.
+    """
+
+    def __init__(self, rpm=None, tpm=None, window=WINDOW_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._spent = deque()  # (time, requests, tokens)
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._spent and self._spent[0][0] <= now - self.window:
+            self._spent.popleft()
+
+    def _fit(self, requests, tokens):
+        # A request larger than the whole limit can still run, alone in an empty window
+        requests = min(requests, self.rpm) if self.rpm else requests
+        tokens = min(tokens, self.tpm) if self.tpm else tokens
+        return requests, tokens
+
+    def headroom(self, now=None):
+        """(requests, tokens) that can be spent right now."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._expire(now)
+            used_requests = sum(entry[1] for entry in self._spent)
+            used_tokens = sum(entry[2] for entry in self._spent)
+        return ((self.rpm - used_requests) if self.rpm else float("inf"),
+                (self.tpm - used_tokens) if self.tpm else float("inf"))
+
+    def plan(self, requests, tokens, now=None):
+        """
+        When a request of this size fits, and what is left over at that moment.
+
+        Returns:
+            tuple: (seconds until it fits, request slack, token slack). The slack is what smaller
+                requests can spend now without delaying this one.
+        """
+        now = time.monotonic() if now is None else now
+        requests, tokens = self._fit(requests, tokens)
+        free_requests, free_tokens = self.headroom(now)
+        with self._lock:
+            spent = list(self._spent)
+        delay = 0.0
+        for spent_at, spent_requests, spent_tokens in spent:
+            if free_requests >= requests and free_tokens >= tokens:
+                break
+            # Capacity comes back as spending drops out of the window
+            delay = spent_at + self.window - now
+            free_requests += spent_requests
+            free_tokens += spent_tokens
+        return max(delay, 0.0), free_requests - requests, free_tokens - tokens
+
+    def spend(self, requests, tokens, now=None):
+        requests, tokens = self._fit(requests, tokens)
+        with self._lock:
+            self._spent.append((time.monotonic() if now is None else now, requests, tokens))
+
+    def acquire(self, requests, tokens):
+        """Blocks until the request fits the budget, then spends it."""
+        while True:
+            delay, _, _ = self.plan(requests, tokens)
+            if delay <= 0:
+                self.spend(requests, tokens)
+                return
+            time.sleep(delay)
+
+def document_sizes(root, names):
+    """
+    Estimated tokens per document: the corpus catalog's count when the document is extracted,
+    otherwise its size on disk divided by PDF_BYTES_PER_TOKEN.
+    """
+    from catalog import CorpusCatalog, catalog_path  # the catalog is optional
+    sizes = CorpusCatalog(catalog_path(root)).sizes(names) if os.path.exists(catalog_path(root)) else {}
+    for name in names:
+        if sizes.get(name) is None:
+            try:
+                sizes[name] = os.path.getsize(os.path.join(root, name)) // PDF_BYTES_PER_TOKEN
+            except OSError:
+                sizes[name] = 0
+    return sizes
+
+class SizeScheduler:
+    """
+    Submits work items to an executor largest first, paced by RPM/TPM.
+
+    Starting the longest documents first keeps one huge PDF from finishing last. When the largest
+    waiting item does not fit the token budget yet, smaller items are submitted in its place, but
+    only up to the capacity that will still be left once the large one fits, so they fill the gap
+    without delaying it.
+
+    Any dispatcher can use it in place of submitting everything and iterating as_completed:
+
+        for pdf, future in SizeScheduler.for_model(MODEL, workers, calls_per_item=4).run(executor, fn, pdf_files, sizes):
+            ...
+
+    When model routing sends a document's calls to several models, for_routing() holds each call to
+    the limits of the model it goes to instead.
+    """
+
+    def __init__(self, workers=None, rpm=None, tpm=None, calls_per_item=1, prompt_tokens=PROMPT_TOKENS, calls=None):
+        self.workers = workers
+        self.budget = RateBudget(rpm, tpm)
+        self.calls_per_item = calls_per_item
+        self.prompt_tokens = prompt_tokens
+        # Document tokens -> {model: calls per document}; each model then has its own budget
+        self.calls = calls
+        self._budgets = {}
+        self.stats = {"submitted": 0, "backfilled": 0, "throttled_seconds": 0.0}
+
+    @classmethod
+    def for_model(cls, model, workers=None, calls_per_item=1, prompt_tokens=PROMPT_TOKENS):
+        """A scheduler held to the model's RATE_LIMITS (unlimited for an unknown model)."""
+        limits = RATE_LIMITS.get(model, {})
+        return cls(workers, limits.get("rpm"), limits.get("tpm"), calls_per_item, prompt_tokens)
+
+    @classmethod
+    def for_routing(cls, calls, workers=None, prompt_tokens=PROMPT_TOKENS):
+        """
+        A scheduler that holds every call to the RATE_LIMITS of the model it is routed to.
+
+        Args:
+            calls (callable): document tokens -> {model: calls per document} (model_routing.routed_calls)
+        """
+        return cls(workers, prompt_tokens=prompt_tokens, calls=calls)
+
+    def cost(self, size, calls=None):
+        """(requests, tokens) one work item spends: every call sends the document plus its prompt."""
+        calls = self.calls_per_item if calls is None else calls
+        return calls, calls * ((size or 0) + self.prompt_tokens)
+
+    def _costs(self, size):
+        """[(budget, requests, tokens)] one work item spends, per model budget it calls."""
+        if self.calls is None:
+            return [(self.budget, *self.cost(size))]
+        costs = []
+        for model, calls in self.calls(size or 0).items():
+            if model not in self._budgets:
+                limits = RATE_LIMITS.get(model, {})
+                self._budgets[model] = RateBudget(limits.get("rpm"), limits.get("tpm"))
+            costs.append((self._budgets[model], *self.cost(size, calls)))
+        return costs
+
+    def _next(self, negated_sizes):
+        """
+        Picks the next item from the waiting sizes (negated, so ascending means largest first).
+
+        Returns:
+            tuple: (index of the item to submit now or None, seconds until the largest one fits)
+        """
+        # What every budget can spend now without delaying the largest item: its headroom, and for the
+        # budgets the largest item needs, the slack left once it fits
+        allowed, delay = {}, 0.0
+        for budget, requests, tokens in self._costs(-negated_sizes[0]):
+            budget_delay, request_slack, token_slack = budget.plan(requests, tokens)
+            free_requests, free_tokens = budget.headroom()
+            allowed[budget] = (min(free_requests, request_slack), min(free_tokens, token_slack))
+            delay = max(delay, budget_delay)
+        if delay <= 0:
+            return 0, 0.0
+        def fits(budget, requests, tokens):
+            free_requests, free_tokens = allowed[budget] if budget in allowed else budget.headroom()
+            return requests <= free_requests and tokens <= free_tokens
+
+        # Backfill: the largest item that fits now; none larger than the most generous allowance can
+        per_call = self.calls_per_item if self.calls is None else 1
+        limit = max(tokens for _, tokens in allowed.values()) / per_call - self.prompt_tokens
+        for index in range(bisect.bisect_left(negated_sizes, -limit), len(negated_sizes)):
+            if all(fits(*cost) for cost in self._costs(-negated_sizes[index])):
+                return index, 0.0
+            if self.calls is None:
+                break  # one budget: every smaller item needs the same requests, so none fits either
+        return None, delay
+
+    def run(self, executor, fn, items, sizes):
+        """
+        Submits fn(item) for every item and yields (item, future) as they complete.
+
+        Args:
+            executor: The dispatcher's executor
+            fn (callable): Called with one item
+            items (list): Work items (document names)
+            sizes (dict): item -> estimated tokens (document_sizes())
+        """
+        waiting = sorted(items, key=lambda item: sizes.get(item) or 0, reverse=True)
+        negated_sizes = [-(sizes.get(item) or 0) for item in waiting]
+        running = {}
+        while waiting or running:
+            delay = None
+            while waiting and (self.workers is None or len(running) < self.workers):
+                index, delay = self._next(negated_sizes)
+                if index is None:
+                    break
+                item, size = waiting.pop(index), -negated_sizes.pop(index)
+                for budget, requests, tokens in self._costs(size):
+                    budget.spend(requests, tokens)
+                running[executor.submit(fn, item)] = item
+                self.stats["submitted"] += 1
+                if index:
+                    self.stats["backfilled"] += 1
+                delay = None
+            if running:
+                started = time.monotonic()
+                done, _ = concurrent.futures.wait(running, timeout=delay, return_when=concurrent.futures.FIRST_COMPLETED)
+                if not done:
+                    self.stats["throttled_seconds"] += time.monotonic() - started
+                for future in done:
+                    yield running.pop(future), future
+            elif delay:
+                # Nothing in flight and nothing fits yet: wait for the window to free capacity
+                time.sleep(delay)
+                self.stats["throttled_seconds"] += delay
+
+    def summary(self):
+        stats = self.stats
+        return (f"Scheduler: {stats['submitted']} submitted largest first, {stats['backfilled']} backfilled around "
+                f"rate limits, {stats['throttled_seconds']:.0f} s waiting for the RPM/TPM window")
@@ -0,0 +1,138 @@
+import re
+import zlib
+import numpy as np
+import pandas as pd
+from percent_schema import PERCENT_CATEGORIES, normalize_percent_matrix
+
+# Category definitions from the percentoutput* prompt, followed by seed terms that commonly signal
+# each topic in the RFI comments. "Other" has no definition: it receives every unmatched sentence.
+CATEGORY_DEFINITIONS = {
+    'Testing': "Model Security and Vulnerability Testing: red teaming, adversarial testing, vulnerability "
+               "evaluation, model security, jailbreak, robustness, benchmark, evaluation, audit, safety testing, "
+               "dual-use foundation model, cybersecurity of models, penetration testing, misuse",
+    'Privacy': "Data Privacy and Protection Mechanisms: Concerns about AI's impact on personal privacy, the "
+               "effectiveness of data protection strategies, and alternatives for securing sensitive data. "
+               "personal data, privacy-enhancing technologies, encryption, consent, surveillance, data minimization, "
+               "differential privacy, biometric, confidentiality",
+    'Governance': "AI Governance Frameworks: AI governance, risk classification, and regulatory oversight. "
+                  "regulation, regulator, oversight, risk management framework, accountability, compliance, "
+                  "liability, licensing, agency, rulemaking, enforcement, transparency, open weights, policy",
+    'Auth': "Content Authenticity: Deepfake Detection, and Digital Provenance Advocacy: Strategies for verifying "
+            "AI-generated content, tracking content origins, and mitigating misinformation risks. watermark, "
+            "watermarking, provenance, deepfake, synthetic content, labeling, disinformation, misinformation, "
+            "content credentials, C2PA, detection",
+    'Global': "Global Standards and International Cooperation: align with global standards while balancing national "
+              "security interests, geopolitical dynamics, and equitable participation among global stakeholders. "
+              "international, allies, China, export controls, standards bodies, ISO, OECD, G7, treaty, foreign",
+    'Labor': "Industry, Labor, and Intellectual Property: AI disrupting labor markets, creative industries, and "
+             "intellectual property rights. workers, jobs, employment, workforce, wages, copyright, artists, "
+             "musicians, authors, creators, licensing of works, training data, fair use, patents",
+    'Ethics': "Ethical Development and Societal Impact: AI's societal implications, including fairness, bias, and "
+              "ethical design principles. discrimination, civil rights, equity, harms, marginalized communities, "
+              "human rights, responsible AI, trustworthy, values, justice",
+    'Energy': "Energy and Environmental Sustainability: long-term impact on natural resources, ecosystems, and energy "
+              "consumption. electricity, power grid, carbon, emissions, climate, water usage, data centers, "
+              "sustainability, renewable, environmental footprint",
+}
+NAMED_CATEGORIES = [category for category in PERCENT_CATEGORIES if category != 'Other']
+
+TOKEN_RE = re.compile(r"[a-z][a-z0-9\-]+")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+STOPWORDS = frozenset(
+    "the and for that with this are from have has was were will would should could can may our their its "
+    "into about such which these those they them than then there other also not but all any more most been "
+    "being between including ai artificial intelligence".split()
+)
+N_FEATURES = 2 ** 18
+
+def tokenize(text):
+    """Lower-case word tokens minus stopwords."""
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+def hashed_features(tokens):
+    """Stable hashed unigram + bigram feature ids (crc32, so ids are identical across processes)."""
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return np.fromiter((zlib.crc32(gram.encode()) % N_FEATURES for gram in grams), dtype=np.int64, count=len(grams))
+
+class TopicPrefilter:
+    """
+    CPU-only topic estimator for the % content stage.
+
+    Each category definition becomes a TF-IDF weighted hashed feature vector. A document is split
+    into sentences and every sentence is scored against all categories in one matrix operation;
+    each sentence's words go to its best category (or to Other if nothing matches). A document is
+    "confident" when it is short and one topic clearly dominates, in which case the model call can
+    be skipped.
+    """
+
+    def __init__(self, definitions=None, max_words=600, dominance=0.85, min_hits=3, min_sentence_score=0.08):
+        self.max_words = max_words
+        self.dominance = dominance
+        self.min_hits = min_hits
+        self.min_sentence_score = min_sentence_score
+        definitions = definitions or CATEGORY_DEFINITIONS
+
+        # Term frequencies per category, then IDF across the eight definitions
+        counts = np.zeros((len(NAMED_CATEGORIES), N_FEATURES), dtype=np.float32)
+        for row, category in enumerate(NAMED_CATEGORIES):
+            np.add.at(counts[row], hashed_features(tokenize(definitions[category])), 1.0)
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(NAMED_CATEGORIES)) / (1 + document_frequency)) + 1.0
+        weights = np.where(counts > 0, (1.0 + np.log(np.maximum(counts, 1.0))) * idf, 0.0).astype(np.float32)
+        self.weights = weights / np.linalg.norm(weights, axis=1, keepdims=True)
+
+    def classify(self, text):
+        """
+        Returns:
+            tuple: (list of nine whole-number percentages in PERCENT_CATEGORIES order, confident flag)
+        """
+        sentences = [sentence for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+        token_lists = [tokenize(sentence) for sentence in sentences]
+        word_counts = np.array([len(tokens) for tokens in token_lists], dtype=float)
+        total_words = word_counts.sum()
+        if total_words == 0:
+            return [0] * (len(PERCENT_CATEGORIES) - 1) + [100], False
+
+        # Score every (sentence, category) pair at once: gather feature weights, then sum per sentence
+        feature_ids = [hashed_features(tokens) for tokens in token_lists]
+        sentence_index = np.repeat(np.arange(len(sentences)), [len(ids) for ids in feature_ids])
+        all_ids = np.concatenate(feature_ids) if feature_ids else np.empty(0, dtype=np.int64)
+        gathered = self.weights[:, all_ids]
+        scores = np.stack([np.bincount(sentence_index, weights=gathered[row], minlength=len(sentences))
+                           for row in range(len(NAMED_CATEGORIES))], axis=1)
+        hits = int((gathered.max(axis=0) > 0).sum()) if all_ids.size else 0
+
+        # Each sentence's words go to its best category; weak matches count as Other
+        best = scores.argmax(axis=1)
+        matched = scores.max(axis=1) >= self.min_sentence_score
+        shares = np.zeros(len(PERCENT_CATEGORIES))
+        np.add.at(shares, best[matched], word_counts[matched])
+        shares[-1] += word_counts[~matched].sum()
+
+        percentages, _ = normalize_percent_matrix(shares[None, :])
+        confident = (total_words <= self.max_words and hits >= self.min_hits
+                     and shares[:-1].max() / total_words >= self.dominance)
+        return percentages[0].tolist(), bool(confident)
+
+def calibration_report(df):
+    """
+    Compares local estimates with model answers on the calibration sample.
+
+    Parameters:
+        df (pd.DataFrame): Rows with model columns (PERCENT_CATEGORIES) and local columns (Local_<category>).
+
+    Returns:
+        pd.DataFrame: Per-category mean absolute error plus overall top-topic agreement and distribution overlap.
+    """
+    local_columns = [f"Local_{category}" for category in PERCENT_CATEGORIES]
+    df = df.dropna(subset=PERCENT_CATEGORIES + local_columns)
+    model = df[PERCENT_CATEGORIES].to_numpy(dtype=float)
+    local = df[local_columns].to_numpy(dtype=float)
+    if not len(df):
+        return pd.DataFrame(columns=["Metric", "Value"])
+    rows = [{"Metric": f"MAE {category}", "Value": round(float(error), 2)}
+            for category, error in zip(PERCENT_CATEGORIES, np.abs(model - local).mean(axis=0))]
+    rows.append({"Metric": "Top topic agreement", "Value": round(float((model.argmax(1) == local.argmax(1)).mean()), 3)})
+    rows.append({"Metric": "Mean distribution overlap", "Value": round(float((100 - np.abs(model - local).sum(1) / 2).mean()), 2)})
+    rows.append({"Metric": "Documents", "Value": len(df)})
+    return pd.DataFrame(rows)
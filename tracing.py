@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import threading
+import inspect
+import functools
+import tracemalloc
+from contextlib import contextmanager
+from collections import defaultdict
+from packing import estimate_tokens
+
+# Profiling is off unless a script is started with --profile (or enable() is called)
+_enabled = False
+_memory = False
+_events = []
+_events_lock = threading.Lock()
+_phase_memory_peak = defaultdict(int)
+# Peak traced memory seen so far by each open span (reset_peak() is process-wide, so every reset
+# first folds the current peak into the spans still running)
+_open_peaks = {}
+_context = threading.local()
+_start = time.perf_counter()
+
+def enable(memory=False):
+    """Start recording spans; with memory=True also track allocations with tracemalloc."""
+    global _enabled, _memory
+    _enabled = True
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def is_enabled():
+    return _enabled
+
+def profile_from_argv(argv=None):
+    """
+    Turn profiling on if --profile (or --profile-memory) is on the command line. The flags are
+    removed from sys.argv so scripts that parse their own flags (e.g. absl) never see them.
+    """
+    argv = sys.argv if argv is None else argv
+    memory = "--profile-memory" in argv
+    requested = memory or "--profile" in argv
+    argv[:] = [arg for arg in argv if arg not in ("--profile", "--profile-memory")]
+    if requested:
+        enable(memory=memory)
+    return requested
+
+@contextmanager
+def span(name, **args):
+    """
+    Record one timed phase. Yields a dict that the caller may add arguments to (sizes, token counts).
+    Spans inherit the current document name from an enclosing document span.
+    """
+    if not _enabled:
+        yield {}
+        return
+    args = dict(args)
+    if "document" not in args and getattr(_context, "document", None):
+        args["document"] = _context.document
+    if _memory:
+        with _events_lock:
+            peak = tracemalloc.get_traced_memory()[1]
+            for key in _open_peaks:
+                _open_peaks[key] = max(_open_peaks[key], peak)
+            tracemalloc.reset_peak()
+            _open_peaks[id(args)] = 0
+    started = time.perf_counter()
+    try:
+        yield args
+    finally:
+        ended = time.perf_counter()
+        if _memory:
+            with _events_lock:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(_open_peaks.pop(id(args), 0), peak)
+                _phase_memory_peak[name] = max(_phase_memory_peak[name], peak)
+            args["traced_kb"] = current // 1024
+            args["peak_kb"] = peak // 1024
+        event = {
+            "name": name, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+            "ts": round((started - _start) * 1e6), "dur": round((ended - started) * 1e6), "args": args,
+        }
+        with _events_lock:
+            _events.append(event)
+
+def traced(name, document=False, text_args=()):
+    """
+    Decorator that wraps a function in a span.
+
+    The arguments named in text_args (the prompt text, e.g. ("text", "question")) are counted as
+    input tokens, and a string result as output size; other arguments such as API keys, model names
+    and paths are not. With document=True the first argument (the file name relative to the corpus
+    root, e.g. "<docket>/<file>.pdf", or a path) becomes the document that nested spans (extraction,
+    model calls, parsing) are attributed to, so same-named comments in different dockets stay apart.
+    """
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            previous = getattr(_context, "document", None)
+            if document and args and isinstance(args[0], str):
+                _context.document = args[0]
+            try:
+                with span(name) as span_args:
+                    if text_args:
+                        arguments = signature.bind_partial(*args, **kwargs).arguments
+                        span_args["input_tokens"] = sum(estimate_tokens(arguments[arg]) for arg in text_args
+                                                        if isinstance(arguments.get(arg), str))
+                    result = function(*args, **kwargs)
+                    if isinstance(result, str):
+                        span_args["output_chars"] = len(result)
+                        span_args["output_tokens"] = estimate_tokens(result)
+                    return result
+            finally:
+                _context.document = previous
+        return wrapper
+    return decorator
+
+def write_chrome_trace(path):
+    """Write all spans as a Chrome trace / Perfetto JSON file (open in chrome://tracing or ui.perfetto.dev)."""
+    with _events_lock:
+        events = list(_events)
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
+
+def report(top_n=10):
+    """
+    Summarize the recorded spans.
+
+    Returns:
+        str: Total/mean time per phase, the top-N slowest documents, and peak traced memory per phase.
+    """
+    with _events_lock:
+        events = list(_events)
+    phases = defaultdict(list)
+    documents = defaultdict(float)
+    for event in events:
+        phases[event["name"]].append(event["dur"] / 1e6)
+        if "document" in event["args"] and event["name"] != "process_pdf":
+            documents[event["args"]["document"]] += event["dur"] / 1e6
+
+    lines = ["Phase                      calls     total s    mean s     max s"]
+    for name, durations in sorted(phases.items(), key=lambda item: -sum(item[1])):
+        lines.append(f"{name:<25} {len(durations):>6} {sum(durations):>11.2f} {sum(durations) / len(durations):>9.3f} {max(durations):>9.3f}")
+    lines.append(f"\nTop {top_n} slowest documents (extraction + model + parse seconds):")
+    for name, seconds in sorted(documents.items(), key=lambda item: -item[1])[:top_n]:
+        lines.append(f"  {seconds:8.2f}  {name}")
+    if _memory:
+        lines.append("\nPeak traced memory observed at the end of each phase:")
+        for name, peak in sorted(_phase_memory_peak.items(), key=lambda item: -item[1]):
+            lines.append(f"  {peak / 1024 / 1024:8.1f} MB  {name}")
+        snapshot = tracemalloc.take_snapshot()
+        lines.append("\nTop allocation sites:")
+        for statistic in snapshot.statistics("lineno")[:5]:
+            lines.append(f"  {statistic}")
+    return "\n".join(lines)
+
+def finish(output_dir=".", top_n=10):
+    """Write the trace file and print the report; does nothing when profiling is off."""
+    if not _enabled:
+        return None
+    script = os.path.splitext(os.path.basename(sys.argv[0] or "run"))[0]
+    path = os.path.join(output_dir, f"trace_{script}_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    write_chrome_trace(path)
+    print(report(top_n))
+    print(f"Trace written to {path}")
+    return path
@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+# Default lease: a job whose worker stops heartbeating for this long is handed to another worker
+LEASE_SECONDS = 300
+# Jobs that fail this many times are marked failed instead of being retried
+MAX_ATTEMPTS = 3
+
+STATUS_PENDING = "pending"
+STATUS_LEASED = "leased"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,
+    item TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    result TEXT,
+    committed_by TEXT,
+    committed_at REAL,
+    UNIQUE (stage, item)
+);
+CREATE INDEX IF NOT EXISTS jobs_lease ON jobs (stage, status, lease_expires);
+"""
+
+def worker_id():
+    """Host, process and thread of the caller, e.g. "box2:4120:139912"."""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+class WorkQueue:
+    """
+    SQLite-backed job queue shared by any number of worker processes on any number of hosts.
+
+    Each job is one (stage, document) pair. Workers lease jobs for a limited time and extend the
+    lease with heartbeats while they work; a lease that expires (crashed or stalled worker) makes
+    the job available again. Result commits are idempotent: the first commit for a job is kept and
+    later ones are ignored, and only the worker holding the job's current lease can commit, so a worker
+    whose lease expired cannot overwrite the result of the worker that took the job over.
+
+    For several hosts, put the database on a shared filesystem with working POSIX locks and keep
+    wal=False (WAL mode needs shared memory, so it only works for workers on one host).
+    """
+
+    def __init__(self, path, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, wal=False):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.wal = wal
+        self._local = threading.local()
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            if self.wal:
+                connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _connect(self):
+        return _Transaction(self._connection())
+
+    def enqueue(self, stage, directory, items):
+        """
+        Adds one job per document; documents already queued for the stage are left untouched.
+
+        Returns:
+            int: Number of new jobs.
+        """
+        directory = os.path.abspath(directory)
+        with self._connect() as connection:
+            before = connection.total_changes
+            connection.executemany("INSERT OR IGNORE INTO jobs (stage, item, directory) VALUES (?, ?, ?)",
+                                   [(stage, item, directory) for item in items])
+            return connection.total_changes - before
+
+    def lease(self, stage, owner=None, count=1):
+        """
+        Leases up to `count` pending or expired jobs for a stage.
+
+        Returns:
+            list: Dicts with id, item, directory, attempts and lease_token (empty when nothing is left).
+        """
+        owner = owner or worker_id()
+        now = time.time()
+        with self._connect() as connection:
+            # Jobs whose last allowed attempt stalled are given up on rather than leased forever
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'lease expired on the last attempt', lease_token = NULL "
+                "WHERE stage = ? AND status = ? AND lease_expires < ? AND attempts >= ?",
+                (STATUS_FAILED, stage, STATUS_LEASED, now, self.max_attempts),
+            )
+            # Jobs left pending by a run with a higher max_attempts can never be leased under this one
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = 'no attempts left under max_attempts' "
+                "WHERE stage = ? AND status = ? AND attempts >= ?",
+                (STATUS_FAILED, stage, STATUS_PENDING, self.max_attempts),
+            )
+            rows = connection.execute(
+                "SELECT id, item, directory, attempts FROM jobs WHERE stage = ? AND attempts < ? "
+                "AND (status = ? OR (status = ? AND lease_expires < ?)) ORDER BY id LIMIT ?",
+                (stage, self.max_attempts, STATUS_PENDING, STATUS_LEASED, now, count),
+            ).fetchall()
+            jobs = []
+            for row in rows:
+                token = uuid.uuid4().hex
+                connection.execute(
+                    "UPDATE jobs SET status = ?, lease_owner = ?, lease_token = ?, lease_expires = ?, "
+                    "attempts = attempts + 1 WHERE id = ?",
+                    (STATUS_LEASED, owner, token, now + self.lease_seconds, row["id"]),
+                )
+                jobs.append({"id": row["id"], "item": row["item"], "directory": row["directory"],
+                             "attempts": row["attempts"] + 1, "lease_token": token})
+            return jobs
+
+    def heartbeat(self, job_id, lease_token):
+        """
+        Extends a lease. Returns False if the lease was lost (expired and taken by another worker).
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_token = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, lease_token, STATUS_LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def commit(self, job_id, lease_token, result, owner=None):
+        """
+        Stores a job's result. Returns False (and changes nothing) if the job already has a committed
+        result or the lease_token is no longer the job's (the lease expired and another worker took it).
+        """
+        with self._connect() as connection:
+            cursor = connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, committed_by = ?, committed_at = ?, lease_token = NULL, "
+                "error = NULL WHERE id = ? AND lease_token = ? AND status = ?",
+                (STATUS_DONE, json.dumps(result, default=str), owner or worker_id(), time.time(), job_id, lease_token,
+                 STATUS_LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def fail(self, job_id, lease_token, error):
+        """Returns a job to the queue after an error, or marks it failed once attempts run out."""
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN ? ELSE ? END, error = ?, lease_token = NULL "
+                "WHERE id = ? AND lease_token = ? AND status = ?",
+                (self.max_attempts, STATUS_FAILED, STATUS_PENDING, str(error), job_id, lease_token, STATUS_LEASED),
+            )
+
+    def counts(self, stage=None):
+        """
+        Returns:
+            dict: Job count per status (optionally for one stage).
+        """
+        query = "SELECT status, COUNT(*) AS n FROM jobs" + (" WHERE stage = ?" if stage else "") + " GROUP BY status"
+        with self._connect() as connection:
+            return {row["status"]: row["n"] for row in connection.execute(query, (stage,) if stage else ())}
+
+    def results(self, stage):
+        """
+        Returns:
+            list: Committed result rows for a stage, in document order.
+        """
+        with self._connect() as connection:
+            rows = connection.execute("SELECT result FROM jobs WHERE stage = ? AND status = ? ORDER BY item",
+                                      (stage, STATUS_DONE)).fetchall()
+        return [json.loads(row["result"]) for row in rows]
+
+class _Transaction:
+    """Runs a block in one IMMEDIATE transaction so concurrent workers never lease the same job."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False